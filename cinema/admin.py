@@ -1,9 +1,15 @@
-from django.contrib import admin
+import logging
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.http import StreamingHttpResponse
 from django.utils.html import format_html
 from django.urls import reverse
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 
-from . import models
+from . import analytics, models, pdf
+
+logger = logging.getLogger(__name__)
 
 
 # ──────────────────────────── INLINE ────────────────────────────
@@ -43,11 +49,21 @@ class MovieAdmin(admin.ModelAdmin):
     def poster_preview(self, obj):
         if obj.poster:
             return format_html(
-                '<img src="{}" style="height:60px;" />', obj.poster.url
+                '<img src="{}" style="height:60px;" loading="lazy" />',
+                obj.poster_variant_url('thumb')
             )
         return "—"
 
 
+@admin.register(models.TrailerUpload)
+class TrailerUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'movie', 'offset', 'size', 'status',
+                    'updated_at')
+    list_filter = ('status',)
+    raw_id_fields = ('movie', 'created_by')
+    readonly_fields = ('offset', 'sha256', 'size')
+
+
 # ───────────────── Справочники ─────────────────
 @admin.register(models.Genre)
 class GenreAdmin(admin.ModelAdmin):
@@ -100,10 +116,25 @@ class UserAdmin(DjangoUserAdmin):
 # ─────────────────── Review ───────────────────
 @admin.register(models.Review)
 class ReviewAdmin(admin.ModelAdmin):
-    list_display = ('movie', 'user', 'rating', 'created_at')
-    list_filter = ('rating', 'created_at')
+    list_display = ('movie', 'user', 'rating', 'is_approved', 'created_at')
+    list_filter = ('is_approved', 'rating', 'created_at')
     autocomplete_fields = ('movie', 'user')
     search_fields = ('review_text',)
+    actions = ['approve_selected', 'reject_selected']
+
+    @admin.action(description='Одобрить выбранные отзывы')
+    def approve_selected(self, request, queryset):
+        self.message_user(request, f'Одобрено отзывов: {queryset.approve()}')
+
+    @admin.action(description='Отклонить (удалить) выбранные отзывы')
+    def reject_selected(self, request, queryset):
+        self.message_user(request, f'Отклонено отзывов: {queryset.reject()}')
+
+    def delete_model(self, request, obj):
+        models.Review.objects.filter(pk=obj.pk).reject()
+
+    def delete_queryset(self, request, queryset):
+        queryset.reject()
 
 
 # ─────────────────── Session ──────────────────
@@ -129,11 +160,62 @@ class TicketAdmin(admin.ModelAdmin):
     list_filter = ('status',)
     autocomplete_fields = ('session', 'seat', 'user')
 
-    actions = ['mark_as_cancelled']                      # admin-action
+    actions = ['mark_as_cancelled', 'export_pdf_zip']    # admin-actions
 
     @admin.action(description='Отменить выбранные билеты')
     def mark_as_cancelled(self, request, queryset):
+        session_ids = set(queryset.values_list('session_id', flat=True))
         updated = queryset.update(status=models.Ticket.Status.CANCELLED)
+        analytics.refresh_sessions(session_ids)    # update() без сигналов
         self.message_user(
             request, f'Отменено билетов: {updated}'
         )
+
+    @admin.action(description='Скачать PDF выбранных билетов (ZIP)')
+    def export_pdf_zip(self, request, queryset):
+        total = queryset.count()
+        limit = settings.PDF_ADMIN_EXPORT_LIMIT
+        if total > limit:
+            # рендер идёт прямо в запросе — большие выборки не для админки
+            self.message_user(
+                request,
+                f'Выбрано {total} билетов, из админки можно не больше '
+                f'{limit}. Используйте manage.py export_ticket_pdfs.',
+                messages.ERROR,
+            )
+            return None
+
+        def progress(done):
+            if done % 100 == 0 or done == total:
+                logger.info('Выгрузка PDF для %s: %d/%d',
+                            request.user, done, total)
+
+        files = pdf.render_ticket_pdfs(pdf.export_queryset(queryset),
+                                       progress=progress)
+        response = StreamingHttpResponse(pdf.stream_zip(files),
+                                         content_type='application/zip')
+        response['Content-Disposition'] = \
+            'attachment; filename="tickets.zip"'
+        return response
+
+
+# ─────────────── Аналитика продаж ───────────────
+@admin.register(models.SalesRollup)
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'scope', 'object_id', 'tickets_sold',
+                    'tickets_cancelled', 'revenue', 'occupancy_display')
+    list_filter = ('scope',)
+    search_fields = ('=object_id',)
+    date_hierarchy = 'day'
+    show_full_result_count = False
+
+    @admin.display(description='заполняемость')
+    def occupancy_display(self, obj):
+        return f'{obj.occupancy:.0%}'
+
+    # свёртки пишутся только из cinema.analytics
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,198 @@
+"""
+Свёртки продаж: дневные агрегаты по фильмам, сеансам, залам и кинотеатрам.
+
+День свёртки — дата начала сеанса по локальному времени. При записи
+билета пересчитываются только строки его сеанса и его фильма, зала и
+кинотеатра за этот день, и пишутся upsert'ом; отчёты за любые периоды
+читают только SalesRollup.
+
+Подсчёт и запись идут в одной транзакции, а сеансы дня перед подсчётом
+блокируются (select_for_update; в SQLite транзакция и так берёт
+блокировку записи сразу) — параллельные пересчёты одного дня идут по
+очереди, и более старые итоги не перезапишут новые.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import SalesRollup, Session, Ticket
+
+Scope = SalesRollup.Scope
+
+
+def day_bounds(start_day, end_day=None):
+    """Границы [start_day, end_day) в aware-datetime (end_day по умолч. +1)."""
+    end_day = end_day or start_day + datetime.timedelta(days=1)
+    return (
+        timezone.make_aware(datetime.datetime.combine(start_day,
+                                                      datetime.time.min)),
+        timezone.make_aware(datetime.datetime.combine(end_day,
+                                                      datetime.time.min)),
+    )
+
+
+def _sessions(start, end, where=Q()):
+    return Session.objects.filter(where, starts_at__gte=start,
+                                  starts_at__lt=end)
+
+
+def _lock_days(start, end):
+    # порядок по id — чтобы параллельные пересчёты не ловили взаимоблокировку
+    list(Session.objects.select_for_update()
+         .filter(starts_at__gte=start, starts_at__lt=end)
+         .order_by('id').values_list('id', flat=True))
+
+
+def _collect(start, end, where=Q()):
+    """Считает строки свёрток для сеансов из [start, end), подходящих where."""
+    sessions = _sessions(start, end, where).values(
+        'id', 'movie_id', 'hall_id', 'starts_at', 'price',
+        cinema_id=F('hall__cinema_id'),
+        capacity=F('hall__rows') * F('hall__seats_per_row'))
+    stats = {
+        row['session_id']: row
+        for row in (Ticket.objects
+                    .filter(session__in=_sessions(start, end, where)
+                            .values('id'))
+                    .values('session_id')
+                    .annotate(
+                        sold=Count('id', filter=~Q(
+                            status=Ticket.Status.CANCELLED)),
+                        cancelled=Count('id', filter=Q(
+                            status=Ticket.Status.CANCELLED)),
+                        paid=Count('id', filter=Q(
+                            status=Ticket.Status.PAID)),
+                    ))
+    }
+
+    # (scope, object_id, day) → [продано, отменено, выручка, вместимость]
+    totals = defaultdict(lambda: [0, 0, Decimal('0'), 0])
+    for s in sessions:
+        day = timezone.localdate(s['starts_at'])
+        st = stats.get(s['id'], {})
+        sold, cancelled = st.get('sold', 0), st.get('cancelled', 0)
+        revenue = s['price'] * st.get('paid', 0)
+        for scope, obj_id in _scopes(s):
+            row = totals[(scope, obj_id, day)]
+            row[0] += sold
+            row[1] += cancelled
+            row[2] += revenue
+            row[3] += s['capacity']
+    return totals
+
+
+def _scopes(session):
+    return ((Scope.SESSION, session['id']),
+            (Scope.MOVIE, session['movie_id']),
+            (Scope.HALL, session['hall_id']),
+            (Scope.CINEMA, session['cinema_id']))
+
+
+def _write(totals):
+    """Upsert строк свёрток по (scope, object_id, day)."""
+    SalesRollup.objects.bulk_create(
+        [SalesRollup(scope=scope, object_id=obj_id, day=day,
+                     tickets_sold=sold, tickets_cancelled=cancelled,
+                     revenue=revenue, capacity=capacity)
+         for (scope, obj_id, day), (sold, cancelled, revenue, capacity)
+         in totals.items()],
+        update_conflicts=True,
+        unique_fields=('scope', 'object_id', 'day'),
+        update_fields=('tickets_sold', 'tickets_cancelled', 'revenue',
+                       'capacity'),
+    )
+
+
+def rebuild(start_day, end_day=None):
+    """
+    Пересобирает свёртки за дни [start_day, end_day) одной транзакцией.
+    Возвращает число записанных строк.
+    """
+    end_day = end_day or start_day + datetime.timedelta(days=1)
+    start, end = day_bounds(start_day, end_day)
+    with transaction.atomic():
+        _lock_days(start, end)
+        totals = _collect(start, end)
+        _write(totals)
+        # строки объектов, у которых в эти дни сеансов больше нет
+        stale = [pk for pk, scope, obj_id, day in
+                 SalesRollup.objects.filter(day__gte=start_day,
+                                            day__lt=end_day)
+                 .values_list('id', 'scope', 'object_id', 'day')
+                 if (scope, obj_id, day) not in totals]
+        SalesRollup.objects.filter(id__in=stale).delete()
+    return len(totals)
+
+
+def refresh_days(days):
+    for day in sorted(set(days)):
+        rebuild(day)
+
+
+def refresh_sessions(session_ids):
+    """
+    Пересчитывает строки указанных сеансов и их фильмов, залов и
+    кинотеатров за день сеанса; остальные строки дня не трогает.
+    """
+    with transaction.atomic():
+        sessions = list(Session.objects.filter(id__in=set(session_ids))
+                        .values('id', 'movie_id', 'hall_id', 'starts_at',
+                                cinema_id=F('hall__cinema_id')))
+        by_day = defaultdict(list)
+        for s in sessions:
+            by_day[timezone.localdate(s['starts_at'])].append(s)
+        for day, group in sorted(by_day.items()):
+            start, end = day_bounds(day)
+            _lock_days(start, end)
+            keys = {key for s in group for key in _scopes(s)}
+            where = (Q(movie_id__in={s['movie_id'] for s in group})
+                     | Q(hall_id__in={s['hall_id'] for s in group})
+                     | Q(hall__cinema_id__in={s['cinema_id']
+                                              for s in group}))
+            _write({key: row for key, row in _collect(start, end,
+                                                      where).items()
+                    if key[:2] in keys})
+
+
+def _after_commit(func, *args):
+    # robust: данные уже записаны — сбой пересчёта логируется Django,
+    # а не превращается в 500; partial тут не годится — у него нет
+    # __qualname__, который robust-обработчик пишет в лог
+    def refresh():
+        func(*args)
+    transaction.on_commit(refresh, robust=True)
+
+
+def schedule_sessions(session_ids):
+    _after_commit(refresh_sessions, set(session_ids))
+
+
+def schedule_days(days):
+    _after_commit(refresh_days, set(days))
+
+
+def sales_report(scope, date_from, date_to, object_ids=None, by_day=False):
+    """
+    Агрегаты из свёрток за [date_from, date_to] включительно.
+    Строки: object_id (+ day), tickets_sold, tickets_cancelled,
+    revenue, capacity, occupancy.
+    """
+    qs = SalesRollup.objects.filter(scope=scope, day__gte=date_from,
+                                    day__lte=date_to)
+    if object_ids:
+        qs = qs.filter(object_id__in=object_ids)
+    group = ('object_id', 'day') if by_day else ('object_id',)
+    rows = (qs.values(*group)
+            .annotate(tickets_sold=Sum('tickets_sold'),
+                      tickets_cancelled=Sum('tickets_cancelled'),
+                      revenue=Sum('revenue'),
+                      capacity=Sum('capacity'))
+            .order_by(*group))
+    for row in rows:
+        row['occupancy'] = (round(row['tickets_sold'] / row['capacity'], 4)
+                            if row['capacity'] else 0.0)
+        yield row
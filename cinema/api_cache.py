@@ -0,0 +1,228 @@
+"""
+Кэш готовых ответов API для анонимных GET (CachedResponseMixin).
+
+Ключ — путь, нормализованный query string (параметры по алфавиту,
+пустые отброшены), Accept и версии данных моделей из cache_models.
+Версия модели — случайная метка в кэше; её меняет bump(): сигналы
+post_save/post_delete/m2m_changed моделей, от которых зависит хоть
+одно представление (watched), и явные вызовы там, где сигналов нет
+(bulk_create, update()) — всегда после самой записи. Метка меняется
+сразу и ещё раз после коммита — ответ, собранный посреди транзакции,
+под новой версией не задержится.
+
+Кэшируются только анонимные запросы: с заголовком Authorization или
+вошедшим пользователем ответ собирается заново и в кэш не попадает —
+is_favorite и прочее личное не протекает. Тело хранится уже
+отрендеренным, от API_CACHE_GZIP_MIN байт — сжатым gzip; клиенту без
+gzip оно распаковывается. Vary: Accept, Accept-Encoding, Cookie,
+Authorization.
+
+Давка при истечении: пересобирает тот, кто взял замок (cache.add);
+остальные отдают устаревшую копию, а если её нет — ждут до
+API_CACHE_LOCK_WAIT секунд. Для нескольких процессов нужен общий
+бэкенд кэша (CACHE_BACKEND, например Redis или Memcached).
+"""
+import gzip
+import hashlib
+import re
+import time
+import uuid
+from functools import cache, partial
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+PREFIX = 'apicache'
+VARY = ('Accept', 'Accept-Encoding', 'Cookie', 'Authorization')
+STORED_HEADERS = ('Content-Type', 'Allow')
+POLL_INTERVAL = 0.05
+
+_gzip_re = re.compile(r'\bgzip\b')
+_watched = set()                # cache_models всех CachedResponseMixin
+
+
+def _cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+# ─────────── версии данных ───────────
+def _version_key(label):
+    return f'{PREFIX}:v:{label}'
+
+
+def _set_versions(keys):
+    _cache().set_many({key: uuid.uuid4().hex[:12] for key in keys}, None)
+
+
+def bump(*models):
+    """
+    Сбросить кэш ответов, зависящих от этих моделей. В транзакции
+    метки копятся до коммита: сразу меняются только впервые
+    затронутые в ней модели, после коммита все — одним set_many.
+    Так массовый delete() с post_delete на каждую строку стоит два
+    обращения к кэшу, а не 2×N.
+    """
+    keys = {_version_key(m._meta.label_lower) for m in models}
+    conn = transaction.get_connection()
+    state = conn.__dict__.get('_api_versions')
+    # колбэк пропал из очереди — транзакция (или её точка сохранения)
+    # откатилась: копим заново; после коммита flush убирает себя сам
+    if state is None or not any(func is state[1]
+                                for _, func, _ in conn.run_on_commit):
+        pending = set()
+
+        def flush():
+            if conn.__dict__.get('_api_versions') is state:
+                del conn.__dict__['_api_versions']
+            if pending:
+                _set_versions(pending)
+        state = conn.__dict__['_api_versions'] = (pending, flush)
+        transaction.on_commit(flush, robust=True)
+    pending = state[0]
+    fresh = keys - pending
+    pending |= fresh
+    if fresh:
+        _set_versions(fresh)
+
+
+@cache
+def _load_views():
+    # представления регистрируют cache_models при импорте модуля; в
+    # management-командах URLconf сам не грузится
+    import_module(settings.ROOT_URLCONF)
+
+
+def watched(model):
+    """Зависит ли от модели хоть один кэшируемый ответ."""
+    _load_views()
+    return model in _watched
+
+
+def versions(models):
+    keys = [_version_key(m._meta.label_lower) for m in models]
+    found = _cache().get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # после вытеснения — новая метка, не прежняя: старое не вернётся
+        for key in missing:
+            _cache().add(key, uuid.uuid4().hex[:12], None)
+        found.update(_cache().get_many(missing))
+    return tuple(found.get(key) for key in keys)
+
+
+# ─────────── ключ и записи ───────────
+def request_key(request, models):
+    query = sorted((name, values) for name, values in request.GET.lists()
+                   if any(values))
+    raw = repr((request.path, query,
+                request.META.get('HTTP_ACCEPT', '').replace(' ', '').lower(),
+                versions(models), 'anon'))
+    return f'{PREFIX}:r:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def _store(key, lock, response):
+    try:
+        if response.status_code != 200 or not \
+                response.get('Content-Type', '').startswith(
+                    'application/json'):
+            return
+        body = response.content
+        compressed = len(body) >= settings.API_CACHE_GZIP_MIN
+        timeout = settings.API_CACHE_TIMEOUT
+        _cache().set(key, {
+            'body': gzip.compress(body, 6) if compressed else body,
+            'gzip': compressed,
+            'headers': {h: response[h] for h in STORED_HEADERS
+                        if h in response},
+            'fresh_until': time.time() + timeout,
+        }, timeout * 2)     # вторая половина — устаревшая копия для давки
+    finally:
+        if lock:
+            _cache().delete(lock)
+
+
+def _replay(request, entry, state):
+    body = entry['body']
+    headers = dict(entry['headers'])
+    if entry['gzip']:
+        if _gzip_re.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            body = gzip.decompress(body)
+    response = HttpResponse(body, headers=headers)
+    response['X-Cache'] = state
+    patch_vary_headers(response, VARY)
+    return response
+
+
+def _wait(key):
+    deadline = time.monotonic() + settings.API_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = _cache().get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+# ─────────── DRF ───────────
+class CachedResponseMixin:
+    """
+    Для ViewSet: cache_models — от чего зависит ответ, cache_actions —
+    какие действия кэшировать.
+    """
+    cache_models = ()
+    cache_actions = ('list', 'retrieve')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _watched.update(cls.cache_models)
+
+    def _cacheable(self, request):
+        user = getattr(request, 'user', None)
+        return (settings.API_CACHE_TIMEOUT > 0
+                and request.method in ('GET', 'HEAD')
+                and self.action_map.get(request.method.lower())
+                in self.cache_actions
+                # браузерный API — HTML, его не храним
+                and 'text/html' not in request.META.get('HTTP_ACCEPT', '')
+                and 'HTTP_AUTHORIZATION' not in request.META
+                and not (user and user.is_authenticated))
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self._cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = request_key(request, self.cache_models)
+        entry = _cache().get(key)
+        if entry is not None and entry['fresh_until'] > time.time():
+            return _replay(request, entry, 'HIT')
+
+        lock = f'{key}:lock'
+        if not _cache().add(lock, 1, settings.API_CACHE_LOCK_TIMEOUT):
+            # пересобирает другой воркер
+            if entry is not None:
+                return _replay(request, entry, 'STALE')
+            entry = _wait(key)
+            if entry is not None:
+                return _replay(request, entry, 'HIT')
+            lock = None
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            if lock:
+                _cache().delete(lock)
+            raise
+        patch_vary_headers(response, VARY)
+        response['X-Cache'] = 'MISS'
+        if hasattr(response, 'add_post_render_callback') and \
+                not response.is_rendered:
+            response.add_post_render_callback(partial(_store, key, lock))
+        else:
+            _store(key, lock, response)
+        return response
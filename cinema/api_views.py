@@ -1,21 +1,48 @@
+from collections import Counter
+
+from django.conf import settings
 from django.db.models import Avg
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, mixins, status, filters
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.decorators import (
+    action, api_view, permission_classes, throttle_classes,
+)
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Movie, Review, Favorite
-from .serializers import MovieSerializer, ReviewSerializer, UserSerializer
-from .permissions import IsAdminOrReadOnly
+from .models import (
+    Actor, Country, Favorite, Genre, Movie, MovieActor, MovieGenre, Review,
+    TrailerUpload,
+)
+from . import analytics, bulk, exports, fast_api, uploads
+from .api_cache import CachedResponseMixin
+from .serializers import (
+    MovieSerializer, ReviewSerializer, UserSerializer,
+    SalesReportQuerySerializer, SalesReportRowSerializer,
+    TrailerUploadSerializer, ReviewModerationSerializer,
+)
+from .permissions import CanExport, IsAdminOrReadOnly
 from .filters import MovieFilter
+from .throttling import CostThrottle
+from .tracing import TracedViewMixin, span
 
 User = get_user_model()
 
 
-class MovieViewSet(viewsets.ModelViewSet):
+class MovieViewSet(CachedResponseMixin, TracedViewMixin,
+                   viewsets.ModelViewSet):
+    query_budget = 8        # SQL-запросов, см. cinema.instrumentation
+    # всё, что видно в ответе: рейтинг — из отзывов, имена — справочники
+    cache_models = (Movie, MovieGenre, MovieActor, Genre, Country, Actor,
+                    Review)
     serializer_class = MovieSerializer
     permission_classes = (IsAdminOrReadOnly,)
     filterset_class = MovieFilter
@@ -26,12 +53,40 @@ class MovieViewSet(viewsets.ModelViewSet):
     )
     search_fields = ('title', 'description', 'actors__name')
     ordering_fields = ('release_date', 'computed_rating')
+    renderer_classes = (fast_api.FastJSONRenderer, BrowsableAPIRenderer)
+    throttle_scope = 'catalog'        # cinema.throttling, THROTTLE_RATES
 
     def get_queryset(self):
-        qs = (Movie.objects.with_computed_rating()
-              .select_related('country', 'main_genre')
-              .prefetch_related('genres', 'actors'))
-        return MovieFilter.annotate_queryset(qs)
+        return (Movie.objects.with_computed_rating()
+                .select_related('country', 'main_genre')
+                .prefetch_related('genres', 'actors'))
+
+    def list(self, request, *args, **kwargs):
+        # values() вместо сериализатора, тот же JSON (см. cinema.fast_api)
+        if not settings.API_FAST_LIST:
+            return super().list(request, *args, **kwargs)
+        with span('filter_queryset', kind='orm'):
+            queryset = self.filter_queryset(self.get_queryset())
+        with span('queryset', kind='orm'):
+            values = fast_api.movie_values(queryset)
+            page = self.paginate_queryset(values)
+            values = list(values if page is None else page)
+            links = fast_api.movie_links(values)
+        with span('serializer', kind='serializer', serializer='fast_api',
+                  objects=len(values)):
+            data = fast_api.movie_rows(
+                values, links, request,
+                self.get_serializer_context().get('favorite_ids'))
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def get_throttle_cost(self, request):
+        # в токенах ведра: поиск (LIKE по описанию и актёрам) и отзывы
+        # обходятся базе дороже простого списка
+        if self.action == 'list' and request.query_params.get('search'):
+            return 10
+        return 3 if self.action == 'reviews' else 1
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -41,6 +96,30 @@ class MovieViewSet(viewsets.ModelViewSet):
             ctx['favorite_ids'] = set(fav_ids)
         return ctx
 
+    @action(detail=False, methods=['post', 'patch'], query_budget=None)
+    def bulk(self, request):
+        """
+        POST  [{title, …}, …]   — создать фильмы пачкой
+        PATCH [{id, …}, …]      — обновить (только переданные поля)
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Ожидается массив фильмов.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.MOVIE_BULK_MAX_ITEMS:
+            return Response(
+                {'detail': f'Не больше {settings.MOVIE_BULK_MAX_ITEMS} '
+                           f'фильмов за запрос.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        results = bulk.write_movies(items, update=request.method == 'PATCH')
+        counts = Counter(r['status'] for r in results)
+        written = counts['created'] + counts['updated']
+        return Response(
+            {'created': counts['created'], 'updated': counts['updated'],
+             'errors': counts['error'], 'results': results},
+            status=status.HTTP_400_BAD_REQUEST if counts['error']
+            and not written else status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'])
     def reviews(self, request, pk=None):
         movie = self.get_object()
@@ -53,11 +132,17 @@ class MovieViewSet(viewsets.ModelViewSet):
             if page else Response(serializer.data)
 
 
+class ModerationQueuePagination(CursorPagination):
+    page_size = 50
+    ordering = ('-created_at', '-id')
+
+
 class ReviewViewSet(mixins.CreateModelMixin,
                     mixins.UpdateModelMixin,
                     mixins.DestroyModelMixin,
                     mixins.ListModelMixin,
                     viewsets.GenericViewSet):
+    query_budget = 8
     serializer_class = ReviewSerializer
     permission_classes = (IsAuthenticated,)
 
@@ -73,14 +158,96 @@ class ReviewViewSet(mixins.CreateModelMixin,
         return qs
 
     def perform_create(self, serializer):
+        # avg_rating пересчитают сигналы (cinema.signals)
         serializer.save(
             user=self.request.user,
             is_approved=self.request.user.is_staff  # админ = сразу одобрено
         )
 
+    def perform_destroy(self, instance):
+        Review.objects.filter(pk=instance.pk).reject()
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAdminUser],
+            pagination_class=ModerationQueuePagination)
+    def pending(self, request):
+        """Очередь модерации с курсором по created_at."""
+        qs = (Review.objects.filter(is_approved=False)
+              .select_related('movie', 'user'))
+        page = self.paginate_queryset(qs)
+        return self.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
+    @action(detail=False, methods=['post'],
+            permission_classes=[IsAdminUser])
+    def moderate(self, request):
+        """POST {ids: [...], action: approve|reject}"""
+        params = ReviewModerationSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        qs = Review.objects.filter(id__in=params.validated_data['ids'])
+        count = getattr(qs, params.validated_data['action'])()
+        return Response({'action': params.validated_data['action'],
+                         'count': count})
+
+
+class TrailerUploadViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    POST   {movie, filename, size, sha256}  — начать загрузку
+    GET    /{id}/                           — текущее смещение (докачка)
+    PATCH  /{id}/  Upload-Offset: N, тело — байты куска
+    POST   /{id}/complete/                  — сверить сумму и сохранить
+    """
+    serializer_class = TrailerUploadSerializer
+    permission_classes = (IsAdminUser,)
+    queryset = TrailerUpload.objects.all()
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    def partial_update(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': 'Нужны заголовки Upload-Offset и Content-Length.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            # тело читаем потоком, минуя парсеры DRF
+            new_offset = uploads.append_chunk(upload.pk, offset,
+                                              request.stream, length)
+        except uploads.UploadError as exc:
+            upload.refresh_from_db()
+            return Response({'detail': str(exc), 'offset': upload.offset},
+                            status=exc.status,
+                            headers={'Upload-Offset': str(upload.offset)})
+        return Response(status=status.HTTP_204_NO_CONTENT,
+                        headers={'Upload-Offset': str(new_offset)})
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            upload = uploads.complete(upload.pk)
+        except uploads.UploadError as exc:
+            return Response({'detail': str(exc)}, status=exc.status)
+        data = self.get_serializer(upload).data
+        data['trailer'] = request.build_absolute_uri(upload.movie.trailer.url)
+        return Response(data)
+
+
+class RegisterThrottle(CostThrottle):
+    scope = 'register'
+
 
 @api_view(['POST'])
 @permission_classes([])
+@throttle_classes([RegisterThrottle])
 def register(request):
     """
     POST {username, email, password}
@@ -97,3 +264,55 @@ def register(request):
     token, _ = Token.objects.get_or_create(user=user)
     return Response({'token': token.key, 'user': UserSerializer(user).data},
                     status=status.HTTP_201_CREATED)
+
+
+class SalesReportView(APIView):
+    """
+    GET ?scope=movie|session|hall|cinema&date_from=…&date_to=…
+        [&object_ids=1&object_ids=2][&by_day=true]
+    Продажи и заполняемость — только из дневных свёрток.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        params = SalesReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        rows = analytics.sales_report(**params.validated_data)
+        return Response(SalesReportRowSerializer(rows, many=True).data)
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Формат выгрузки задаёт URL, а не Accept."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ExportView(APIView):
+    """
+    GET /api/export/<movies|reviews|tickets>.<ndjson|csv>[?after=<id>]
+    Потоковая выгрузка по возрастанию id; after — продолжить после обрыва.
+    Доступ — см. CanExport: персонал и партнёры с правом на выгрузку.
+    """
+    permission_classes = (CanExport,)
+    content_negotiation_class = IgnoreClientContentNegotiation
+    throttle_scope = 'export'         # cinema.throttling, THROTTLE_RATES
+
+    def get(self, request, kind, fmt):
+        export = exports.EXPORTS.get(kind)
+        if export is None or fmt not in exports.FORMATS:
+            raise NotFound
+        after = request.query_params.get('after')
+        if after is not None:
+            if not after.isdigit():
+                raise ValidationError({'after': 'Ожидается id.'})
+            after = int(after)
+        response = StreamingHttpResponse(
+            exports.stream(export, fmt, after),
+            content_type=exports.FORMATS[fmt])
+        response['Content-Disposition'] = \
+            f'attachment; filename="{kind}.{fmt}"'
+        return response
@@ -4,3 +4,6 @@ class CinemaConfig(AppConfig):
     default_auto_field = 'django.db.models.AutoField'
     name = 'cinema'
     verbose_name = 'Киноафиша'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,115 @@
+"""
+Кэш аутентификации: токен DRF → пользователь и user_id сессии →
+пользователь, без запросов к БД в установившемся режиме.
+
+CachedTokenAuthentication хранит (пользователь, токен) под sha256 ключа
+токена, CachedModelBackend.get_user — пользователя под его id; оба —
+на AUTH_CACHE_TIMEOUT секунд. Сигналы удаления токена и
+сохранения/удаления пользователя (смена is_active, is_staff, пароля)
+вызывают forget_*, сразу и ещё раз после коммита. Массовый update() по
+пользователям сигналов не шлёт — после него нужен forget_user().
+
+Сброс мгновенный только в общем кэше: в памяти процесса он виден
+лишь своему воркеру, в остальных удалённый токен прожил бы до
+истечения. Поэтому без общего CACHE_BACKEND AUTH_CACHE_TIMEOUT по
+умолчанию 0, а check --deploy с включённым кэшем в памяти — ошибка
+(cinema.checks).
+
+Сама сессия читается движком SESSION_ENGINE: cached_db и signed_cookies
+обходятся без запроса к django_session.
+"""
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+PREFIX = 'auth'
+
+
+def _cache():
+    return caches[settings.AUTH_CACHE_ALIAS]
+
+
+def _token_key(key):
+    return f'{PREFIX}:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def _user_key(user_id):
+    return f'{PREFIX}:user:{user_id}'
+
+
+def _user_token_key(user_id):
+    # у пользователя один токен (OneToOne) — запоминаем, где он лежит
+    return f'{PREFIX}:user:{user_id}:token'
+
+
+def _forget(user_id=None, token=None):
+    keys = []
+    if user_id is not None:
+        keys += [_user_key(user_id), _user_token_key(user_id)]
+        token_key = _cache().get(_user_token_key(user_id))
+        if token_key:
+            keys.append(token_key)
+    if token is not None:
+        keys.append(_token_key(token))
+    _cache().delete_many(keys)
+
+
+def forget_user(user_id):
+    _forget(user_id=user_id)
+    transaction.on_commit(partial(_forget, user_id=user_id))
+
+
+def forget_token(key):
+    _forget(token=key)
+    transaction.on_commit(partial(_forget, token=key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшем; неверные токены не кэшируются."""
+
+    def authenticate_credentials(self, key):
+        timeout = settings.AUTH_CACHE_TIMEOUT
+        if not timeout:
+            return super().authenticate_credentials(key)
+        cache_key = _token_key(key)
+        cached = _cache().get(cache_key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            user = cached[0]
+            _cache().set_many({cache_key: cached,
+                               _user_token_key(user.pk): cache_key}, timeout)
+        elif not cached[0].is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return cached
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend с get_user (он на каждом запросе с сессией) из кэша."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None and password is not None:
+            # ModelBackend следом в AUTHENTICATION_BACKENDS нужен только
+            # старым сессиям — второй раз пароль хэшировать незачем
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        timeout = settings.AUTH_CACHE_TIMEOUT
+        if not timeout:
+            return super().get_user(user_id)
+        user = _cache().get(_user_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                _cache().set(_user_key(user_id), user, timeout)
+        return user if user is not None and \
+            self.user_can_authenticate(user) else None
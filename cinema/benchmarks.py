@@ -0,0 +1,285 @@
+"""
+Воспроизводимые замеры горячих путей.
+
+Каждый сценарий прогоняется warmup раз вхолостую и repeat раз под
+секундомером; в результат идут min/медиана/среднее/p95, запросов в
+секунду (rps, в один поток) и число SQL.
+Страницы запрашиваются тестовым клиентом. Покупка билета
+коммитится по-настоящему — в замер входит и пересчёт витрины продаж
+по on_commit, — а купленный билет удаляется после прогона вне
+секундомера (сценарий может вернуть пару (прогон, уборка)), так что
+данные не меняются между прогонами. Результат — JSON, который можно
+сравнить с прошлым прогоном (compare).
+"""
+import platform
+import statistics
+import subprocess
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, Max, OuterRef
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import datagen, pdf
+from .instrumentation import record_queries
+from .models import Movie, Seat, Session, Ticket, User
+
+# замер в одном процессе — кэш в памяти тут корректен, даже если в
+# настройках он выключен (AUTH_CACHE_TIMEOUT=0 без общего CACHE_BACKEND)
+AUTH_CACHE_TIMEOUT = 60
+
+
+class Skip(Exception):
+    """Сценарий невозможен на этих данных или в этом окружении."""
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=Path(settings.BASE_DIR), timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Suite:
+    def __init__(self):
+        self.client = Client()
+        movies = Movie.objects.order_by('-release_date', 'id')
+        self.movie = movies.filter(reviews__isnull=False).first() or \
+            movies.first()
+        if self.movie is None:
+            raise Skip('В БД нет фильмов — сначала generate_dataset.')
+        self.user = (User.objects.filter(tickets__isnull=False).first()
+                     or User.objects.first())
+        # сеанс со свободным местом: на распроданный форма не пустит
+        taken = Ticket.objects.filter(session=OuterRef(OuterRef('pk')))
+        free = (Seat.objects.filter(hall=OuterRef('hall'))
+                .exclude(pk__in=taken.values('seat_id')))
+        self.session = (Session.objects
+                        .filter(Exists(free), starts_at__gt=timezone.now())
+                        .order_by('starts_at').first())
+
+    def _get(self, url, user=None, **params):
+        if user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(user)
+        response = self.client.get(url, params)
+        if response.status_code != 200:
+            raise AssertionError(f'{url}: HTTP {response.status_code}')
+
+    # ─────────── сценарии ───────────
+    def catalog_list(self):
+        year = self.movie.release_date.year
+        return lambda: self._get(reverse('cinema:movie-list'),
+                                 main_genre=self.movie.main_genre_id,
+                                 release_year=year, min_rating=1, page=1)
+
+    def movie_detail(self):
+        url = reverse('cinema:movie-detail', args=[self.movie.pk])
+        return lambda: self._get(url)
+
+    def api_movie_list(self):
+        url = reverse('cinema:movie-api-list')
+        return lambda: self._get(url, main_genre=self.movie.main_genre_id,
+                                 release_year=self.movie.release_date.year)
+
+    def api_movie_catalog(self):
+        # весь каталог одним ответом: здесь и видна цена сериализации
+        url = reverse('cinema:movie-api-list')
+        return lambda: self._get(url)
+
+    def api_movie_catalog_serializer(self):
+        # то же через MovieSerializer — для сравнения с cinema.fast_api
+        run = self.api_movie_catalog()
+
+        def slow():
+            with override_settings(API_FAST_LIST=False):
+                run()
+        return slow
+
+    def api_movie_catalog_cached(self):
+        # то же из кэша ответов (cinema.api_cache): первый прогон — промах
+        run = self.api_movie_catalog()
+
+        def cached():
+            with override_settings(API_CACHE_TIMEOUT=60):
+                run()
+        return cached
+
+    def api_movie_search(self):
+        url = reverse('cinema:movie-api-list')
+        return lambda: self._get(url, search=self.movie.title)
+
+    def home(self):
+        return lambda: self._get(reverse('cinema:home'))
+
+    def recommendations(self):
+        if self.user is None:
+            raise Skip('Нет пользователей.')
+        return lambda: self._get(reverse('cinema:recommendations'),
+                                 user=self.user)
+
+    def ticket_purchase(self):
+        if self.session is None or self.user is None:
+            raise Skip('Нет будущих сеансов со свободными местами '
+                       'или пользователей.')
+        url = reverse('cinema:ticket-buy', args=[self.session.movie_id])
+        data = {'session': self.session.pk, 'payment_method': 'sbp'}
+
+        last = Ticket.objects.aggregate(last=Max('pk'))['last'] or 0
+
+        def run():
+            self.client.force_login(self.user)
+            response = self.client.post(url, data)
+            if response.status_code != 302:
+                raise AssertionError(f'покупка: HTTP {response.status_code}')
+
+        def cleanup():
+            # удаление через сигналы же пересчитывает витрину обратно
+            Ticket.objects.filter(pk__gt=last, user=self.user,
+                                  session=self.session).delete()
+        return run, cleanup
+
+    # ───── аутентификация (cinema.auth_cache) ─────
+    def _authenticated(self, run, **overrides):
+        if self.user is None:
+            raise Skip('Нет пользователей.')
+
+        def measured():
+            with override_settings(**overrides):
+                response = run()
+            if response.status_code != 200:
+                raise AssertionError(f'HTTP {response.status_code}')
+        return measured
+
+    def api_token_auth(self, cache=True):
+        token, _ = Token.objects.get_or_create(user=self.user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        url = reverse('cinema:movie-api-detail', args=[self.movie.pk])
+        return self._authenticated(
+            lambda: client.get(url),
+            AUTH_CACHE_TIMEOUT=AUTH_CACHE_TIMEOUT if cache else 0)
+
+    def api_token_auth_uncached(self):
+        return self.api_token_auth(cache=False)
+
+    def session_auth(self, engine='cached_db', cache=True):
+        # движок сессий читается при первом запросе клиента — он свой
+        client = Client()
+        overrides = {
+            'SESSION_ENGINE': f'django.contrib.sessions.backends.{engine}',
+            'AUTH_CACHE_TIMEOUT': AUTH_CACHE_TIMEOUT if cache else 0,
+        }
+        with override_settings(**overrides):
+            client.force_login(self.user)
+        url = reverse('cinema:favorite-list')
+        return self._authenticated(lambda: client.get(url), **overrides)
+
+    def session_auth_uncached(self):
+        return self.session_auth('db', cache=False)
+
+    def ticket_pdf(self):
+        ticket = (Ticket.objects
+                  .select_related('user', 'seat', 'session__movie',
+                                  'session__hall__cinema').first())
+        if ticket is None:
+            raise Skip('Нет билетов.')
+        try:
+            pdf.render_pdf('<p></p>')
+        except (ImportError, OSError) as exc:
+            raise Skip(f'WeasyPrint недоступен: {exc}')
+        return lambda: pdf.render_pdf(pdf.ticket_html(ticket))
+
+    SCENARIOS = ('catalog_list', 'movie_detail', 'api_movie_list',
+                 'api_movie_catalog', 'api_movie_catalog_serializer',
+                 'api_movie_catalog_cached', 'api_token_auth',
+                 'api_token_auth_uncached', 'session_auth',
+                 'session_auth_uncached',
+                 'api_movie_search', 'home', 'recommendations',
+                 'ticket_purchase', 'ticket_pdf')
+
+
+def measure(fn, warmup, repeat, cleanup=None):
+    for _ in range(warmup):
+        fn()
+        if cleanup:
+            cleanup()
+    timings = []
+    for _ in range(repeat):
+        with record_queries() as stats:
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        if cleanup:
+            cleanup()
+    return {
+        'repeat': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'rps': round(repeat / sum(timings) * 1000, 1),
+        'queries': stats.queries,
+    }
+
+
+def run(warmup=3, repeat=20, only=None, progress=None):
+    """Прогоняет сценарии и возвращает словарь для JSON."""
+    hosts = ['testserver', *settings.ALLOWED_HOSTS]
+    results = {}
+    # замеряем саму сборку ответа, кэш — отдельным сценарием; повторы
+    # одного клиента не должны упираться в THROTTLE_RATES
+    with override_settings(ALLOWED_HOSTS=hosts, API_CACHE_TIMEOUT=0,
+                           THROTTLE_RATES={}):
+        suite = Suite()
+        for name in suite.SCENARIOS:
+            if only and name not in only:
+                continue
+            try:
+                fn = getattr(suite, name)()
+            except Skip as exc:
+                results[name] = {'skipped': str(exc)}
+            else:
+                fn, cleanup = fn if isinstance(fn, tuple) else (fn, None)
+                results[name] = measure(fn, warmup, repeat, cleanup)
+            if progress:
+                progress(name, results[name])
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'warmup': warmup,
+            'rows': datagen.counts(),
+        },
+        'results': results,
+    }
+
+
+def compare(old, new):
+    """[(сценарий, медиана было, стало, изменение в %)] для общих сценариев."""
+    rows = []
+    for name, result in new['results'].items():
+        before = old.get('results', {}).get(name, {})
+        if 'median_ms' in result and 'median_ms' in before:
+            delta = (result['median_ms'] / before['median_ms'] - 1) * 100 \
+                if before['median_ms'] else 0.0
+            rows.append((name, before['median_ms'], result['median_ms'],
+                         round(delta, 1)))
+    return rows
@@ -0,0 +1,209 @@
+"""
+Пакетная запись каталога для синхронизации (MovieViewSet.bulk).
+
+Фильмы обрабатываются пачками по MOVIE_BULK_CHUNK_SIZE. На пачку —
+постоянное число запросов: по одному на проверку стран, жанров и
+актёров, один на дубли «название без учёта регистра + дата» (те же
+правила, что в Movie.clean; плюс LOWER() названий — по запросу на
+LOWER_CHUNK штук), затем bulk_create/bulk_update фильмов и
+связей MovieGenre/MovieActor. Пачка пишется в одной транзакции;
+у каждого элемента свой результат: created/updated с id или error
+с ошибками по полям. Ошибочные элементы не мешают остальным.
+
+Сигналы post_save при bulk_create не срабатывают, поэтому постер и
+файл трейлера здесь не принимаются — только поля-данные.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models.functions import Lower
+from rest_framework.relations import PrimaryKeyRelatedField
+
+from . import api_cache
+from .models import Actor, Country, Genre, Movie, MovieActor, MovieGenre
+from .serializers import MovieBulkItemSerializer
+
+DATA_FIELDS = ('title', 'description', 'release_date', 'trailer_url',
+               'country', 'main_genre')
+DUPLICATE = 'Фильм с таким названием и годом уже есть.'
+NOT_FOUND = PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+# параметров на один SELECT LOWER(...): ниже лимитов SQLite
+# (999 переменных в старых сборках, 2000 колонок)
+LOWER_CHUNK = 500
+
+
+def _db_lower(titles):
+    """
+    LOWER() самой БД: в SQLite он не трогает кириллицу, как и в clean().
+    Названия идут группами по LOWER_CHUNK — размер пачки не упирается
+    в лимиты SQLite.
+    """
+    titles = list(titles)
+    lowered = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(titles), LOWER_CHUNK):
+            group = titles[start:start + LOWER_CHUNK]
+            cursor.execute('SELECT ' + ', '.join(['LOWER(%s)'] * len(group)),
+                           group)
+            lowered.extend(cursor.fetchone())
+    return lowered
+
+
+def _existing_ids(model, ids):
+    return set(model.objects.filter(id__in=ids)
+               .values_list('id', flat=True)) if ids else set()
+
+
+class _Chunk:
+    def __init__(self, items, update):
+        self.items = items          # [(номер в запросе, данные)]
+        self.update = update
+        self.errors = defaultdict(lambda: defaultdict(list))
+
+    def error(self, index, field, message):
+        self.errors[index][field].append(str(message))
+
+    # ─────────── проверки ───────────
+    def validate(self):
+        valid = []
+        for index, item in self.items:
+            serializer = MovieBulkItemSerializer(data=item,
+                                                 partial=self.update)
+            if not serializer.is_valid():
+                for field, messages in serializer.errors.items():
+                    for message in messages if isinstance(messages, list) \
+                            else [messages]:
+                        self.error(index, field, message)
+            elif self.update and 'id' not in serializer.validated_data:
+                self.error(index, 'id', 'Обязательное поле.')
+            else:
+                valid.append((index, serializer.validated_data))
+        if not valid:
+            return []
+
+        self.movies = {}
+        if self.update:
+            self.movies = Movie.objects.in_bulk(
+                [data['id'] for _, data in valid])
+        self._check_references(valid)
+        self._check_duplicates(valid)
+        return [(index, data) for index, data in valid
+                if index not in self.errors]
+
+    def _check_references(self, valid):
+        wanted = {'country': set(), 'genre': set(), 'actor': set()}
+        for _, data in valid:
+            wanted['country'].update(filter(None, [data.get('country')]))
+            wanted['genre'].update(filter(None, [data.get('main_genre')]))
+            wanted['genre'].update(data.get('genres', ()))
+            wanted['actor'].update(data.get('actors', ()))
+        found = {'country': _existing_ids(Country, wanted['country']),
+                 'genre': _existing_ids(Genre, wanted['genre']),
+                 'actor': _existing_ids(Actor, wanted['actor'])}
+
+        for index, data in valid:
+            if self.update and data['id'] not in self.movies:
+                self.error(index, 'id', NOT_FOUND.format(pk_value=data['id']))
+            for field, kind in (('country', 'country'),
+                                ('main_genre', 'genre')):
+                if field in data and data[field] not in found[kind]:
+                    self.error(index, field,
+                               NOT_FOUND.format(pk_value=data[field]))
+            for field, kind in (('genres', 'genre'), ('actors', 'actor')):
+                for pk in data.get(field, ()):
+                    if pk not in found[kind]:
+                        self.error(index, field,
+                                   NOT_FOUND.format(pk_value=pk))
+
+    def _key_source(self, data):
+        movie = self.movies.get(data.get('id'))
+        title = data.get('title', movie.title if movie else None)
+        date = data.get('release_date', movie.release_date if movie else None)
+        return title, date
+
+    def _check_duplicates(self, valid):
+        sources = [self._key_source(data) for _, data in valid]
+        lowered = _db_lower([title for title, _ in sources])
+        keys = [(lower, date) for lower, (_, date) in zip(lowered, sources)]
+        taken = dict(
+            ((lower, date), pk) for pk, lower, date in
+            Movie.objects.alias(title_lower=Lower('title'))
+            .filter(title_lower__in={k[0] for k in keys},
+                    release_date__in={k[1] for k in keys})
+            .values_list('id', Lower('title'), 'release_date')
+        )
+        seen = set()
+        for (index, data), key in zip(valid, keys):
+            own = data.get('id')
+            if key in seen or taken.get(key, own) != own:
+                self.error(index, 'non_field_errors', DUPLICATE)
+            seen.add(key)
+
+    # ─────────── запись ───────────
+    def write(self, valid):
+        created, updated = [], []
+        for index, data in valid:
+            values = {f'{f}_id' if f in ('country', 'main_genre') else f:
+                      data[f] for f in DATA_FIELDS if f in data}
+            if self.update:
+                movie = self.movies[data['id']]
+                for name, value in values.items():
+                    setattr(movie, name, value)
+                updated.append((index, data, movie, values.keys()))
+            else:
+                created.append((index, data, Movie(**values)))
+
+        Movie.objects.bulk_create([movie for _, _, movie in created])
+        if updated:
+            fields = set().union(*(names for *_, names in updated))
+            if fields:
+                Movie.objects.bulk_update([m for _, _, m, _ in updated],
+                                          sorted(fields))
+
+        rows = [(data, movie) for _, data, movie in created] + \
+               [(data, movie) for _, data, movie, _ in updated]
+        self._write_links(rows, 'genres', MovieGenre, 'genre_id', {})
+        self._write_links(rows, 'actors', MovieActor, 'actor_id',
+                          {'role_name': ''})
+        api_cache.bump(Movie, MovieGenre, MovieActor)   # сигналов нет
+        return ([(index, 'created', movie.pk) for index, _, movie in created]
+                + [(index, 'updated', m.pk) for index, _, m, _ in updated])
+
+    def _write_links(self, rows, field, through, column, defaults):
+        """Как .set(): связи фильма заменяются переданным списком."""
+        rows = [(data, movie) for data, movie in rows if field in data]
+        if self.update and rows:
+            through.objects.filter(
+                movie_id__in=[movie.pk for _, movie in rows]).delete()
+        through.objects.bulk_create(
+            through(movie_id=movie.pk, **{column: pk}, **defaults)
+            for data, movie in rows
+            for pk in dict.fromkeys(data[field])
+        )
+
+
+def write_movies(items, update=False, chunk_size=None):
+    """[{index, status, id | errors}] по элементу на каждый входной."""
+    chunk_size = chunk_size or settings.MOVIE_BULK_CHUNK_SIZE
+    results = []
+    for start in range(0, len(items), chunk_size):
+        chunk = _Chunk(list(enumerate(items[start:start + chunk_size],
+                                      start)), update)
+        valid = chunk.validate()
+        written = []
+        if valid:
+            try:
+                with transaction.atomic():
+                    written = chunk.write(valid)
+            except IntegrityError as exc:
+                # гонка с параллельной записью: пачка откатилась целиком
+                for index, _ in valid:
+                    chunk.error(index, 'non_field_errors',
+                                f'Пачка не записана: {exc}')
+        results += [{'index': index, 'status': status, 'id': pk}
+                    for index, status, pk in written]
+        results += [{'index': index, 'status': 'error',
+                     'errors': {f: list(m) for f, m in errors.items()}}
+                    for index, errors in chunk.errors.items()]
+    return sorted(results, key=lambda r: r['index'])
@@ -0,0 +1,329 @@
+"""
+Потоковый импорт каталога из JSONL или CSV (import_catalog).
+
+Файл читается построчно, в памяти — одна пачка строк и словари
+«название → id» стран, жанров и актёров, загруженные один раз; чего
+нет, создаётся пачкой и дописывается в словари (при откате пачки —
+вычёркивается обратно). Фильм ищется по (Lower(title), release_date),
+как в Movie.clean и bulk: есть — обновляется, нет — создаётся; жанры и
+роли заменяются переданными. Каждая пачка — одна транзакция.
+
+После пачки в файл контрольной точки пишется байтовое смещение в
+исходном файле. После сбоя импорт продолжается с него; пачку,
+записанную до сбоя, но не отмеченную, импорт просто повторит — запись
+идемпотентна. Формат строк совпадает с выгрузкой export_data movies:
+country/country_name, main_genre/main_genre_name, genres — список или
+«a|b», actors — список {name, role}, имён или «a|b».
+"""
+import csv
+import json
+import os
+import time
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from . import api_cache
+from .bulk import _db_lower
+from .models import Actor, Country, Genre, Movie, MovieActor, MovieGenre
+from .serializers import CatalogImportRowSerializer
+
+MOVIE_FIELDS = ('description', 'trailer_url', 'country_id', 'main_genre_id')
+
+
+def detect_format(path):
+    return 'csv' if str(path).lower().endswith('.csv') else 'jsonl'
+
+
+# ─────────── чтение ───────────
+def _lines(fh, position):
+    """
+    (строка, байт конца) — смещения нужны для контрольной точки.
+    Вместо строки с битой кодировкой — ValueError: она отклоняется
+    как запись, а не обрывает импорт. BOM в начале файла отрезается.
+    """
+    for raw in fh:
+        encoding = 'utf-8-sig' if position == 0 else 'utf-8'
+        position += len(raw)
+        try:
+            line = raw.decode(encoding)
+        except UnicodeDecodeError as exc:
+            line = ValueError(f'Некорректная кодировка UTF-8: {exc}')
+        yield line, position
+
+
+def read_records(path, fmt, offset=0, header=None):
+    """
+    Порождает (номер строки, запись | ошибка, смещение после записи, header).
+    Номер — последней физической строки записи, считая от offset (с 1).
+    """
+    with open(path, 'rb') as fh:
+        fh.seek(offset)
+        if fmt == 'jsonl':
+            for line_no, (line, end) in enumerate(_lines(fh, offset), 1):
+                if isinstance(line, ValueError):
+                    yield line_no, line, end, None
+                    continue
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record, dict):
+                        raise ValueError('ожидается объект')
+                except ValueError as exc:
+                    record = ValueError(f'Некорректный JSON: {exc}')
+                yield line_no, record, end, None
+            return
+
+        position = offset
+        broken = None
+
+        def tracked():
+            nonlocal position, broken
+            for line, position in _lines(fh, offset):
+                if isinstance(line, ValueError):
+                    # запись с этой строкой целиком уйдёт в отказы
+                    broken, line = broken or line, '\n'
+                yield line
+        reader = csv.reader(tracked())
+        for row in reader:
+            if broken is not None:
+                record, broken = broken, None
+                yield reader.line_num, record, position, header
+                continue
+            if header is None:
+                header = row
+                yield reader.line_num, None, position, header
+                continue
+            if len(row) != len(header):
+                record = ValueError(f'Ожидалось {len(header)} колонок, '
+                                    f'получено {len(row)}')
+            else:
+                record = dict(zip(header, row))
+            yield reader.line_num, record, position, header
+
+
+def _split(value):
+    if isinstance(value, str):
+        return [part.strip() for part in value.split('|') if part.strip()]
+    return value
+
+
+def normalize(record):
+    """Запись фида → данные для CatalogImportRowSerializer."""
+    data = {key: record[key] for key in
+            ('title', 'description', 'release_date', 'trailer_url')
+            if key in record}
+    for field in ('country', 'main_genre'):
+        value = record.get(field) or record.get(f'{field}_name')
+        if value is not None:
+            data[field] = value
+    if record.get('genres') not in (None, ''):
+        data['genres'] = _split(record['genres'])
+    if record.get('actors') not in (None, ''):
+        data['actors'] = [{'name': a} if isinstance(a, str) else a
+                          for a in _split(record['actors'])]
+    if data.get('trailer_url') == '':
+        data['trailer_url'] = None
+    return data
+
+
+# ─────────── запись ───────────
+class _Dictionary:
+    """Название → id; недостающие создаются одной вставкой на пачку."""
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = dict(model.objects.values_list('name', 'id'))
+        self.new = set()            # добавлены в текущей пачке
+
+    def resolve(self, names):
+        missing = {name for name in names if name not in self.ids}
+        if missing:
+            self.model.objects.bulk_create(
+                [self.model(name=name) for name in missing],
+                ignore_conflicts=True)
+            self.ids.update(self.model.objects.filter(name__in=missing)
+                            .values_list('name', 'id'))
+            self.new |= missing
+        return self.ids
+
+    def commit(self):
+        self.new.clear()
+
+    def rollback(self):
+        # id из откатившейся транзакции в БД уже нет
+        for name in self.new:
+            self.ids.pop(name, None)
+        self.new.clear()
+
+
+class Importer:
+    def __init__(self):
+        self.countries = _Dictionary(Country)
+        self.genres = _Dictionary(Genre)
+        self.actors = _Dictionary(Actor)
+
+    def write(self, rows):
+        """rows — проверенные строки → (создано, обновлено); транзакция."""
+        dictionaries = (self.countries, self.genres, self.actors)
+        try:
+            with transaction.atomic():
+                result = self._write(rows)
+        except BaseException:
+            for dictionary in dictionaries:
+                dictionary.rollback()
+            raise
+        for dictionary in dictionaries:
+            dictionary.commit()
+        return result
+
+    def _write(self, rows):
+        # ключ — как в Movie.clean: регистр названия приводит сама БД;
+        # «MATRIX» и «Matrix» в одной пачке — последняя строка
+        keyed = dict(zip(zip(_db_lower(r['title'] for r in rows),
+                             (r['release_date'] for r in rows)), rows))
+        rows = list(keyed.values())
+        countries = self.countries.resolve(r['country'] for r in rows)
+        genres = self.genres.resolve(
+            [r['main_genre'] for r in rows] +
+            [g for r in rows for g in r.get('genres', ())])
+        actors = self.actors.resolve(
+            a['name'] for r in rows for a in r.get('actors', ()))
+
+        existing = {
+            (lower, date): pk for pk, lower, date in
+            Movie.objects.alias(title_lower=Lower('title'))
+            .filter(title_lower__in={lower for lower, _ in keyed},
+                    release_date__in={date for _, date in keyed})
+            .values_list('id', Lower('title'), 'release_date')
+        }
+        new, changed = [], []
+        for key, row in keyed.items():
+            movie = Movie(
+                pk=existing.get(key),
+                title=row['title'], release_date=row['release_date'],
+                description=row['description'],
+                trailer_url=row.get('trailer_url'),
+                country_id=countries[row['country']],
+                main_genre_id=genres[row['main_genre']],
+            )
+            (changed if movie.pk else new).append((row, movie))
+
+        Movie.objects.bulk_create([movie for _, movie in new])
+        if changed:
+            Movie.objects.bulk_update([movie for _, movie in changed],
+                                      MOVIE_FIELDS)
+
+        pairs = new + changed
+        with_genres = [(r, m) for r, m in pairs if 'genres' in r]
+        with_actors = [(r, m) for r, m in pairs if 'actors' in r]
+        MovieGenre.objects.filter(
+            movie_id__in=[m.pk for r, m in changed if 'genres' in r]).delete()
+        MovieActor.objects.filter(
+            movie_id__in=[m.pk for r, m in changed if 'actors' in r]).delete()
+        MovieGenre.objects.bulk_create(
+            MovieGenre(movie_id=movie.pk, genre_id=genres[name])
+            for row, movie in with_genres
+            for name in dict.fromkeys(row['genres'])
+        )
+        MovieActor.objects.bulk_create(
+            MovieActor(movie_id=movie.pk, actor_id=actors[name],
+                       role_name=role)
+            for row, movie in with_actors
+            for name, role in {a['name']: a['role']
+                               for a in row['actors']}.items()
+        )
+        api_cache.bump(Movie, MovieGenre, MovieActor)
+        return len(new), len(changed)
+
+
+# ─────────── контрольная точка ───────────
+def load_checkpoint(path):
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, state):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(state, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def run(source, fmt=None, batch_size=1000, checkpoint=None, resume=False,
+        rejects=None, progress=None):
+    """Импорт файла; возвращает счётчики read/created/updated/rejected."""
+    source = Path(source)
+    fmt = fmt or detect_format(source)
+    checkpoint = Path(checkpoint or f'{source}.checkpoint')
+    state = load_checkpoint(checkpoint) if resume else None
+    if state and state['source'] != str(source.resolve()):
+        raise ValueError(f'Контрольная точка {checkpoint} — от другого '
+                         f'файла: {state["source"]}')
+    state = state or {
+        'source': str(source.resolve()), 'format': fmt, 'offset': 0,
+        'header': None, 'line': 0,
+        'stats': {'read': 0, 'created': 0, 'updated': 0, 'rejected': 0},
+    }
+    stats = state['stats']
+    importer = Importer()
+    reject_log = open(rejects, 'a' if resume else 'w',
+                      encoding='utf-8') if rejects else None
+    started = time.monotonic()
+    batch = {}
+
+    def flush(offset, line):
+        if batch:
+            created, updated = importer.write(list(batch.values()))
+            stats['created'] += created
+            stats['updated'] += updated
+            batch.clear()
+        if reject_log:
+            reject_log.flush()
+        state.update(offset=offset, line=line)
+        save_checkpoint(checkpoint, state)
+        if progress:
+            progress(dict(stats), time.monotonic() - started)
+
+    def reject(line, errors, record):
+        stats['rejected'] += 1
+        if reject_log:
+            reject_log.write(json.dumps(
+                {'line': line, 'errors': errors, 'record': record},
+                ensure_ascii=False, default=str) + '\n')
+
+    try:
+        base = line = state['line']
+        offset = state['offset']
+        for number, record, end, header in read_records(
+                source, fmt, state['offset'], state['header']):
+            line = base + number
+            offset = end
+            state['header'] = header
+            if record is None:
+                continue
+            stats['read'] += 1
+            if isinstance(record, Exception):
+                reject(line, {'non_field_errors': [str(record)]}, None)
+                continue
+            serializer = CatalogImportRowSerializer(data=normalize(record))
+            if not serializer.is_valid():
+                reject(line, serializer.errors, record)
+                continue
+            row = serializer.validated_data
+            # повтор ключа в пачке — побеждает последняя строка
+            batch[(row['title'], row['release_date'])] = row
+            if len(batch) >= batch_size:
+                flush(offset, line)
+        flush(offset, line)
+    finally:
+        if reject_log:
+            reject_log.close()
+    checkpoint.unlink(missing_ok=True)
+    return stats
@@ -0,0 +1,20 @@
+"""Проверки настроек (manage.py check --deploy)."""
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def auth_cache_is_shared(app_configs, **kwargs):
+    # сброс кэша аутентификации виден только своему воркеру
+    backend = settings.CACHES[settings.AUTH_CACHE_ALIAS]['BACKEND']
+    if settings.AUTH_CACHE_TIMEOUT and \
+            backend in settings.PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            'Кэш аутентификации включён на кэше в памяти процесса: '
+            'удалённый токен или отключённый пользователь останутся '
+            'действительными в других воркерах до AUTH_CACHE_TIMEOUT.',
+            hint='Задайте общий CACHE_BACKEND (Redis, Memcached) или '
+                 'AUTH_CACHE_TIMEOUT=0.',
+            id='cinema.E001',
+        )]
+    return []
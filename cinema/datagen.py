@@ -0,0 +1,288 @@
+"""
+Синтетический набор данных «как в продакшене» для замеров.
+
+Всё пишется через bulk_create порциями по batch_size; объекты
+порождаются лениво, так что миллионы отзывов и билетов не держатся
+в памяти. Генератор детерминирован: тот же seed и те же размеры —
+те же данные. Популярность фильмов неравномерна (закон Ципфа):
+у немногих фильмов много сеансов и отзывов, у большинства — мало.
+"""
+import datetime
+import itertools
+import random
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Actor, Cinema, Country, Favorite, Genre, Hall, Movie, MovieActor,
+    MovieGenre, Review, Seat, Session, Ticket, User,
+)
+
+FULL_SIZES = {
+    'users': 200_000,
+    'actors': 50_000,
+    'movies': 100_000,
+    'reviews': 5_000_000,
+    'favorites': 500_000,
+    'cinemas': 100,
+    'halls': 1_000,
+    'sessions': 200_000,
+    'tickets': 3_000_000,
+}
+
+GENRES = ('Драма', 'Комедия', 'Боевик', 'Триллер', 'Ужасы', 'Фантастика',
+          'Фэнтези', 'Мелодрама', 'Детектив', 'Приключения', 'Мультфильм',
+          'Документальный', 'Военный', 'Исторический', 'Мюзикл', 'Вестерн',
+          'Криминал', 'Биография', 'Семейный', 'Спорт')
+COUNTRIES = ('Россия', 'США', 'Франция', 'Германия', 'Италия',
+             'Великобритания', 'Япония', 'Южная Корея', 'Индия', 'Китай',
+             'Испания', 'Швеция', 'Дания', 'Польша', 'Канада', 'Австралия',
+             'Бразилия', 'Мексика', 'Аргентина', 'Турция')
+WORDS = ('тихий', 'последний', 'красный', 'город', 'ночь', 'дорога', 'море',
+         'тайна', 'зима', 'свет', 'дом', 'брат', 'война', 'любовь', 'остров',
+         'поезд', 'сон', 'огонь', 'ветер', 'звезда', 'лето', 'берег', 'время',
+         'история', 'герой', 'путь', 'мечта', 'тень', 'голос', 'небо')
+PRICES = tuple(Decimal(p) for p in ('250', '300', '350', '400', '500'))
+
+
+def sizes_for(scale=1.0, **overrides):
+    sizes = {k: max(1, int(v * scale)) for k, v in FULL_SIZES.items()}
+    sizes.update({k: v for k, v in overrides.items() if v is not None})
+    return sizes
+
+
+def _batched(iterable, size):
+    it = iter(iterable)
+    while batch := list(itertools.islice(it, size)):
+        yield batch
+
+
+class Generator:
+    def __init__(self, sizes, seed=42, batch_size=5000, progress=None):
+        self.sizes = sizes
+        self.rnd = random.Random(seed)
+        self.batch_size = batch_size
+        self.progress = progress or (lambda label, done, total: None)
+        self.now = timezone.now().replace(second=0, microsecond=0)
+
+    def _insert(self, model, objects, total, label=None):
+        label = label or model._meta.verbose_name_plural
+        done = 0
+        with transaction.atomic():
+            for batch in _batched(objects, self.batch_size):
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+                done += len(batch)
+                self.progress(label, done, total)
+        return done
+
+    def _text(self, lo, hi):
+        return ' '.join(self.rnd.choices(WORDS, k=self.rnd.randint(lo, hi)))
+
+    def _popular(self, ids, k):
+        """k id из ids с убывающей по рангу вероятностью (Ципф, s≈1)."""
+        if not hasattr(self, '_cum_weights') or \
+                len(self._cum_weights) != len(ids):
+            self._cum_weights = list(itertools.accumulate(
+                1 / (rank + 1) for rank in range(len(ids))))
+        return self.rnd.choices(ids, cum_weights=self._cum_weights, k=k)
+
+    # ─────────── шаги ───────────
+    def dictionaries(self):
+        Country.objects.bulk_create(
+            [Country(name=n) for n in COUNTRIES], ignore_conflicts=True)
+        Genre.objects.bulk_create(
+            [Genre(name=n) for n in GENRES], ignore_conflicts=True)
+        self.country_ids = list(Country.objects.order_by('id')
+                                .values_list('id', flat=True))
+        self.genre_ids = list(Genre.objects.order_by('id')
+                              .values_list('id', flat=True))
+
+    def users(self):
+        n = self.sizes['users']
+        start = User.objects.count()
+        self._insert(User, (
+            User(username=f'synthetic{start + i:07d}', password='!',
+                 date_joined=self.now - datetime.timedelta(
+                     days=self.rnd.randint(0, 2000)))
+            for i in range(n)
+        ), n)
+        self.user_ids = list(User.objects.filter(
+            username__startswith='synthetic').order_by('id')
+            .values_list('id', flat=True))
+
+    def actors(self):
+        n = self.sizes['actors']
+        start = Actor.objects.count()
+        self._insert(Actor, (Actor(name=f'Актёр {start + i:06d}')
+                             for i in range(n)), n)
+        self.actor_ids = list(Actor.objects.order_by('id')
+                              .values_list('id', flat=True))
+
+    def movies(self):
+        n = self.sizes['movies']
+        start = Movie.objects.count()
+        today = timezone.localdate()
+
+        def make(i):
+            # новинок больше, чем старых фильмов
+            days = int(self.rnd.betavariate(1, 3) * 365 * 70)
+            return Movie(
+                title=f'{self._text(1, 3).capitalize()} {start + i}',
+                description=self._text(20, 60),
+                release_date=today - datetime.timedelta(days=days),
+                country_id=self.rnd.choice(self.country_ids),
+                main_genre_id=self.rnd.choice(self.genre_ids),
+            )
+        self._insert(Movie, (make(i) for i in range(n)), n)
+        self.movie_ids = list(Movie.objects.order_by('-release_date', 'id')
+                              .values_list('id', flat=True))
+
+        def genres():
+            for movie_id in self.movie_ids:
+                for genre_id in self.rnd.sample(self.genre_ids,
+                                                self.rnd.randint(1, 3)):
+                    yield MovieGenre(movie_id=movie_id, genre_id=genre_id)
+        self._insert(MovieGenre, genres(), 2 * n, 'жанры фильмов')
+
+        def cast():
+            for movie_id in self.movie_ids:
+                for actor_id in self.rnd.sample(self.actor_ids,
+                                                min(5, len(self.actor_ids))):
+                    yield MovieActor(movie_id=movie_id, actor_id=actor_id,
+                                     role_name=self._text(1, 2))
+        self._insert(MovieActor, cast(), 5 * n, 'роли')
+
+    def reviews(self):
+        n = self.sizes['reviews']
+
+        def make():
+            for batch in _batched(range(n), self.batch_size):
+                movies = self._popular(self.movie_ids, len(batch))
+                for movie_id in movies:
+                    yield Review(
+                        movie_id=movie_id,
+                        user_id=self.rnd.choice(self.user_ids),
+                        rating=min(10, max(1, round(self.rnd.gauss(7, 2)))),
+                        review_text=self._text(5, 40),
+                        is_approved=self.rnd.random() < 0.9,
+                        created_at=self.now - datetime.timedelta(
+                            minutes=self.rnd.randint(0, 60 * 24 * 1500)),
+                    )
+        self._insert(Review, make(), n)
+
+    def favorites(self):
+        n = self.sizes['favorites']
+        seen = set()
+
+        def make():
+            while len(seen) < n and len(seen) < \
+                    len(self.user_ids) * len(self.movie_ids):
+                pair = (self.rnd.choice(self.user_ids),
+                        self._popular(self.movie_ids, 1)[0])
+                if pair not in seen:
+                    seen.add(pair)
+                    yield Favorite(user_id=pair[0], movie_id=pair[1],
+                                   added_at=self.now - datetime.timedelta(
+                                       minutes=self.rnd.randint(0, 10 ** 6)))
+        self._insert(Favorite, make(), n)
+
+    def halls(self):
+        cinemas = Cinema.objects.bulk_create(
+            Cinema(name=f'Кинотеатр {i + 1}', address=self._text(2, 4),
+                   lat=Decimal(f'{55 + self.rnd.random():.6f}'),
+                   lng=Decimal(f'{37 + self.rnd.random():.6f}'))
+            for i in range(self.sizes['cinemas'])
+        )
+        n = self.sizes['halls']
+        halls = Hall.objects.bulk_create(
+            Hall(cinema=cinemas[i % len(cinemas)],
+                 name=f'Зал {i // len(cinemas) + 1}',
+                 rows=self.rnd.randint(6, 20),
+                 seats_per_row=self.rnd.randint(8, 24))
+            for i in range(n)
+        )
+        # bulk_create не вызывает Hall.save — места создаём сами
+        self._insert(Seat, (
+            Seat(hall=hall, row_num=r, seat_num=s)
+            for hall in halls
+            for r in range(1, hall.rows + 1)
+            for s in range(1, hall.seats_per_row + 1)
+        ), sum(h.rows * h.seats_per_row for h in halls))
+        self.hall_ids = [h.pk for h in halls]
+        self.hall_seats = {}
+        for hall_id, seat_id in (Seat.objects.filter(hall__in=halls)
+                                 .order_by('id')
+                                 .values_list('hall_id', 'id')):
+            self.hall_seats.setdefault(hall_id, []).append(seat_id)
+
+    def sessions(self):
+        n = self.sizes['sessions']
+        first = self.now - datetime.timedelta(days=60)
+
+        def make():
+            for batch in _batched(range(n), self.batch_size):
+                for movie_id in self._popular(self.movie_ids, len(batch)):
+                    slot = self.rnd.randint(0, 120 * 24 * 4)   # по 15 минут
+                    yield Session(
+                        movie_id=movie_id,
+                        hall_id=self.rnd.choice(self.hall_ids),
+                        starts_at=first + datetime.timedelta(minutes=15 * slot),
+                        price=self.rnd.choice(PRICES),
+                    )
+        self._insert(Session, make(), n)
+
+    def tickets(self):
+        total = self.sizes['tickets']
+        sessions = list(Session.objects.filter(hall_id__in=self.hall_ids)
+                        .order_by('id')
+                        .values_list('id', 'hall_id', 'starts_at'))
+        per_session = total / max(len(sessions), 1)
+        statuses = (Ticket.Status.PAID,) * 18 + \
+            (Ticket.Status.RESERVED, Ticket.Status.CANCELLED)
+
+        def make():
+            left = total
+            for session_id, hall_id, starts_at in sessions:
+                if left <= 0:
+                    return
+                seats = self.hall_seats[hall_id]
+                k = min(len(seats), left,
+                        int(self.rnd.expovariate(1 / per_session)) + 1)
+                left -= k
+                for seat_id in self.rnd.sample(seats, k):
+                    yield Ticket(
+                        user_id=self.rnd.choice(self.user_ids),
+                        session_id=session_id, seat_id=seat_id,
+                        status=self.rnd.choice(statuses),
+                        purchased_at=starts_at - datetime.timedelta(
+                            minutes=self.rnd.randint(10, 60 * 24 * 14)),
+                    )
+        return self._insert(Ticket, make(), total)
+
+    def run(self):
+        self.dictionaries()
+        self.users()
+        self.actors()
+        self.movies()
+        self.reviews()
+        self.favorites()
+        self.halls()
+        self.sessions()
+        self.tickets()
+        self.progress('средние оценки', 0, 1)
+        Movie.objects.all().refresh_avg_rating()
+        self.progress('средние оценки', 1, 1)
+
+
+def generate(sizes, seed=42, batch_size=5000, progress=None):
+    Generator(sizes, seed=seed, batch_size=batch_size,
+              progress=progress).run()
+
+
+def counts():
+    """Сколько строк сейчас в основных таблицах."""
+    return {model._meta.verbose_name_plural: model.objects.count()
+            for model in (User, Actor, Movie, Review, Favorite, Hall, Seat,
+                          Session, Ticket)}
@@ -0,0 +1,100 @@
+"""
+Чтение каталога с реплик, запись — только в основную БД.
+
+Запросы к моделям каталога (фильмы, справочники, отзывы) внутри
+HTTP-запроса уходят на одну из settings.REPLICA_DATABASES — одну на
+весь запрос, чтобы его чтения не видели разное отставание. Всё
+остальное — билеты, избранное, сеансы, пользователи — читается
+и пишется в 'default'.
+
+Read-your-writes: ReadYourWritesMiddleware держит в contextvar
+состояние текущего запроса. Небезопасные методы (POST и т. п.)
+целиком идут в основную БД; после записи клиент получает cookie,
+и ещё READ_YOUR_WRITES_SECONDS его чтения тоже идут в основную —
+пока реплика не догонит. Вне HTTP-запроса (команды, фоновые задачи)
+реплики не используются вовсе: там чтение сразу после записи — норма.
+"""
+import contextvars
+import random
+import time
+
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'db_pin'
+
+CATALOG_MODELS = {
+    'cinema.movie', 'cinema.genre', 'cinema.country', 'cinema.actor',
+    'cinema.moviegenre', 'cinema.movieactor', 'cinema.review',
+}
+
+
+class _RequestState:
+    __slots__ = ('pinned', 'wrote', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None         # выбирается при первом чтении каталога
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'REPLICA_DATABASES', ()))
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned:
+            return PRIMARY
+        if model._meta.label_lower not in CATALOG_MODELS:
+            return PRIMARY
+        if state.replica is None:
+            aliases = replicas()
+            state.replica = random.choice(aliases) if aliases else PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label == 'cinema':
+            state.wrote = state.pinned = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {PRIMARY, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема на репликах приезжает репликацией
+        return db == PRIMARY
+
+
+class ReadYourWritesMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        pinned = (request.method not in ('GET', 'HEAD', 'OPTIONS')
+                  or pinned_until > time.time())
+        state = _RequestState(pinned=pinned)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            window = settings.READ_YOUR_WRITES_SECONDS
+            response.set_cookie(PIN_COOKIE, f'{time.time() + window:.0f}',
+                                max_age=window, httponly=True,
+                                samesite='Lax')
+        return response
@@ -0,0 +1,188 @@
+"""
+Потоковые выгрузки каталога, одобренных отзывов и билетов (NDJSON/CSV).
+
+Строки берутся через values() и .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+в порядке id — без моделей, сериализаторов и OFFSET. Связи M2M (жанры,
+актёры) подтягиваются одним запросом на пачку. Ответ пишется по пачкам,
+так что память не зависит от размера таблицы.
+
+Продолжение после обрыва — по ключу: after=<последний полученный id>.
+"""
+import csv
+import itertools
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from .models import Movie, MovieActor, MovieGenre, Review, Ticket
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def _batched(iterable, size):
+    it = iter(iterable)
+    while batch := list(itertools.islice(it, size)):
+        yield batch
+
+
+class Export:
+    columns = ()
+    staff_only = False
+    permission = None           # право, открывающее выгрузку не персоналу
+
+    def queryset(self):
+        raise NotImplementedError
+
+    def attach(self, rows):
+        """Дополнить пачку строк данными связей (один запрос на пачку)."""
+
+    def csv_value(self, column, value):
+        return value
+
+
+class MovieExport(Export):
+    columns = ('id', 'title', 'description', 'release_date', 'country_name',
+               'main_genre_name', 'genres', 'actors', 'trailer_url',
+               'avg_rating')
+    permission = 'cinema.view_movie'
+
+    def queryset(self):
+        return Movie.objects.values(
+            'id', 'title', 'description', 'release_date', 'trailer_url',
+            'avg_rating', country_name=F('country__name'),
+            main_genre_name=F('main_genre__name'),
+        )
+
+    def attach(self, rows):
+        ids = [row['id'] for row in rows]
+        genres, actors = defaultdict(list), defaultdict(list)
+        for movie_id, name in (MovieGenre.objects.filter(movie_id__in=ids)
+                               .order_by('genre__name')
+                               .values_list('movie_id', 'genre__name')):
+            genres[movie_id].append(name)
+        for movie_id, actor_id, name, role in (
+                MovieActor.objects.filter(movie_id__in=ids).order_by('id')
+                .values_list('movie_id', 'actor_id', 'actor__name',
+                             'role_name')):
+            actors[movie_id].append({'id': actor_id, 'name': name,
+                                     'role': role})
+        for row in rows:
+            row['genres'] = genres[row['id']]
+            row['actors'] = actors[row['id']]
+
+    def csv_value(self, column, value):
+        if column == 'genres':
+            return '|'.join(value)
+        if column == 'actors':
+            return '|'.join(a['name'] for a in value)
+        return value
+
+
+class ReviewExport(Export):
+    columns = ('id', 'movie_id', 'movie_title', 'author_name', 'rating',
+               'review_text', 'created_at')
+    permission = 'cinema.view_review'     # в выгрузке имена авторов
+
+    def queryset(self):
+        return Review.objects.filter(is_approved=True).values(
+            'id', 'movie_id', 'rating', 'review_text', 'created_at',
+            movie_title=F('movie__title'), author_name=F('user__username'),
+        )
+
+
+class TicketExport(Export):
+    columns = ('id', 'status', 'purchased_at', 'price', 'session_id',
+               'starts_at', 'movie_title', 'cinema_name', 'hall_name',
+               'seat_row', 'seat_number', 'user_id', 'username')
+    staff_only = True
+
+    def queryset(self):
+        return Ticket.objects.values(
+            'id', 'status', 'purchased_at', 'session_id', 'user_id',
+            price=F('session__price'), starts_at=F('session__starts_at'),
+            movie_title=F('session__movie__title'),
+            cinema_name=F('session__hall__cinema__name'),
+            hall_name=F('session__hall__name'),
+            seat_row=F('seat__row_num'), seat_number=F('seat__seat_num'),
+            username=F('user__username'),
+        )
+
+
+EXPORTS = {
+    'movies': MovieExport(),
+    'reviews': ReviewExport(),
+    'tickets': TicketExport(),
+}
+
+
+def iter_batches(export, after=None, chunk_size=None):
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    qs = export.queryset().order_by('id')
+    if after is not None:
+        qs = qs.filter(id__gt=after)
+    for batch in _batched(qs.iterator(chunk_size=chunk_size), chunk_size):
+        export.attach(batch)
+        yield batch
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream(export, fmt, after=None, chunk_size=None, header=None):
+    """Текст выгрузки кусками по пачке; заголовок CSV — только с начала."""
+    batches = iter_batches(export, after, chunk_size)
+    if fmt == 'ndjson':
+        for batch in batches:
+            yield ''.join(json.dumps(row, cls=DjangoJSONEncoder,
+                                     ensure_ascii=False) + '\n'
+                          for row in batch)
+        return
+    writer = csv.writer(_Echo())
+    if header if header is not None else after is None:
+        yield writer.writerow(export.columns)
+    for batch in batches:
+        yield ''.join(writer.writerow(
+            [export.csv_value(c, row[c]) for c in export.columns])
+            for row in batch)
+
+
+def resume_point(path, fmt):
+    """
+    (id последней целой записи, байт конца этой записи) в файле выгрузки.
+    Файл читается целиком, но построчно: в CSV запись может занимать
+    несколько строк, и найти её конец с хвоста файла нельзя.
+    """
+    last_id, offset, position, ended = None, 0, 0, True
+
+    def lines(fh):
+        nonlocal position, ended
+        for raw in fh:
+            position += len(raw)
+            ended = raw.endswith(b'\n')
+            # хвост может оборваться посреди символа — он всё равно не в счёт
+            yield raw.decode('utf-8', 'replace')
+
+    with open(path, 'rb') as fh:
+        if fmt == 'ndjson':
+            for line in lines(fh):
+                if ended and line.strip():
+                    last_id, offset = json.loads(line)['id'], position
+            return last_id, offset
+        try:
+            for row in csv.reader(lines(fh), strict=True):
+                if not ended:
+                    break           # обрыв посреди записи
+                if row and row[0].isdigit():
+                    last_id = int(row[0])
+                offset = position
+        except csv.Error:
+            pass                    # обрыв внутри поля в кавычках
+    return last_id, offset
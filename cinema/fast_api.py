@@ -0,0 +1,118 @@
+"""
+Быстрый путь списка фильмов в API (MovieViewSet.list).
+
+Строки берутся через values() с теми же фильтрами и сортировкой, жанры и
+актёры — словарями «фильм → [id]», по запросу на связь. Из них сразу
+собираются dict с теми же ключами, порядком и значениями, что у
+MovieSerializer, — без полей-объектов DRF на каждую ячейку. JSON пишет
+FastJSONRenderer: orjson, если он установлен, иначе обычный JSONRenderer.
+Ответ совпадает с ответом сериализатора байт в байт (см. тесты);
+выключается настройкой API_FAST_LIST = False.
+"""
+from collections import defaultdict
+
+from django.db.models import F
+from rest_framework.renderers import JSONRenderer
+
+from .models import Movie, MovieActor, MovieGenre
+from .serializers import poster_srcset, poster_variant_urls
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ROW_FIELDS = ('id', 'title', 'description', 'release_date', 'poster',
+              'poster_variants', 'trailer', 'trailer_url', 'country',
+              'main_genre', 'computed_rating')
+
+
+def movie_values(queryset):
+    """Та же выборка, что у сериализатора, но строками-словарями."""
+    return queryset.prefetch_related(None).values(
+        *ROW_FIELDS, country_name=F('country__name'),
+        main_genre_name=F('main_genre__name'),
+    )
+
+
+def _links(through, column, order, ids):
+    # порядок — как у prefetch_related: по Meta.ordering жанра/актёра
+    links = defaultdict(list)
+    for movie_id, pk in (through.objects.filter(movie_id__in=ids)
+                         .order_by(order).values_list('movie_id', column)):
+        links[movie_id].append(pk)
+    return links
+
+
+def movie_links(values):
+    """(жанры, актёры) строк — по запросу на связь."""
+    ids = [row['id'] for row in values]
+    return (_links(MovieGenre, 'genre_id', 'genre__name', ids),
+            _links(MovieActor, 'actor_id', 'actor__name', ids))
+
+
+def movie_rows(values, links, request=None, favorite_ids=None):
+    """Строки movie_values → то, что вернул бы MovieSerializer(many=True)."""
+    genres, actors = links
+    poster_storage = Movie._meta.get_field('poster').storage
+    trailer_storage = Movie._meta.get_field('trailer').storage
+    absolute = request.build_absolute_uri if request else (lambda url: url)
+    favorite_ids = favorite_ids or ()
+
+    rows = []
+    for row in values:
+        poster, variants = row['poster'], row['poster_variants']
+        has_variants = bool(poster) and variants.get('source') == poster
+        rows.append({
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'release_date': row['release_date'].isoformat(),
+            'poster': absolute(poster_storage.url(poster))
+            if poster else None,
+            'poster_variants': poster_variant_urls(
+                variants, poster_storage, absolute) if has_variants else None,
+            'poster_srcset': poster_srcset(
+                variants, poster_storage, absolute) if has_variants else '',
+            'trailer': absolute(trailer_storage.url(row['trailer']))
+            if row['trailer'] else None,
+            'trailer_url': row['trailer_url'],
+            'country': row['country'],
+            'country_name': row['country_name'],
+            'main_genre': row['main_genre'],
+            'main_genre_name': row['main_genre_name'],
+            'genres': genres[row['id']],
+            'actors': actors[row['id']],
+            'average_rating': row['computed_rating'],
+            'is_favorite': row['id'] in favorite_ids,
+        })
+    return rows
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson с тем же выводом: строки, ключи и числа
+    пишутся одинаково, даты/Decimal и прочее уходят в энкодер DRF.
+    Отступы (браузерный API), ensure_ascii и всё, чего orjson не умеет
+    (ключи не-строки, int шире 64 бит), — обычным путём.
+    Дробные вне [1e-4, 1e16) orjson пишет иначе (1e16, а не 1e+16);
+    в ответах фильмов дробное одно — средняя оценка 1–10.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or \
+                not self.compact or self.get_indent(
+                    accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME |
+                orjson.OPT_PASSTHROUGH_DATACLASS)
+        except TypeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # как JSONRenderer: разделители строк JavaScript экранируются
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028') \
+                  .replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -1,9 +1,23 @@
+import datetime
+
 import django_filters as df
-from django.db.models import Avg
+from django.core.validators import EMPTY_VALUES
 
 from .models import Movie, Genre, Country
 
 
+class RatingFilter(df.NumberFilter):
+    """
+    Граница по avg_rating. У фильмов без одобренных оценок там 0 — они
+    не подходят ни под какую границу, как и NULL при подсчёте Avg().
+    """
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return super().filter(qs, value).filter(avg_rating__gt=0)
+
+
 class MovieFilter(df.FilterSet):
     # текстовый поиск (НЕчувствительный) — __icontains
     title = df.CharFilter(field_name='title',
@@ -29,16 +43,16 @@ class MovieFilter(df.FilterSet):
         to_field_name='id', label='Страна'
     )
 
-    # рейтинг
-    min_rating = df.NumberFilter(field_name='computed_rating',
-                                 lookup_expr='gte', label='Мин. рейтинг')
-    max_rating = df.NumberFilter(field_name='computed_rating',
-                                 lookup_expr='lte', label='Макс. рейтинг')
+    # рейтинг — по денормализованному avg_rating (индекс), а не HAVING;
+    # показывается он же (computed_rating в with_computed_rating)
+    min_rating = RatingFilter(field_name='avg_rating',
+                              lookup_expr='gte', label='Мин. рейтинг')
+    max_rating = RatingFilter(field_name='avg_rating',
+                              lookup_expr='lte', label='Макс. рейтинг')
 
-    # дата
-    release_year = df.NumberFilter(
-        field_name='release_date', lookup_expr='year', label='Год выпуска'
-    )
+    # дата — диапазоном: __year оборачивает столбец в функцию
+    release_year = df.NumberFilter(method='filter_release_year',
+                                   label='Год выпуска')
 
     class Meta:
         model = Movie
@@ -46,6 +60,11 @@ class MovieFilter(df.FilterSet):
                   'main_genre', 'country', 'min_rating', 'max_rating',
                   'release_year']
 
-    @classmethod
-    def annotate_queryset(cls, qs):
-        return qs.annotate(computed_rating=Avg('reviews__rating'))
+    def filter_release_year(self, qs, name, value):
+        if value is None:
+            return qs
+        year = int(value)
+        if not datetime.MINYEAR <= year < datetime.MAXYEAR:
+            return qs.none()
+        return qs.filter(release_date__gte=datetime.date(year, 1, 1),
+                         release_date__lt=datetime.date(year + 1, 1, 1))
@@ -8,6 +8,7 @@ from django.contrib.auth.forms import (UserCreationForm,
 from django.utils import timezone
 
 from .models import Movie, Review, Session, Ticket
+from .moderation import find_banned_words
 
 User = get_user_model()
 
@@ -74,8 +75,7 @@ class ReviewForm(forms.ModelForm):
 
     def clean_review_text(self):
         text = self.cleaned_data.get('review_text', '').lower()
-        from django.conf import settings
-        if any(bad in text for bad in settings.BANNED_WORDS):
+        if find_banned_words(text):
             raise forms.ValidationError('Текст содержит запрещённые слова.')
         return text
 
@@ -95,7 +95,7 @@ class TicketPurchaseForm(forms.Form):
         super().__init__(*args, **kwargs)
         qs = (Session.objects
               .filter(movie=movie, starts_at__gt=timezone.now())
-              .select_related('hall__cinema'))
+              .select_related('movie', 'hall__cinema'))
         self.fields['session'].queryset = qs
         self.movie = movie
 
@@ -105,11 +105,14 @@ class TicketPurchaseForm(forms.Form):
         if not session:
             return cleaned
 
+        # свободное место выбирается здесь же: представлению не нужно
+        # повторять те же два запроса
         seats_qs = session.hall.seats.all()
+        cleaned['seat'] = None
         if seats_qs.exists():
             taken = session.tickets.values_list('seat_id', flat=True)
-            has_free = seats_qs.exclude(id__in=taken).exists()
-            if not has_free:
+            cleaned['seat'] = seats_qs.exclude(id__in=taken).first()
+            if cleaned['seat'] is None:
                 raise forms.ValidationError(
                     'На выбранный сеанс нет свободных мест.'
                 )
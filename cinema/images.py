@@ -0,0 +1,102 @@
+"""
+Превью и адаптивные варианты постеров.
+
+После загрузки постера в фоне (cinema.tasks) строятся миниатюра
+фиксированного размера и уменьшенные копии по ширинам в WebP и JPEG
+(ключ — настоящая ширина копии). CAS-хранилище кладёт каждый вариант
+под хэшем его байтов, поэтому повторная генерация не плодит копий.
+Список вариантов хранится в Movie.poster_variants.
+"""
+import hashlib
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+
+from . import api_cache, tasks
+from .storage import replace_references
+
+THUMB_SIZE = (120, 180)
+WIDTHS = (320, 640, 960)
+FORMATS = (('webp', 'WEBP', {'quality': 80, 'method': 4}),
+           ('jpg', 'JPEG', {'quality': 82, 'optimize': True,
+                            'progressive': True}))
+
+
+def _encode(img, fmt, options):
+    buf = io.BytesIO()
+    img.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def _store(storage, base, label, img):
+    names = {}
+    for ext, fmt, options in FORMATS:
+        # CAS сам отдаёт существующий блоб для тех же байтов
+        names[ext] = storage.save(f'{base}.{label}.{ext}',
+                                  ContentFile(_encode(img, fmt, options)))
+    return names
+
+
+def build_variants(storage, source):
+    """Строит варианты для файла source и возвращает их описание."""
+    from PIL import Image, ImageOps
+
+    with storage.open(source, 'rb') as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem = posixpath.splitext(source)[0]
+    base = f'{stem}.{digest}'
+
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        variants = {
+            'source': source,
+            'thumb': _store(storage, base, 'thumb',
+                            ImageOps.fit(img, THUMB_SIZE,
+                                         Image.Resampling.LANCZOS)),
+            'widths': {},
+        }
+        for width in WIDTHS:
+            # не увеличиваем: самая узкая копия есть всегда,
+            # но в srcset она идёт под своей настоящей шириной
+            if width > img.width and variants['widths']:
+                break
+            width = min(width, img.width)
+            resized = img.resize((width, round(img.height * width / img.width)),
+                                 Image.Resampling.LANCZOS)
+            variants['widths'][str(width)] = _store(storage, base,
+                                                    f'w{width}', resized)
+    return variants
+
+
+def variant_names(variants):
+    names = set((variants.get('thumb') or {}).values())
+    for formats in (variants.get('widths') or {}).values():
+        names.update(formats.values())
+    return names
+
+
+def generate_poster_variants(movie_id, source):
+    from .models import Movie
+
+    movie = Movie.objects.filter(pk=movie_id, poster=source).first()
+    if movie is None:          # постер уже успели заменить
+        return None
+    storage = movie.poster.storage
+    variants = build_variants(storage, source)
+    updated = (Movie.objects.filter(pk=movie_id, poster=source)
+               .update(poster_variants=variants))
+    if updated:
+        api_cache.bump(Movie)
+        replace_references(storage, variant_names(movie.poster_variants),
+                           variant_names(variants))
+    return variants
+
+
+def delete_variants(storage, variants):
+    replace_references(storage, variant_names(variants), ())
+
+
+def schedule_poster_variants(movie_id, source):
+    return tasks.submit(generate_poster_variants, movie_id, source)
@@ -0,0 +1,291 @@
+"""
+Поиск запросов без подходящего индекса.
+
+Представительный набор страниц и API прогоняется тестовым клиентом
+на засеянных данных внутри транзакции, которая затем откатывается.
+Все SELECT-запросы перехватываются через connection.execute_wrapper,
+для каждого снимается план (EXPLAIN QUERY PLAN в SQLite, EXPLAIN
+в PostgreSQL). Полные просмотры таблиц и временные B-деревья для
+сортировки попадают в отчёт вместе с предлагаемым Meta.indexes.
+"""
+import datetime
+import re
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+_COLUMN_RE = r'"(?P<table>\w+)"\."(?P<column>\w+)"'
+_EQ_RE = re.compile(_COLUMN_RE + r'\s*(?:=|IN\s*\(|IS\s+NULL)')
+# голый булев столбец: WHERE "t"."flag" / WHERE NOT "t"."flag"
+_BOOL_RE = re.compile(r'(?P<not>NOT\s+)?' + _COLUMN_RE
+                      + r'(?=\s*(?:\)|AND\b|OR\b|$))')
+_RANGE_RE = re.compile(_COLUMN_RE + r'\s*(?:<|>|BETWEEN)')
+_ORDER_RE = re.compile(_COLUMN_RE + r'(?P<desc>\s+DESC)?')
+# SQLite: «SCAN cinema_review», «USE TEMP B-TREE FOR ORDER BY»
+_SQLITE_SCAN_RE = re.compile(r'^\s*SCAN (?:TABLE )?(\w+)(?:\s+AS\s+\w+)?\s*$')
+_PG_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+
+class _Rollback(Exception):
+    pass
+
+
+@dataclass
+class Finding:
+    sql: str
+    table: str
+    problems: list
+    plan: list
+    views: set = field(default_factory=set)
+    fields: list = field(default_factory=list)
+    condition: dict = field(default_factory=dict)
+
+    @property
+    def model(self):
+        return model_for_table(self.table)
+
+    def index_suggestion(self):
+        if not self.fields or self.model is None:
+            return None
+        parts = [f.lstrip('-') for f in self.fields] + list(self.condition)
+        name = f'{self.table.split("_", 1)[-1]}_{"_".join(parts)}'[:26]
+        condition = ''
+        if self.condition:
+            args = ', '.join(f'{k}={v!r}' for k, v in self.condition.items())
+            condition = f', condition=Q({args})'
+        return (f'models.Index(fields={self.fields!r}{condition}, '
+                f'name={name + "_idx"!r})')
+
+
+def model_for_table(table):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+def _field_name(model, column):
+    for f in model._meta.concrete_fields:
+        if f.column == column:
+            return f.name
+    return None
+
+
+# ─────────── перехват и планы ───────────
+@contextmanager
+def capture_selects(sink, label):
+    """Складывает SELECT-запросы в sink: {(sql, params): set(меток)}."""
+    def wrapper(execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            key = (sql, tuple(params or ()))
+            sink.setdefault(key, set()).add(label)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield
+
+
+def explain(sql, params):
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def plan_problems(plan):
+    """[(таблица или None, описание)] для подозрительных узлов плана."""
+    problems = []
+    for line in plan:
+        if connection.vendor == 'sqlite':
+            match = _SQLITE_SCAN_RE.search(line)
+            if match:
+                problems.append((match.group(1), line.strip()))
+            elif 'TEMP B-TREE' in line:
+                problems.append((None, line.strip()))
+        else:
+            match = _PG_SCAN_RE.search(line)
+            if match:
+                problems.append((match.group(1), line.strip()))
+            elif re.search(r'\bSort\b', line):
+                problems.append((None, line.strip()))
+    return problems
+
+
+def suggest_index(sql, table):
+    """
+    (поля, условие) составного индекса для table по тексту запроса:
+    сначала равенства из WHERE, затем диапазоны, затем ORDER BY.
+    Голые булевы условия уходят в условие частичного индекса —
+    SQLite не использует столбец индекса для «WHERE flag» без «= 1».
+    """
+    model = model_for_table(table)
+    if model is None:
+        return [], {}
+    upper = sql.upper()
+    where_at = upper.find(' WHERE ')
+    order_at = upper.rfind(' ORDER BY ')
+    where = sql[where_at:order_at if order_at > where_at else None] \
+        if where_at >= 0 else ''
+    order = sql[order_at:] if order_at >= 0 else ''
+    order = re.split(r'\sLIMIT\s', order, flags=re.I)[0]
+
+    result, condition = [], {}
+    for match in _BOOL_RE.finditer(where):
+        name = _field_name(model, match['column'])
+        if (match['table'] == table and name and
+                model._meta.get_field(name).get_internal_type()
+                == 'BooleanField'):
+            condition[name] = not match['not']
+
+    def add(column, desc=False):
+        name = _field_name(model, column)
+        if name and name not in (f.lstrip('-') for f in result):
+            result.append(f'-{name}' if desc else name)
+
+    for regex in (_EQ_RE, _RANGE_RE):
+        for match in regex.finditer(where):
+            if match['table'] == table:
+                add(match['column'])
+    for match in _ORDER_RE.finditer(order):
+        if match['table'] == table:
+            add(match['column'], bool(match['desc']))
+    if result and result[0].lstrip('-') == model._meta.pk.name:
+        return [], {}                               # хватает первичного ключа
+    return result, condition
+
+
+def analyze(captured):
+    """Находки по перехваченным запросам, без дублей по (таблица, поля)."""
+    findings = OrderedDict()
+    for (sql, params), views in captured.items():
+        plan = explain(sql, params)
+        problems = plan_problems(plan)
+        if not problems:
+            continue
+        tables = {t for t, _ in problems if t} or \
+            set(re.findall(r'FROM "(\w+)"', sql)[:1])
+        for table in tables:
+            if model_for_table(table) is None:    # подзапрос, CTE и т. п.
+                continue
+            fields, condition = suggest_index(sql, table)
+            key = (table, tuple(fields), tuple(condition.items()))
+            finding = findings.get(key)
+            if finding is None:
+                finding = findings[key] = Finding(
+                    sql=sql, table=table, plan=plan, fields=fields,
+                    condition=condition,
+                    problems=[p for t, p in problems if t in (table, None)],
+                )
+            finding.views |= views
+    return list(findings.values())
+
+
+# ─────────── засев и сценарии ───────────
+def seed(movies=30, users=20):
+    """Небольшой, но неоднородный набор данных для планировщика."""
+    from .models import (Cinema, Country, Favorite, Genre, Hall, Movie,
+                         Review, Session, Ticket, User)
+
+    country = Country.objects.create(name='Страна для проверки индексов')
+    genre = Genre.objects.create(name='Жанр для проверки индексов')
+    film_list = Movie.objects.bulk_create(
+        Movie(title=f'Фильм {i}', description='…', country=country,
+              main_genre=genre,
+              release_date=datetime.date(2000 + i % 25, 1 + i % 12, 1))
+        for i in range(movies)
+    )
+    people = User.objects.bulk_create(
+        User(username=f'index-advisor-{i}', password='!') for i in range(users)
+    )
+    staff = User.objects.create_user('index-advisor-staff', is_staff=True)
+    now = timezone.now()
+    Review.objects.bulk_create(
+        Review(movie=film_list[i % movies], user=people[i % users],
+               rating=1 + i % 10, is_approved=i % 3 != 0,
+               created_at=now - datetime.timedelta(hours=i))
+        for i in range(movies * 10)
+    )
+    Movie.objects.refresh_avg_rating(m.pk for m in film_list)  # bulk
+    Favorite.objects.bulk_create(
+        Favorite(user=people[i % users],
+                 movie=film_list[(i // users) % movies])
+        for i in range(min(movies * users, 200))
+    )
+    cinema = Cinema.objects.create(name='Кинотеатр для проверки индексов',
+                                   address='—', lat=0, lng=0)
+    hall = Hall.objects.create(cinema=cinema, name='1', rows=5,
+                               seats_per_row=10)
+    sessions = Session.objects.bulk_create(
+        Session(movie=film_list[i % movies], hall=hall,
+                starts_at=now + datetime.timedelta(hours=i - 20),
+                price=Decimal('300.00'))
+        for i in range(movies * 3)
+    )
+    seats = list(hall.seats.all())
+    Ticket.objects.bulk_create(
+        Ticket(user=people[i % users], session=sessions[i % len(sessions)],
+               seat=seats[i // len(sessions)],
+               purchased_at=now - datetime.timedelta(minutes=i))
+        for i in range(min(len(sessions) * len(seats), 400))
+    )
+    return {'movie': film_list[0], 'user': people[0], 'staff': staff}
+
+
+def scenarios(data):
+    """(метка, url, пользователь или None) — что прогонять."""
+    movie = data['movie'].pk
+    return [
+        ('home', reverse('cinema:home'), None),
+        ('movie-list', reverse('cinema:movie-list'), None),
+        ('movie-detail', reverse('cinema:movie-detail', args=[movie]), None),
+        ('ticket-buy', reverse('cinema:ticket-buy', args=[movie]),
+         data['user']),
+        ('ticket-list', reverse('cinema:ticket-list'), data['user']),
+        ('favorite-list', reverse('cinema:favorite-list'), data['user']),
+        ('recommendations', reverse('cinema:recommendations'), data['user']),
+        ('review-moderation', reverse('cinema:review-moderation'),
+         data['staff']),
+        ('api-movies', reverse('cinema:movie-api-list'), data['user']),
+        ('api-movie-reviews',
+         reverse('cinema:movie-api-reviews', args=[movie]), None),
+        ('api-reviews', reverse('cinema:review-api-list')
+         + f'?movie={movie}&is_approved=true', data['user']),
+        ('api-pending', reverse('cinema:review-api-pending'), data['staff']),
+    ]
+
+
+def run(extra_scenarios=()):
+    """
+    Засевает данные, прогоняет сценарии и возвращает
+    (находки, {метка: HTTP-статус}). Всё откатывается.
+    """
+    captured, statuses = {}, {}
+    findings = []
+    hosts = ['testserver', *settings.ALLOWED_HOSTS]
+    try:
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=hosts):
+            data = seed()
+            client = Client()
+            for label, url, user in [*scenarios(data), *extra_scenarios]:
+                if user is None:
+                    client.logout()
+                else:
+                    client.force_login(user)
+                with capture_selects(captured, label):
+                    statuses[label] = client.get(url).status_code
+            findings = analyze(captured)
+            raise _Rollback
+    except _Rollback:
+        pass
+    return findings, statuses
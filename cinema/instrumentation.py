@@ -0,0 +1,337 @@
+"""
+Счётчики SQL и времени по представлениям.
+
+QueryInstrumentationMiddleware на каждый запрос ставит обёртку
+execute_wrapper на все соединения и собирает: число запросов, время
+в БД, «отпечатки» запросов (SQL без литералов) и время рендера шаблона.
+Повтор одного отпечатка N_PLUS_ONE_THRESHOLD раз и больше считается
+N+1. Представление может объявить бюджет атрибутом query_budget
+(число запросов); превышение и N+1 пишутся в лог, а при
+QUERY_BUDGET_RAISE=True — поднимают QueryBudgetExceeded.
+
+Суммы копятся в памяти процесса и отдаются в формате Prometheus
+по /metrics. Без METRICS_DIR это счётчики одного процесса — того, что
+ответил на запрос Prometheus. С METRICS_DIR (как multiprocess-режим
+prometheus_client) каждый процесс не чаще раза в METRICS_FLUSH_INTERVAL
+и при выходе пишет свои суммы в отдельный файл, а /metrics складывает
+все файлы каталога; каталог очищают при деплое. В тестах то же самое
+проверяет QueryBudget.
+"""
+import atexit
+import bisect
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*(?:%s|\?|#)(?:\s*,\s*(?:%s|\?|#))*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """SQL без литералов и с одинаковыми IN-списками — «форма» запроса."""
+    sql = _STRING_RE.sub('#', sql)
+    sql = _NUMBER_RE.sub('#', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, threshold=None):
+        """{отпечаток: повторов} для подозрений на N+1."""
+        if threshold is None:
+            threshold = settings.N_PLUS_ONE_THRESHOLD
+        return {fp: n for fp, n in self.fingerprints.items()
+                if n >= threshold}
+
+
+_current = contextvars.ContextVar('request_query_stats', default=None)
+
+
+class record_queries:
+    """Контекстный менеджер: считает запросы на всех соединениях."""
+
+    def __enter__(self):
+        self.stats = RequestStats()
+        self._token = _current.set(self.stats)
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(
+                connections[alias].execute_wrapper(self.stats))
+        return self.stats
+
+    def __exit__(self, *exc):
+        self._stack.close()
+        _current.reset(self._token)
+        return False
+
+
+# ─────────── агрегаты для /metrics ───────────
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.views = {}
+        self._pid = os.getpid()
+        # pid переиспользуется: без метки времени новый воркер
+        # затёр бы файл умершего, и счётчики «откатились» бы назад
+        self._file = f'{self._pid}-{time.time_ns()}.json'
+        self._flushed_at = 0.0
+
+    def observe(self, view, stats, duration, n_plus_one, over_budget):
+        with self._lock:
+            if self._pid != os.getpid():    # воркер после fork()
+                self.reset()
+            row = self.views.setdefault(view, {
+                'requests': 0, 'queries': 0, 'db_seconds': 0.0,
+                'template_seconds': 0.0, 'seconds': 0.0,
+                'n_plus_one': 0, 'over_budget': 0,
+                'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            })
+            row['requests'] += 1
+            row['queries'] += stats.queries
+            row['db_seconds'] += stats.db_time
+            row['template_seconds'] += stats.template_time
+            row['seconds'] += duration
+            row['n_plus_one'] += bool(n_plus_one)
+            row['over_budget'] += bool(over_budget)
+            row['buckets'][bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+        self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {view: {**row, 'buckets': list(row['buckets'])}
+                    for view, row in self.views.items()}
+
+    def flush(self, force=False):
+        """Записать суммы процесса в METRICS_DIR (если задан)."""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or not force and \
+                now - self._flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self.reset()
+        self._flushed_at = now
+        path = Path(directory) / self._file
+        tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path)
+
+
+registry = _Registry()
+atexit.register(lambda: registry.flush(force=True))
+
+
+def _merge(total, snapshot):
+    for view, row in snapshot.items():
+        into = total.get(view)
+        if into is None:
+            total[view] = {**row, 'buckets': list(row['buckets'])}
+            continue
+        for key, value in row.items():
+            if key == 'buckets':
+                into[key] = [a + b for a, b in zip(into[key], value)]
+            else:
+                into[key] += value
+    return total
+
+
+def collect():
+    """Суммы для /metrics: по всем процессам, если задан METRICS_DIR."""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return registry.snapshot()
+    registry.flush(force=True)
+    total = {}
+    for path in sorted(Path(directory).glob('*.json')):
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):       # файл удалили при деплое
+            continue
+        _merge(total, snapshot)
+    return total
+
+
+_COUNTERS = (
+    ('requests', 'mafisha_view_requests_total', 'Обработано запросов'),
+    ('queries', 'mafisha_view_queries_total', 'SQL-запросов'),
+    ('db_seconds', 'mafisha_view_db_seconds_total', 'Время в БД, с'),
+    ('template_seconds', 'mafisha_view_template_seconds_total',
+     'Время рендера шаблонов, с'),
+    ('n_plus_one', 'mafisha_view_n_plus_one_total',
+     'Запросов с признаками N+1'),
+    ('over_budget', 'mafisha_view_query_budget_exceeded_total',
+     'Запросов сверх бюджета'),
+)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_metrics(snapshot):
+    lines = []
+    for key, name, help_text in _COUNTERS:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [f'{name}{{view="{_label(view)}"}} {row[key]}'
+                  for view, row in sorted(snapshot.items())]
+
+    name = 'mafisha_view_duration_seconds'
+    lines += [f'# HELP {name} Длительность обработки запроса, с',
+              f'# TYPE {name} histogram']
+    for view, row in sorted(snapshot.items()):
+        label = _label(view)
+        total = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), row['buckets']):
+            total += count
+            lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} '
+                         f'{total}')
+        lines.append(f'{name}_sum{{view="{label}"}} {row["seconds"]}')
+        lines.append(f'{name}_count{{view="{label}"}} {row["requests"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Метрики Prometheus: для персонала или по METRICS_TOKEN."""
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    allowed = (getattr(request, 'user', None) is not None
+               and request.user.is_staff) or \
+        (token and constant_time_compare(header, f'Bearer {token}'))
+    if not allowed:
+        raise PermissionDenied
+    return HttpResponse(render_metrics(collect()),
+                        content_type='text/plain; version=0.0.4')
+
+
+# ─────────── middleware ───────────
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+def view_budget(request):
+    match = getattr(request, 'resolver_match', None)
+    func = getattr(match, 'func', None)
+    # @action(query_budget=…) у отдельного действия DRF-вьюсета
+    initkwargs = getattr(func, 'initkwargs', None) or {}
+    if 'query_budget' in initkwargs:
+        return initkwargs['query_budget']
+    view_class = getattr(func, 'view_class', None) or \
+        getattr(func, 'cls', None)
+    return getattr(view_class or func, 'query_budget', None)
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with record_queries() as stats:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view = view_name(request)
+        if view == 'metrics':
+            return response
+        budget = view_budget(request)
+        over_budget = budget is not None and stats.queries > budget
+        repeated = stats.repeated()
+        registry.observe(view, stats, duration, repeated, over_budget)
+
+        problems = []
+        if over_budget:
+            problems.append(f'{stats.queries} SQL-запросов при бюджете '
+                            f'{budget}')
+        problems += [f'N+1: {n}× {fp}' for fp, n in repeated.items()]
+        if problems:
+            message = f'{view}: ' + '; '.join(problems)
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_template_response(self, request, response):
+        # рендерим сами, чтобы засечь время; повторный render() — no-op
+        stats = _current.get()
+        if stats is not None:
+            kind = 'renderer' if hasattr(response, 'accepted_renderer') \
+                else 'template'
+            started = time.perf_counter()
+            with span('render', kind=kind):
+                response.render()
+            stats.template_time += time.perf_counter() - started
+        return response
+
+
+# ─────────── для тестов ───────────
+class QueryBudget(record_queries):
+    """
+    with QueryBudget(5): self.client.get(url)
+    Падает AssertionError, если запросов больше бюджета или есть N+1.
+    """
+
+    def __init__(self, queries, n_plus_one_threshold=None):
+        self.budget = queries
+        self.threshold = n_plus_one_threshold
+
+    def __exit__(self, exc_type, *exc):
+        super().__exit__(exc_type, *exc)
+        if exc_type is not None:
+            return False
+        repeated = self.stats.repeated(self.threshold)
+        if self.stats.queries > self.budget or repeated:
+            details = '\n'.join(f'  {n}× {fp}' for fp, n in
+                                self.stats.fingerprints.most_common())
+            raise AssertionError(
+                f'{self.stats.queries} SQL-запросов при бюджете '
+                f'{self.budget}, повторы: {len(repeated)}\n{details}'
+            )
+        return False
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from cinema import index_advisor
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет основные страницы и API на засеянных данных, '
+            'снимает планы запросов и предлагает недостающие индексы. '
+            'Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true',
+                            help='печатать полный план и SQL')
+
+    def handle(self, plans, **options):
+        findings, statuses = index_advisor.run()
+        for label, code in statuses.items():
+            if code >= 400:
+                self.stderr.write(f'{label}: HTTP {code}')
+
+        if not findings:
+            self.stdout.write(self.style.SUCCESS(
+                'Полных просмотров и сортировок во временных B-деревьях '
+                'не найдено.'))
+            return
+
+        for finding in findings:
+            model = finding.model
+            title = model.__name__ if model else finding.table
+            self.stdout.write(self.style.WARNING(
+                f'{title} ({", ".join(sorted(finding.views))})'))
+            for problem in finding.problems:
+                self.stdout.write(f'    {problem}')
+            suggestion = finding.index_suggestion()
+            if suggestion:
+                self.stdout.write(f'    → {suggestion}')
+            if plans:
+                self.stdout.write(f'    SQL: {finding.sql}')
+                for line in finding.plan:
+                    self.stdout.write(f'      | {line}')
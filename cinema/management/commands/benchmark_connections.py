@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory, override_settings
+
+
+def _consume(handler, environ):
+    status = []
+    result = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+    try:
+        for _chunk in result:
+            pass
+    finally:
+        result.close()          # request_finished → close_old_connections
+    return status[0]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку запроса с новым соединением к БД на '
+            'каждый запрос (CONN_MAX_AGE=0) и с повторным использованием.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/movies/')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--max-age', type=int, default=600,
+                            help='CONN_MAX_AGE для режима с повторным '
+                                 'использованием')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, path, requests, max_age, database, **options):
+        conn = connections[database]
+        options = conn.settings_dict['OPTIONS']
+        pool = options.get('pool')
+        if pool:
+            # пул закэширован на уровне класса и не совместим с
+            # CONN_MAX_AGE≠0 — закрываем его и меряем голые соединения
+            self.stdout.write('Включён пул psycopg: на время замера он '
+                              'выключен, сравниваем соединения без него.')
+            conn.close()
+            conn.close_pool()
+            del options['pool']
+        environ = RequestFactory().get(path).environ
+        handler = WSGIHandler()
+        original = conn.settings_dict['CONN_MAX_AGE']
+        hosts = ['testserver', *settings.ALLOWED_HOSTS]
+
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=hosts):
+                for label, age in (('новое соединение', 0),
+                                   ('повторное', max_age)):
+                    conn.close()
+                    conn.settings_dict['CONN_MAX_AGE'] = age
+                    _consume(handler, dict(environ))           # прогрев
+                    timings = []
+                    for _ in range(requests):
+                        started = time.perf_counter()
+                        status = _consume(handler, dict(environ))
+                        timings.append((time.perf_counter() - started) * 1000)
+                    results[label] = timings
+        finally:
+            conn.close()
+            conn.settings_dict['CONN_MAX_AGE'] = original
+            if pool:
+                options['pool'] = pool        # пул создастся заново
+
+        self.stdout.write(f'{path}: {status}, {requests} запросов, '
+                          f'{conn.vendor}')
+        for label, timings in results.items():
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            self.stdout.write(
+                f'{label:>17}: медиана {statistics.median(timings):7.2f} мс, '
+                f'p95 {p95:7.2f} мс'
+            )
@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from cinema.moderation import BannedWordMatcher
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def legacy_scan(words, text):
+    """Прежняя проверка из Review.clean: подстрока на каждое слово."""
+    return {w for w in words if w in text.lower()}
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость проверки запрещённых слов: старый цикл '
+            'по словам против скомпилированного матчера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=5000)
+        parser.add_argument('--text-length', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, words, text_length, repeat, seed, **options):
+        rnd = random.Random(seed)
+
+        def word(lo, hi):
+            return ''.join(rnd.choice(ALPHABET)
+                           for _ in range(rnd.randint(lo, hi)))
+
+        banned = {word(4, 12) for _ in range(words)}
+        texts = []
+        for _ in range(repeat):
+            parts, size = [], 0
+            while size < text_length:
+                parts.append(word(2, 10))
+                size += len(parts[-1]) + 1
+            texts.append(' '.join(parts))
+
+        started = time.perf_counter()
+        matcher = BannedWordMatcher(banned)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        results = {}
+        for name, scan in (('legacy', lambda t: legacy_scan(banned, t)),
+                           ('compiled', matcher.scan)):
+            started = time.perf_counter()
+            found = [scan(t) for t in texts]
+            elapsed = time.perf_counter() - started
+            results[name] = found
+            self.stdout.write(
+                f'{name:>9}: {elapsed / repeat * 1e6:10.1f} мкс/текст'
+            )
+        self.stdout.write(f'компиляция матчера: {compile_ms:.1f} мс '
+                          f'({len(banned)} слов)')
+
+        # новый матчер строже (омоглифы), поэтому сравниваем, что он
+        # не пропускает ничего из найденного старым
+        missed = sum(bool(set(a) - set(b)) for a, b in
+                     zip(results['legacy'], results['compiled']))
+        self.stdout.write(f'текстов, где новый матчер что-то упустил: '
+                          f'{missed}')
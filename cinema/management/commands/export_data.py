@@ -0,0 +1,58 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema import exports
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает фильмы, одобренные отзывы или билеты '
+            'в NDJSON/CSV. С --resume дописывает файл после последней '
+            'целой записи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(exports.EXPORTS))
+        parser.add_argument('--format', dest='fmt', default='ndjson',
+                            choices=list(exports.FORMATS))
+        parser.add_argument('--output', '-o',
+                            help='файл (по умолчанию stdout)')
+        parser.add_argument('--after', type=int,
+                            help='начать после этого id')
+        parser.add_argument('--resume', action='store_true',
+                            help='продолжить незаконченный --output')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, kind, fmt, output, after, resume, chunk_size,
+               **options):
+        export = exports.EXPORTS[kind]
+        header = None
+        mode = 'w'
+        if resume:
+            if not output:
+                raise CommandError('--resume требует --output.')
+            try:
+                last_id, offset = exports.resume_point(output, fmt)
+            except FileNotFoundError:
+                last_id, offset = None, 0
+            else:
+                # недописанный хвост отрезаем, дальше — дописываем
+                with open(output, 'r+b') as fh:
+                    fh.truncate(offset)
+                mode = 'a'
+            after = last_id if last_id is not None else after
+            header = offset == 0
+            self.stderr.write(f'Продолжаем после id={last_id} '
+                              f'(с байта {offset}).')
+
+        out = open(output, mode, encoding='utf-8', newline='') \
+            if output else sys.stdout
+        chunks = 0
+        try:
+            for text in exports.stream(export, fmt, after, chunk_size,
+                                       header):
+                out.write(text)
+                chunks += 1
+        finally:
+            if output:
+                out.close()
+        self.stderr.write(f'Записано кусков: {chunks}.')
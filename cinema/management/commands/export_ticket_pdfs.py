@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema import pdf
+from cinema.models import Ticket
+
+
+class Command(BaseCommand):
+    help = 'Выгружает PDF-квитанции билетов в ZIP, рендеря их на всех ядрах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=Path, help='путь к .zip')
+        parser.add_argument('--session', type=int, action='append',
+                            dest='sessions', help='id сеанса (можно повторять)')
+        parser.add_argument('--status', choices=Ticket.Status.values)
+        parser.add_argument('--workers', type=int,
+                            help='процессов рендера, по умолч. по числу ядер')
+
+    def handle(self, output, sessions, status, workers, **options):
+        qs = Ticket.objects.all()
+        if sessions:
+            qs = qs.filter(session__in=sessions)
+        if status:
+            qs = qs.filter(status=status)
+        total = qs.count()
+        if not total:
+            raise CommandError('Под условия не попал ни один билет.')
+
+        def progress(done):
+            if done % 50 == 0 or done == total:
+                self.stdout.write(f'{done}/{total}')
+
+        files = pdf.iter_ticket_pdfs(pdf.export_queryset(qs),
+                                     workers=workers, progress=progress)
+        with output.open('wb') as fh:
+            for chunk in pdf.stream_zip(files):
+                fh.write(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {total} билетов → {output}'
+        ))
@@ -0,0 +1,32 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from cinema import storage
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из CAS-хранилища постеры и трейлеры, на которые '
+            'больше не ссылается ни один фильм.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='не трогать файлы моложе N часов '
+                                 '(загрузки, ещё не привязанные к фильму)')
+        parser.add_argument('--recount', action='store_true',
+                            help='сначала пересчитать ссылки по таблице '
+                                 'фильмов')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать, что будет удалено')
+
+    def handle(self, grace_hours, recount, dry_run, **options):
+        if recount:
+            fixed = storage.recount()
+            self.stdout.write(f'Исправлено счётчиков: {fixed}')
+        removed = storage.collect_garbage(
+            datetime.timedelta(hours=grace_hours), dry_run=dry_run
+        )
+        for name in removed:
+            self.stdout.write(f'  {name}')
+        verb = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{verb} файлов: {len(removed)}'))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema import datagen
+from cinema.models import Movie
+
+
+class Command(BaseCommand):
+    help = ('Заполняет БД синтетическими данными «как в продакшене» '
+            '(по умолчанию 100 тыс. фильмов, 5 млн отзывов, 3 млн билетов). '
+            '--scale 0.01 — сотая доля.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0)
+        for name in datagen.FULL_SIZES:
+            parser.add_argument(f'--{name}', type=int,
+                                help=f'точное число ({name})')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--append', action='store_true',
+                            help='дописывать в непустую БД')
+        parser.add_argument('--no-rollups', action='store_true',
+                            help='не пересобирать свёртки продаж')
+
+    def handle(self, scale, seed, batch_size, append, no_rollups, **options):
+        if Movie.objects.exists() and not append:
+            raise CommandError('В БД уже есть фильмы; добавьте --append, '
+                               'если данные нужно дописать.')
+        sizes = datagen.sizes_for(scale, **{
+            name: options[name] for name in datagen.FULL_SIZES})
+        self.stdout.write('Размеры: ' + ', '.join(
+            f'{k}={v}' for k, v in sizes.items()))
+
+        started = time.perf_counter()
+        last = {'label': None, 'at': 0.0}
+
+        def progress(label, done, total):
+            now = time.perf_counter()
+            if label != last['label'] or now - last['at'] > 2 \
+                    or done >= total:
+                last.update(label=label, at=now)
+                self.stdout.write(f'  {label}: {done}/{total} '
+                                  f'({now - started:.0f} с)')
+
+        datagen.generate(sizes, seed=seed, batch_size=batch_size,
+                         progress=progress)
+        if not no_rollups:
+            call_command('rebuild_sales_rollups', stdout=self.stdout)
+        for label, count in datagen.counts().items():
+            self.stdout.write(f'{label:>14}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.0f} с.'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from cinema import images
+from cinema.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Строит превью и WebP/JPEG-варианты для уже загруженных постеров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='пересобрать и те, у кого варианты есть')
+
+    def handle(self, force, **options):
+        done = failed = 0
+        movies = (Movie.objects.exclude(poster='').exclude(poster=None)
+                  .only('id', 'poster', 'poster_variants').iterator())
+        for movie in movies:
+            if movie.has_poster_variants and not force:
+                continue
+            try:
+                images.generate_poster_variants(movie.pk, movie.poster.name)
+                done += 1
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f'{movie.pk}: {exc}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {done}, ошибок: {failed}.'
+        ))
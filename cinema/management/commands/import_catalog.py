@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema import catalog_import
+
+
+class Command(BaseCommand):
+    help = ('Импортирует фильмы с жанрами и актёрами из JSONL или CSV '
+            'пачками по транзакции. --resume продолжает с контрольной '
+            'точки после сбоя.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=['jsonl', 'csv'],
+                            help='по умолчанию — по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint',
+                            help='файл контрольной точки '
+                                 '(по умолчанию <path>.checkpoint)')
+        parser.add_argument('--resume', action='store_true')
+        parser.add_argument('--rejects',
+                            help='куда писать отклонённые строки (JSONL)')
+
+    def handle(self, path, fmt, batch_size, checkpoint, resume, rejects,
+               **options):
+        def progress(stats, elapsed):
+            self.stdout.write(
+                f'  прочитано {stats["read"]}, создано {stats["created"]}, '
+                f'обновлено {stats["updated"]}, '
+                f'отклонено {stats["rejected"]} '
+                f'({stats["read"] / max(elapsed, 1e-6):.0f} строк/с)')
+
+        try:
+            stats = catalog_import.run(
+                path, fmt, batch_size, checkpoint, resume,
+                rejects or f'{path}.rejects.jsonl', progress)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: создано {stats["created"]}, обновлено '
+            f'{stats["updated"]}, отклонено {stats["rejected"]}.'))
@@ -0,0 +1,364 @@
+"""
+Нагрузочный стенд покупки билетов.
+
+На временной БД (DB_NAME во временном каталоге) создаются один сеанс
+в зале rows × seats и по пользователю на поток. Процессы × потоки
+одновременно покупают билеты через TicketPurchaseView, пока сеанс не
+распродан: тестовым клиентом Django (--transport client) или по HTTP
+через локальный многопоточный WSGI-сервер (--transport wsgi).
+
+Ограничение частоты (THROTTLE_RATES) в процессах стенда выключено:
+меряется борьба за места, а не лимит покупок на пользователя; если
+429 всё же пришёл — он считается отдельным исходом throttled.
+
+Итог: пропускная способность, задержки p50/p95/p99, исходы запросов
+(продано, «мест нет», нарушение уникальности, блокировка БД, отказ
+по частоте, прочие ошибки), двойные продажи и непроданные места. Так изменения в выборе
+места сравниваются по цифрам, а не на глаз.
+"""
+import http.client
+import logging
+import multiprocessing
+import os
+import queue
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+
+MODES = {'tuned': '1', 'default': '0'}
+SOLD_OUT = 'нет свободных мест'
+OUTCOMES = ('sold', 'sold_out', 'constraint', 'locked', 'throttled',
+            'error')
+
+
+def _setup(db_path, tuned):
+    os.environ['DB_NAME'] = db_path
+    os.environ['DB_SQLITE_TUNED'] = tuned
+    os.environ.pop('DB_ENGINE', None)
+    os.environ.pop('DB_REPLICAS', None)
+    import django
+    django.setup()
+    from django.test.utils import override_settings
+
+    # как в benchmarks.run: лимит покупок на пользователя — не то, что
+    # меряем, иначе при мест > лимита все «ошибки» окажутся 429
+    override_settings(THROTTLE_RATES={}).enable()
+    # ошибки считаются по видам; трассировки и бюджеты запросов — шум
+    logging.disable(logging.ERROR)
+
+
+def _prepare(db_path, tuned, rows, seats, buyers):
+    _setup(db_path, tuned)
+    from datetime import timedelta
+
+    from django.core.management import call_command
+    from django.utils import timezone
+
+    from cinema.models import (Cinema, Country, Genre, Hall, Movie, Session,
+                               User)
+
+    call_command('migrate', verbosity=0)
+    movie = Movie.objects.create(
+        title='Премьера', description='—', release_date='2020-01-01',
+        country=Country.objects.create(name='Страна'),
+        main_genre=Genre.objects.create(name='Жанр'),
+    )
+    cinema = Cinema.objects.create(name='Кинотеатр', address='—',
+                                   lat=0, lng=0)
+    hall = Hall.objects.create(cinema=cinema, name='Зал', rows=rows,
+                               seats_per_row=seats)
+    session = Session.objects.create(
+        movie=movie, hall=hall, price=300,
+        starts_at=timezone.now() + timedelta(days=1))
+    users = User.objects.bulk_create(
+        User(username=f'buyer-{i}', password='!') for i in range(buyers))
+    return movie.pk, session.pk, [u.pk for u in users]
+
+
+def _outcome(status, content):
+    if status == 302:
+        return 'sold'
+    if status == 200 and SOLD_OUT in content:
+        return 'sold_out'
+    if status == 429:
+        return 'throttled'
+    # вид ошибки 500 известен только обработчику исключений
+    return f'http_{status}'
+
+
+def _count_errors():
+    """Счётчик исключений в обработке запросов этого процесса."""
+    from django.core.signals import got_request_exception
+
+    errors = Counter()
+    lock = threading.Lock()
+
+    def on_exception(sender, request=None, **kwargs):
+        with lock:
+            errors[_classify(sys.exc_info()[1])] += 1
+
+    got_request_exception.connect(on_exception, weak=False)
+    return errors
+
+
+def _classify(exc):
+    from django.db import IntegrityError, OperationalError
+
+    if isinstance(exc, IntegrityError):
+        return 'constraint'
+    if isinstance(exc, OperationalError) and (
+            'locked' in str(exc) or 'busy' in str(exc)):
+        return 'locked'
+    return 'error'
+
+
+# ─────────── транспорт: тестовый клиент ───────────
+def _client_buyer(user_id, url, data, start_at, max_requests, results):
+    from django.db import connection
+    from django.test import Client
+
+    from cinema.models import User
+
+    # тестовый клиент не потокобезопасен в перехвате исключений
+    # (сигнал общий), поэтому ошибки считает _worker, а не клиент
+    client = Client(raise_request_exception=False)
+    client.force_login(User.objects.get(pk=user_id))
+    while time.time() < start_at:
+        time.sleep(0.001)
+    try:
+        for _ in range(max_requests):
+            started = time.perf_counter()
+            response = client.post(url, data)
+            outcome = _outcome(response.status_code,
+                               response.content.decode())
+            results.append((time.perf_counter() - started, outcome,
+                            time.time()))
+            if outcome == 'sold_out':
+                break
+    finally:
+        connection.close()
+
+
+# ─────────── транспорт: WSGI по HTTP ───────────
+def _serve(db_path, tuned, ready, stop, report):
+    _setup(db_path, tuned)
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                              WSGIRequestHandler)
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    errors = _count_errors()
+    httpd = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler,
+                               allow_reuse_address=True)
+    httpd.daemon_threads = True
+    httpd.set_app(WSGIHandler())
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    ready.put(httpd.server_address[1])
+    stop.wait()
+    httpd.shutdown()
+    report.put(dict(errors))
+
+
+def _http_buyer(user_id, url, data, start_at, max_requests, results, port):
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+    from django.utils.crypto import get_random_string
+
+    from cinema.models import User
+
+    # сессия пишется в общую БД — сервер её увидит
+    client = Client()
+    client.force_login(User.objects.get(pk=user_id))
+    connection.close()
+    csrf = get_random_string(32)
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Cookie': f'{settings.SESSION_COOKIE_NAME}='
+                  f'{client.cookies[settings.SESSION_COOKIE_NAME].value}; '
+                  f'{settings.CSRF_COOKIE_NAME}={csrf}',
+    }
+    body = urlencode({**data, 'csrfmiddlewaretoken': csrf})
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    while time.time() < start_at:
+        time.sleep(0.001)
+    try:
+        for _ in range(max_requests):
+            started = time.perf_counter()
+            conn.request('POST', url, body, headers)
+            response = conn.getresponse()
+            outcome = _outcome(response.status, response.read().decode())
+            results.append((time.perf_counter() - started, outcome,
+                            time.time()))
+            if outcome == 'sold_out':
+                break
+    finally:
+        conn.close()
+
+
+def _worker(db_path, tuned, transport, port, user_ids, movie_id, session_id,
+            start_at, max_requests):
+    _setup(db_path, tuned)
+    from django.test.utils import override_settings
+    from django.urls import reverse
+
+    override_settings(ALLOWED_HOSTS=['testserver', '127.0.0.1']).enable()
+    url = reverse('cinema:ticket-buy', args=[movie_id])
+    data = {'session': session_id, 'payment_method': 'sbp'}
+    errors = _count_errors()
+    results = []
+    threads = []
+    for user_id in user_ids:
+        if transport == 'wsgi':
+            target, extra = _http_buyer, (port,)
+        else:
+            target, extra = _client_buyer, ()
+        threads.append(threading.Thread(target=target, args=(
+            user_id, url, data, start_at, max_requests, results, *extra)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, dict(errors)
+
+
+def _audit(db_path, tuned, session_id):
+    _setup(db_path, tuned)
+    from django.db.models import Count, F
+
+    from cinema.models import Seat, Session, Ticket
+
+    session = Session.objects.get(pk=session_id)
+    tickets = Ticket.objects.filter(session=session).exclude(
+        status=Ticket.Status.CANCELLED)
+    double = (tickets.values('seat').annotate(n=Count('id'))
+              .filter(n__gt=1).count())
+    foreign = tickets.exclude(seat__hall=F('session__hall')).count()
+    capacity = Seat.objects.filter(hall=session.hall_id).count()
+    sold_seats = tickets.values('seat').distinct().count()
+    return {
+        'capacity': capacity,
+        'tickets': tickets.count(),
+        'double_sells': double + foreign,
+        'unsold': capacity - sold_seats,
+    }
+
+
+def _quantiles(latencies):
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+def run_load(processes=2, threads=4, rows=10, seats=20, transport='client',
+             mode='tuned', max_requests=None):
+    """Один прогон; словарь с задержками, исходами и итогами по залу."""
+    tuned = MODES[mode]
+    buyers = processes * threads
+    max_requests = max_requests or rows * seats + 1
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'load.sqlite3')
+        with ctx.Pool(1) as pool:
+            movie_id, session_id, user_ids = pool.apply(
+                _prepare, (db_path, tuned, rows, seats, buyers))
+
+        server = port = None
+        if transport == 'wsgi':
+            ready, report, stop = ctx.Queue(), ctx.Queue(), ctx.Event()
+            server = ctx.Process(target=_serve,
+                                 args=(db_path, tuned, ready, stop, report))
+            server.start()
+            port = ready.get(timeout=60)
+
+        with ctx.Pool(processes) as pool:
+            start_at = time.time() + 2 + processes * 0.3
+            chunks = pool.starmap(_worker, [
+                (db_path, tuned, transport, port,
+                 user_ids[n * threads:(n + 1) * threads],
+                 movie_id, session_id, start_at, max_requests)
+                for n in range(processes)
+            ])
+
+        outcomes = Counter()
+        if server is not None:
+            stop.set()
+            try:
+                outcomes.update(report.get(timeout=30))
+            except queue.Empty:
+                pass
+            server.join(timeout=30)
+
+        with ctx.Pool(1) as pool:
+            audit = pool.apply(_audit, (db_path, tuned, session_id))
+
+    results = [r for chunk, _ in chunks for r in chunk]
+    if server is None:
+        for _, errors in chunks:
+            outcomes.update(errors)
+    unexplained = -sum(outcomes.values())
+    for _, outcome, _ in results:
+        if outcome.startswith('http_'):
+            unexplained += 1
+        else:
+            outcomes[outcome] += 1
+    outcomes['error'] += max(0, unexplained)
+    latencies = [r[0] for r in results]
+    p50, p95, p99 = _quantiles(latencies)
+    elapsed = max((r[2] for r in results), default=start_at) - start_at
+    return {
+        'transport': transport,
+        'mode': mode,
+        'buyers': buyers,
+        'requests': len(results),
+        'seconds': elapsed,
+        'throughput': outcomes['sold'] / elapsed if elapsed else 0.0,
+        'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+        'outcomes': {name: outcomes.get(name, 0) for name in OUTCOMES},
+        **audit,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Покупает билеты на один сеанс из нескольких процессов и '
+            'потоков, пока зал не распродан, и печатает пропускную '
+            'способность, задержки, ошибки, двойные продажи и '
+            'непроданные места.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=4,
+                            help='потоков (покупателей) на процесс')
+        parser.add_argument('--rows', type=int, default=10)
+        parser.add_argument('--seats', type=int, default=20,
+                            help='мест в ряду')
+        parser.add_argument('--transport', choices=['client', 'wsgi'],
+                            default='client')
+        parser.add_argument('--mode', choices=list(MODES), default='tuned',
+                            help='настройки SQLite (см. stress_sqlite)')
+
+    def handle(self, processes, threads, rows, seats, transport, mode,
+               **options):
+        stats = run_load(processes, threads, rows, seats, transport, mode)
+        outcomes = ', '.join(f'{k} {v}' for k, v in stats['outcomes'].items())
+        self.stdout.write(
+            f'{stats["buyers"]} покупателей, {stats["requests"]} запросов '
+            f'({stats["transport"]}, SQLite {stats["mode"]})\n'
+            f'  пропускная способность: {stats["throughput"]:.1f} билетов/с\n'
+            f'  задержка: p50 {stats["p50_ms"]:.1f} мс, '
+            f'p95 {stats["p95_ms"]:.1f} мс, p99 {stats["p99_ms"]:.1f} мс\n'
+            f'  исходы: {outcomes}\n'
+            f'  мест {stats["capacity"]}, билетов {stats["tickets"]}, '
+            f'двойных продаж {stats["double_sells"]}, '
+            f'не продано {stats["unsold"]}'
+        )
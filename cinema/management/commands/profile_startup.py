@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# модули, которые не должны грузиться при старте воркера
+HEAVY_MODULES = ('weasyprint', 'PIL.Image', 'cairocffi', 'fontTools')
+
+CHILD = '''
+import json, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - t0
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss *= 1 if sys.platform == 'darwin' else 1024
+except ImportError:
+    rss = None
+print(json.dumps({
+    'seconds': elapsed, 'rss_bytes': rss,
+    'heavy': [m for m in %r if m in sys.modules],
+}))
+'''
+
+
+def measure_startup():
+    """
+    Запускает чистый интерпретатор, поднимает Django и URLConf (а с ним
+    views, api_views, admin) и возвращает время, пиковый RSS, загруженные
+    «тяжёлые» модули и вывод -X importtime.
+    """
+    env = {**os.environ,
+           'DJANGO_SETTINGS_MODULE': os.environ.get(
+               'DJANGO_SETTINGS_MODULE', 'mafisha.settings')}
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD % (HEAVY_MODULES,)],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise CommandError(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def parse_importtime(stderr):
+    """[(модуль, собственное мкс, накопленное мкс)] из вывода -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = ('Замеряет холодный старт приложения cinema: время импорта, '
+            'пиковый RSS и самые дорогие модули.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15,
+                            help='сколько самых дорогих пакетов показать')
+        parser.add_argument('--max-ms', type=float,
+                            help='упасть, если старт дольше')
+        parser.add_argument('--max-rss-mb', type=float,
+                            help='упасть, если RSS больше')
+        parser.add_argument('--json', action='store_true',
+                            help='вывести результат в JSON')
+
+    def handle(self, top, max_ms, max_rss_mb, **options):
+        result = measure_startup()
+        ms = result['seconds'] * 1000
+        rss_mb = (result['rss_bytes'] or 0) / 2 ** 20
+
+        # собственное время модулей, сложенное по корневому пакету
+        by_package = defaultdict(int)
+        for name, self_us, _ in result['imports']:
+            by_package[name.split('.')[0]] += self_us
+        packages = sorted(by_package.items(), key=lambda r: r[1],
+                          reverse=True)[:top]
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'startup_ms': round(ms, 1), 'rss_mb': round(rss_mb, 1),
+                'heavy_modules': result['heavy'],
+                'top_packages': [{'name': n, 'ms': us / 1000}
+                                 for n, us in packages],
+            }, ensure_ascii=False, indent=2))
+        else:
+            self.stdout.write(f'Старт: {ms:.0f} мс, пиковый RSS: '
+                              f'{rss_mb:.1f} МБ')
+            for name, us in packages:
+                self.stdout.write(f'  {us / 1000:8.1f} мс  {name}')
+
+        problems = []
+        if result['heavy']:
+            problems.append('загружены тяжёлые модули: '
+                            + ', '.join(result['heavy']))
+        if max_ms is not None and ms > max_ms:
+            problems.append(f'старт {ms:.0f} мс > {max_ms:.0f} мс')
+        if max_rss_mb is not None and rss_mb > max_rss_mb:
+            problems.append(f'RSS {rss_mb:.1f} МБ > {max_rss_mb:.1f} МБ')
+        if problems:
+            raise CommandError('; '.join(problems))
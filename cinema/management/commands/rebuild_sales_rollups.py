@@ -0,0 +1,47 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from cinema import analytics
+from cinema.models import Session
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает дневные свёртки продаж порциями по N дней.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from',
+                            type=datetime.date.fromisoformat,
+                            help='первый день (YYYY-MM-DD), по умолч. '
+                                 'самый ранний сеанс')
+        parser.add_argument('--to', dest='date_to',
+                            type=datetime.date.fromisoformat,
+                            help='последний день включительно, по умолч. '
+                                 'самый поздний сеанс')
+        parser.add_argument('--chunk-days', type=int, default=31,
+                            help='дней в одной транзакции')
+
+    def handle(self, date_from, date_to, chunk_days, **options):
+        if chunk_days < 1:
+            raise CommandError('--chunk-days должен быть положительным.')
+        bounds = Session.objects.aggregate(lo=Min('starts_at'),
+                                           hi=Max('starts_at'))
+        if bounds['lo'] is None and not (date_from and date_to):
+            self.stdout.write('Сеансов нет — пересчитывать нечего.')
+            return
+        date_from = date_from or timezone.localdate(bounds['lo'])
+        date_to = date_to or timezone.localdate(bounds['hi'])
+
+        step = datetime.timedelta(days=chunk_days)
+        day, rows = date_from, 0
+        while day <= date_to:
+            end = min(day + step, date_to + datetime.timedelta(days=1))
+            rows += analytics.rebuild(day, end)
+            self.stdout.write(f'{day} … {end - datetime.timedelta(days=1)}: '
+                              f'строк всего {rows}')
+            day = end
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {rows} строк свёрток за {date_from} … {date_to}.'
+        ))
@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Замеряет горячие пути (каталог, карточка, API, главная, '
+            'рекомендации, покупка билета, PDF) на текущей БД и пишет JSON. '
+            'Данные — generate_dataset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--only', nargs='+',
+                            choices=benchmarks.Suite.SCENARIOS)
+        parser.add_argument('--output', help='куда сохранить JSON')
+        parser.add_argument('--compare', help='JSON прошлого прогона')
+
+    def handle(self, warmup, repeat, only, output, compare, **options):
+        baseline = None
+        if compare:
+            try:
+                baseline = json.loads(Path(compare).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'{compare}: {exc}')
+
+        def progress(name, result):
+            if 'skipped' in result:
+                self.stdout.write(f'{name:>28}: пропущен — {result["skipped"]}')
+            else:
+                self.stdout.write(
+                    f'{name:>28}: медиана {result["median_ms"]:.1f} мс, '
+                    f'p95 {result["p95_ms"]:.1f} мс, '
+                    f'{result["rps"]:.1f} запр./с, SQL {result["queries"]}')
+
+        try:
+            report = benchmarks.run(warmup, repeat, only, progress)
+        except benchmarks.Skip as exc:
+            raise CommandError(str(exc))
+
+        if output:
+            Path(output).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2))
+            self.stdout.write(f'Сохранено в {output}')
+        if baseline:
+            self.stdout.write('Медианы относительно '
+                              f'{baseline["meta"].get("commit")}:')
+            for name, before, after, delta in benchmarks.compare(baseline,
+                                                                 report):
+                self.stdout.write(f'{name:>28}: {before:.1f} → {after:.1f} '
+                                  f'мс ({delta:+.1f}%)')
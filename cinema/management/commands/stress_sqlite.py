@@ -0,0 +1,128 @@
+"""
+Нагрузочная проверка записи в SQLite из нескольких процессов.
+
+На временной копии схемы (DB_NAME во временном каталоге) процессы
+одновременно публикуют отзывы: проверка и вставка отзыва в одной
+транзакции — сначала чтение, потом запись, как при покупке билета
+(avg_rating фильма пересчитывает сигнал, уже после коммита). Именно такие транзакции в режиме по умолчанию
+получают «database is locked»: блокировку чтения нельзя повысить,
+пока пишет другой процесс, и таймаут тут не помогает. Считаются
+успешные транзакции по секундам и ошибки блокировки.
+"""
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+MODES = {'tuned': '1', 'default': '0'}
+
+
+def _setup(db_path, tuned):
+    os.environ['DB_NAME'] = db_path
+    os.environ['DB_SQLITE_TUNED'] = tuned
+    os.environ.pop('DB_ENGINE', None)
+    os.environ.pop('DB_REPLICAS', None)
+    import django
+    django.setup()
+
+
+def _prepare(db_path, tuned, movies):
+    _setup(db_path, tuned)
+    from django.core.management import call_command
+
+    from cinema.models import Country, Genre, Movie, User
+
+    call_command('migrate', verbosity=0)
+    country = Country.objects.create(name='Страна')
+    genre = Genre.objects.create(name='Жанр')
+    Movie.objects.bulk_create(
+        Movie(title=f'Фильм {i}', description='—', country=country,
+              main_genre=genre, release_date='2020-01-01')
+        for i in range(movies)
+    )
+    User.objects.bulk_create(User(username=f'stress-{i}', password='!')
+                             for i in range(64))
+
+
+def _worker(db_path, tuned, number, duration, start_at):
+    _setup(db_path, tuned)
+    from django.db import OperationalError, transaction
+
+    from cinema.models import Movie, Review, User
+
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    user_id = User.objects.order_by('id').values_list('id', flat=True)[number]
+    per_second, errors = {}, 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    i = 0
+    while time.time() < start_at + duration:
+        movie_id = movie_ids[(number + i) % len(movie_ids)]
+        i += 1
+        try:
+            with transaction.atomic():
+                Review.objects.filter(movie_id=movie_id,
+                                      user_id=user_id).exists()
+                Review.objects.create(movie_id=movie_id, user_id=user_id,
+                                      rating=1 + i % 10, is_approved=True)
+        except OperationalError as exc:
+            if 'locked' not in str(exc) and 'busy' not in str(exc):
+                raise
+            errors += 1
+            continue
+        second = int(time.time() - start_at)
+        per_second[second] = per_second.get(second, 0) + 1
+    return per_second, errors
+
+
+def run_stress(processes=4, duration=5.0, mode='tuned', movies=20):
+    """{'mode', 'total', 'errors', 'per_second': [...]} для одного режима."""
+    tuned = MODES[mode]
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'stress.sqlite3')
+        with ctx.Pool(1) as pool:
+            pool.apply(_prepare, (db_path, tuned, movies))
+        with ctx.Pool(processes) as pool:
+            # старт одновременно, когда все процессы уже подняли Django
+            start_at = time.time() + 2 + processes * 0.3
+            results = pool.starmap(_worker, [
+                (db_path, tuned, n, duration, start_at)
+                for n in range(processes)
+            ])
+    seconds = int(duration)
+    per_second = [sum(r[0].get(s, 0) for r in results)
+                  for s in range(seconds)]
+    return {
+        'mode': mode,
+        'total': sum(sum(r[0].values()) for r in results),
+        'errors': sum(r[1] for r in results),
+        'per_second': per_second,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Запускает параллельную запись в SQLite из нескольких '
+            'процессов и печатает пропускную способность и число '
+            'ошибок блокировки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0)
+        parser.add_argument('--mode', choices=[*MODES, 'both'],
+                            default='both')
+
+    def handle(self, processes, duration, mode, **options):
+        modes = list(MODES) if mode == 'both' else [mode]
+        for name in modes:
+            stats = run_stress(processes, duration, name)
+            rates = stats['per_second'] or [0]
+            self.stdout.write(
+                f'{name:>8}: {stats["total"]} транзакций, '
+                f'ошибок блокировки {stats["errors"]}, '
+                f'в секунду: мин {min(rates)}, '
+                f'медиана {statistics.median(rates):.0f}, макс {max(rates)}'
+            )
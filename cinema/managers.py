@@ -1,19 +1,45 @@
-from django.db import models
-from django.db.models import Avg
+from django.db import models, transaction
+from django.db.models import Avg, DecimalField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+
+from . import api_cache
+
+RATING_FIELD = DecimalField(max_digits=4, decimal_places=2)
 
 
 class MovieQuerySet(models.QuerySet):
     """
     Кастомный QuerySet.
-    computed_rating — динамически высчитанная средняя оценка на основе связанных Review.
+    computed_rating — средняя оценка по одобренным отзывам: тот же
+    денормализованный avg_rating, по которому фильтрует MovieFilter,
+    но NULL для фильмов без оценок (avg_rating у них 0).
     """
     def with_computed_rating(self):
-        return self.annotate(computed_rating=Avg('reviews__rating'))
+        return self.annotate(computed_rating=NullIf(
+            'avg_rating', Value(0), output_field=RATING_FIELD))
 
     def top_rated(self, limit: int = 10):
         return (self.with_computed_rating()
                     .order_by('-computed_rating')[:limit])
 
+    def refresh_avg_rating(self):
+        """
+        Пересчитывает денормализованный avg_rating по одобренным отзывам
+        одним UPDATE для всех фильмов выборки.
+        """
+        review_model = self.model._meta.get_field('reviews').related_model
+        avg = (review_model.objects
+               .filter(movie=OuterRef('pk'), is_approved=True)
+               .order_by().values('movie')
+               .annotate(avg=Avg('rating')).values('avg'))
+        count = self.update(avg_rating=Coalesce(
+            Subquery(avg), Value(0), output_field=RATING_FIELD,
+        ))
+        # после записи: вне транзакции on_commit срабатывает сразу, и
+        # ответ, собранный между bump и update, лёг бы под новой версией
+        api_cache.bump(self.model)       # update() без сигналов
+        return count
+
 
 class MovieManager(models.Manager):
     """
@@ -28,3 +54,30 @@ class MovieManager(models.Manager):
 
     def top_rated(self, limit: int = 10):
         return self.get_queryset().top_rated(limit=limit)
+
+    def refresh_avg_rating(self, movie_ids):
+        return self.get_queryset().filter(pk__in=set(movie_ids)) \
+                                  .refresh_avg_rating()
+
+
+class ReviewQuerySet(models.QuerySet):
+    """
+    Массовая модерация: один UPDATE/DELETE на всю выборку и пересчёт
+    рейтинга — по разу на каждый затронутый фильм, а не на отзыв.
+    """
+    def _movie_model(self):
+        return self.model._meta.get_field('movie').related_model
+
+    def approve(self):
+        pending = self.filter(is_approved=False)
+        with transaction.atomic():
+            movie_ids = set(pending.values_list('movie_id', flat=True))
+            count = pending.update(is_approved=True)
+            self._movie_model().objects.refresh_avg_rating(movie_ids)
+        return count
+
+    def reject(self):
+        # delete() шлёт post_delete — рейтинг пересчитают сигналы,
+        # одним UPDATE после коммита
+        count, _ = self.delete()
+        return count
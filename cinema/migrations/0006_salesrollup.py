@@ -0,0 +1,33 @@
+# Generated by Django 5.1 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0005_movie_trailer_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('scope', models.CharField(choices=[('movie', 'фильм'), ('session', 'сеанс'), ('hall', 'зал'), ('cinema', 'кинотеатр')], max_length=10, verbose_name='разрез')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='id объекта')),
+                ('tickets_sold', models.PositiveIntegerField(default=0, verbose_name='продано билетов')),
+                ('tickets_cancelled', models.PositiveIntegerField(default=0, verbose_name='отменено билетов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='выручка')),
+                ('capacity', models.PositiveIntegerField(default=0, verbose_name='мест на сеансах')),
+            ],
+            options={
+                'verbose_name': 'свёртка продаж',
+                'verbose_name_plural': 'свёртки продаж',
+                'ordering': ['-day', 'scope', 'object_id'],
+                'indexes': [models.Index(fields=['scope', 'day'], name='sales_rollup_scope_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'object_id', 'day'), name='unique_sales_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1 on 2026-10-19 18:10
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0007_movie_poster_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrailerUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='имя файла')),
+                ('size', models.PositiveBigIntegerField(verbose_name='размер, байт')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='получено, байт')),
+                ('status', models.CharField(choices=[('uploading', 'загружается'), ('complete', 'завершена')], default='uploading', max_length=10, verbose_name='статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создана')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='обновлена')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trailer_uploads', to=settings.AUTH_USER_MODEL, verbose_name='кто загружает')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trailer_uploads', to='cinema.movie', verbose_name='фильм')),
+            ],
+            options={
+                'verbose_name': 'загрузка трейлера',
+                'verbose_name_plural': 'загрузки трейлеров',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-19 18:12
+
+import cinema.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0008_trailerupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='poster',
+            field=models.ImageField(blank=True, null=True, storage=cinema.storage.media_storage, upload_to='posters/', verbose_name='постер'),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='trailer',
+            field=models.FileField(blank=True, null=True, storage=cinema.storage.media_storage, upload_to='trailers/', verbose_name='файл трейлера'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='путь')),
+                ('size', models.PositiveBigIntegerField(verbose_name='размер, байт')),
+                ('ref_count', models.IntegerField(default=0, verbose_name='ссылок')),
+                ('touched_at', models.DateTimeField(verbose_name='последняя запись')),
+            ],
+            options={
+                'verbose_name': 'медиафайл',
+                'verbose_name_plural': 'медиафайлы',
+                'indexes': [models.Index(fields=['ref_count', 'touched_at'], name='media_blob_gc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+from django.db.models import Avg, DecimalField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_avg_rating(apps, schema_editor):
+    Movie = apps.get_model('cinema', 'Movie')
+    Review = apps.get_model('cinema', 'Review')
+    avg = (Review.objects.filter(movie=OuterRef('pk'), is_approved=True)
+           .order_by().values('movie')
+           .annotate(avg=Avg('rating')).values('avg'))
+    Movie.objects.update(avg_rating=Coalesce(
+        Subquery(avg), Value(0),
+        output_field=DecimalField(max_digits=4, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0009_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_avg_rating, migrations.RunPython.noop),
+    ]
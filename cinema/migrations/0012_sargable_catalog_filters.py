@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-19 18:20
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0011_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='avg_rating',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=4, verbose_name='средняя оценка (денорм.)'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(django.db.models.functions.text.Lower('title'), models.F('release_date'), name='movie_title_lower_idx'),
+        ),
+    ]
@@ -1,11 +1,16 @@
+import uuid
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Lower
 from django.urls import reverse
 from django.utils import timezone
 
-from .managers import MovieManager
+from .managers import MovieManager, ReviewQuerySet
+from .moderation import find_banned_words
+from .storage import media_storage
 
 
 # ─────────── пользователь ───────────
@@ -66,8 +71,13 @@ class Movie(models.Model):
     release_date = models.DateField('дата выхода')
 
     poster = models.ImageField('постер', upload_to='posters/',
+                               storage=media_storage,
                                blank=True, null=True)
+    poster_variants = models.JSONField(
+        'варианты постера', default=dict, blank=True, editable=False
+    )
     trailer = models.FileField('файл трейлера', upload_to='trailers/',
+                               storage=media_storage,
                                blank=True, null=True)
     trailer_url = models.URLField(                    # ← URLField
         'URL-трейлера (YouTube)', blank=True, null=True
@@ -91,7 +101,7 @@ class Movie(models.Model):
 
     avg_rating = models.DecimalField(
         'средняя оценка (денорм.)', max_digits=4,
-        decimal_places=2, default=0, editable=False
+        decimal_places=2, default=0, editable=False, db_index=True
     )
 
     objects = MovieManager()
@@ -100,6 +110,13 @@ class Movie(models.Model):
         verbose_name = 'фильм'
         verbose_name_plural = 'фильмы'
         ordering = ['-release_date', 'title']
+        indexes = [
+            models.Index(fields=['-release_date', 'title'],
+                         name='movie_release_title_idx'),
+            # проверка дублей без учёта регистра в clean()
+            models.Index(Lower('title'), 'release_date',
+                         name='movie_title_lower_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['title', 'release_date'],
@@ -108,9 +125,12 @@ class Movie(models.Model):
         ]
 
     def clean(self):
+        # Lower() с обеих сторон, а не title__iexact (LIKE мимо индекса);
+        # значение тоже приводит БД, чтобы правила регистра совпадали
         if (Movie.objects
                 .exclude(pk=self.pk)
-                .filter(title__iexact=self.title,
+                .alias(title_lower=Lower('title'))
+                .filter(title_lower=Lower(models.Value(self.title)),
                         release_date=self.release_date)
                 .exists()):
             raise ValidationError('Фильм с таким названием и годом уже есть.')
@@ -124,6 +144,36 @@ class Movie(models.Model):
     def get_absolute_url(self):
         return reverse('cinema:movie-detail', args=[self.pk])
 
+    # ───── варианты постера (см. cinema.images) ─────
+    @property
+    def has_poster_variants(self):
+        return bool(self.poster) and \
+            self.poster_variants.get('source') == self.poster.name
+
+    def poster_variant_url(self, label='thumb', fmt='webp'):
+        """URL варианта ('thumb' или ширина) либо оригинала, если его нет."""
+        if not self.poster:
+            return None
+        if self.has_poster_variants:
+            names = (self.poster_variants['thumb'] if label == 'thumb'
+                     else self.poster_variants['widths'].get(str(label)))
+            if names:
+                return self.poster.storage.url(names[fmt])
+        return self.poster.url
+
+    @property
+    def poster_srcsets(self):
+        """{'webp': 'url 320w, …', 'jpg': …} для <picture>."""
+        if not self.has_poster_variants:
+            return {}
+        storage = self.poster.storage
+        widths = self.poster_variants['widths'].items()
+        return {
+            fmt: ', '.join(f'{storage.url(names[fmt])} {width}w'
+                           for width, names in widths)
+            for fmt in ('webp', 'jpg')
+        }
+
 
 class MovieGenre(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
@@ -149,6 +199,60 @@ class MovieActor(models.Model):
         return f'{self.actor} в «{self.movie}» — {self.role_name}'
 
 
+class MediaBlob(models.Model):
+    """Файл в CAS-хранилище и число фильмов, которые на него ссылаются."""
+    name = models.CharField('путь', max_length=255, primary_key=True)
+    size = models.PositiveBigIntegerField('размер, байт')
+    ref_count = models.IntegerField('ссылок', default=0)
+    touched_at = models.DateTimeField('последняя запись')
+
+    class Meta:
+        verbose_name = 'медиафайл'
+        verbose_name_plural = 'медиафайлы'
+        indexes = [
+            models.Index(fields=['ref_count', 'touched_at'],
+                         name='media_blob_gc_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class TrailerUpload(models.Model):
+    """Докачиваемая загрузка файла трейлера (см. cinema.uploads)."""
+    class Status(models.TextChoices):
+        UPLOADING = 'uploading', 'загружается'
+        COMPLETE = 'complete', 'завершена'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    movie = models.ForeignKey(
+        Movie, verbose_name='фильм',
+        on_delete=models.CASCADE, related_name='trailer_uploads'
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name='кто загружает',
+        on_delete=models.CASCADE, related_name='trailer_uploads'
+    )
+    filename = models.CharField('имя файла', max_length=255)
+    size = models.PositiveBigIntegerField('размер, байт')
+    sha256 = models.CharField('SHA-256', max_length=64)
+    offset = models.PositiveBigIntegerField('получено, байт', default=0)
+    status = models.CharField('статус', max_length=10,
+                              choices=Status.choices,
+                              default=Status.UPLOADING)
+    created_at = models.DateTimeField('создана', auto_now_add=True)
+    updated_at = models.DateTimeField('обновлена', auto_now=True)
+
+    class Meta:
+        verbose_name = 'загрузка трейлера'
+        verbose_name_plural = 'загрузки трейлеров'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.filename} → «{self.movie}» ({self.offset}/{self.size})'
+
+
 # остальные модели не изменялись …
 
 
@@ -173,10 +277,24 @@ class Review(models.Model):
         'одобрен модератором', default=False
     )
 
+    objects = ReviewQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'отзыв'
         verbose_name_plural = 'отзывы'
         ordering = ['-created_at']
+        # частичные индексы: SQLite не берёт из составного индекса
+        # столбец для «WHERE is_approved» без явного «= 1»
+        indexes = [
+            # одобренные отзывы фильма, новые сверху
+            models.Index(fields=['movie', '-created_at'],
+                         condition=models.Q(is_approved=True),
+                         name='review_movie_approved_idx'),
+            # очередь модерации (keyset по created_at, id)
+            models.Index(fields=['-created_at', '-id'],
+                         condition=models.Q(is_approved=False),
+                         name='review_queue_idx'),
+        ]
 
     def __str__(self):
         return f'Отзыв {self.user} к «{self.movie}»'
@@ -185,11 +303,10 @@ class Review(models.Model):
         if not (1 <= self.rating <= 10):
             raise ValidationError('Оценка должна быть от 1 до 10.')
 
-        bad = {w for w in settings.BANNED_WORDS
-               if w in self.review_text.lower()}
+        bad = find_banned_words(self.review_text)
         if bad:
             raise ValidationError(
-                'Отзыв содержит запрещённые слова: ' + ', '.join(bad)
+                'Отзыв содержит запрещённые слова: ' + ', '.join(sorted(bad))
             )
 
 
@@ -209,6 +326,10 @@ class Favorite(models.Model):
         verbose_name_plural = 'избранное'
         unique_together = ('user', 'movie')
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['user', '-added_at'],
+                         name='favorite_user_added_idx'),
+        ]
 
 
 # ─────────── кинотеатры, залы, билеты ───────────
@@ -289,6 +410,11 @@ class Session(models.Model):
         verbose_name = 'сеанс'
         verbose_name_plural = 'сеансы'
         ordering = ['starts_at']
+        indexes = [
+            models.Index(fields=['movie', 'starts_at'],
+                         name='session_movie_start_idx'),
+            models.Index(fields=['starts_at'], name='session_start_idx'),
+        ]
 
     def __str__(self):
         local = timezone.localtime(self.starts_at)
@@ -324,6 +450,58 @@ class Ticket(models.Model):
         verbose_name = 'билет'
         verbose_name_plural = 'билеты'
         unique_together = ('session', 'seat')
+        indexes = [
+            models.Index(fields=['user', '-purchased_at'],
+                         name='ticket_user_purchased_idx'),
+        ]
 
     def __str__(self):
         return f'Билет {self.id} — {self.session} ({self.seat})'
+
+
+# ─────────── аналитика продаж (свёртки) ───────────
+class SalesRollup(models.Model):
+    """
+    Дневная свёртка продаж по одному объекту (фильм, сеанс, зал,
+    кинотеатр). Поддерживается инкрементально из cinema.analytics,
+    отчёты читают только эту таблицу.
+    """
+    class Scope(models.TextChoices):
+        MOVIE = 'movie', 'фильм'
+        SESSION = 'session', 'сеанс'
+        HALL = 'hall', 'зал'
+        CINEMA = 'cinema', 'кинотеатр'
+
+    day = models.DateField('день')
+    scope = models.CharField('разрез', max_length=10, choices=Scope.choices)
+    object_id = models.PositiveBigIntegerField('id объекта')
+    tickets_sold = models.PositiveIntegerField('продано билетов', default=0)
+    tickets_cancelled = models.PositiveIntegerField('отменено билетов',
+                                                    default=0)
+    revenue = models.DecimalField('выручка', max_digits=14,
+                                  decimal_places=2, default=0)
+    capacity = models.PositiveIntegerField('мест на сеансах', default=0)
+
+    class Meta:
+        verbose_name = 'свёртка продаж'
+        verbose_name_plural = 'свёртки продаж'
+        ordering = ['-day', 'scope', 'object_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope', 'object_id', 'day'],
+                name='unique_sales_rollup'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['scope', 'day'],
+                         name='sales_rollup_scope_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_scope_display()} #{self.object_id} — {self.day}'
+
+    @property
+    def occupancy(self):
+        if not self.capacity:
+            return 0.0
+        return self.tickets_sold / self.capacity
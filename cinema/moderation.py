@@ -0,0 +1,107 @@
+"""
+Проверка текста отзывов на запрещённые слова.
+
+Список settings.BANNED_WORDS один раз компилируется в одно регулярное
+выражение по префиксному дереву: на каждой позиции текста движок идёт
+по дереву не глубже самого длинного слова, без перебора слов по одному.
+И слова, и текст приводятся к общей форме: NFKC, casefold, удаление
+невидимых символов и замена строчных кириллических букв, неотличимых
+от латинских, так что «СПОЙЛЕР», «cпoйлep» и «badw0rd» тоже ловятся.
+Буквы, похожие только в верхнем регистре (в/B, н/H, т/T), и «leet»-цифры
+кроме нуля не заменяются: они склеивали разные слова.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# строчная кириллица → латинский двойник того же начертания
+# (после casefold); 0 и o в тексте тоже не различить
+HOMOGLYPHS = str.maketrans({
+    'а': 'a', 'е': 'e', 'о': 'o', 'р': 'p', 'с': 'c', 'у': 'y', 'х': 'x',
+    'і': 'i', 'ј': 'j', 'ѕ': 's', 'һ': 'h', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w',
+    '0': 'o',
+})
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text).casefold()
+    # zero-width и прочие форматирующие символы рвут слово незаметно
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Cf')
+    return text.translate(HOMOGLYPHS)
+
+
+def _trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 \
+            else '(?:' + '|'.join(branches) + ')'
+        if '' in node:                         # слово — префикс другого
+            return f'(?:{body})?'
+        return body
+
+    return build(trie)
+
+
+class BannedWordMatcher:
+    def __init__(self, words):
+        self.originals = {}
+        for word in words:
+            if word.strip():
+                self.originals.setdefault(normalize(word.strip()), word)
+        # просмотр вперёд: находим и перекрывающиеся слова
+        self.regex = (re.compile(f'(?=({_trie_pattern(self.originals)}))')
+                      if self.originals else None)
+        self.find = lru_cache(maxsize=256)(self.scan)
+
+    def scan(self, text):
+        """Множество исходных запрещённых слов, найденных в тексте."""
+        if self.regex is None or not text:
+            return frozenset()
+        found = set()
+        for match in self.regex.finditer(normalize(text)):
+            # с одной позиции берётся самое длинное слово — добираем
+            # и те запрещённые слова, что являются его префиксами
+            hit = match.group(1)
+            found.update(self.originals[hit[:i]]
+                         for i in range(1, len(hit) + 1)
+                         if hit[:i] in self.originals)
+        return frozenset(found)
+
+
+_matcher = None
+_matcher_key = None
+
+
+def get_matcher():
+    """Матчер для текущего BANNED_WORDS; пересобирается при его замене."""
+    global _matcher, _matcher_key
+    words = settings.BANNED_WORDS
+    key = frozenset(words)
+    if _matcher is None or key != _matcher_key:
+        _matcher, _matcher_key = BannedWordMatcher(words), key
+    return _matcher
+
+
+def find_banned_words(text):
+    return get_matcher().find(text)
+
+
+@receiver(setting_changed)
+def _reset_matcher(setting, **kwargs):
+    global _matcher
+    if setting == 'BANNED_WORDS':
+        _matcher = None
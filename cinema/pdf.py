@@ -0,0 +1,228 @@
+"""
+PDF-квитанции к билетам.
+
+Готовые файлы кэшируются на диске; имя файла зависит от id билета,
+хэша отрендеренного HTML (данные билета + шаблон) и хэша pdf.css,
+поэтому любое изменение билета или оформления даёт новый файл.
+Рендер идёт в фоновом пуле (cinema.tasks), стили и шрифты
+разбираются один раз на поток. WeasyPrint (с Pango/cairo) импортируется
+только при первом рендере, а не при старте воркера. Упавший рендер
+запоминается на RETRY_FAILED_AFTER секунд: всё это время ticket_pdf
+поднимает RenderFailed, а не ставит рендер в очередь заново.
+"""
+import hashlib
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import render_to_string
+
+from . import tasks
+
+TEMPLATE = 'cinema/ticket/pdf.html'
+STYLESHEET = 'css/pdf.css'
+
+_local = threading.local()
+_pending = {}                     # путь → Future уже запущенного рендера
+_failed = {}                      # путь → time.monotonic() падения
+_pending_lock = threading.Lock()
+RETRY_FAILED_AFTER = 60           # с; потом упавший рендер пробуем снова
+
+
+class RenderFailed(Exception):
+    """Фоновый рендер PDF упал; причина — в __cause__ и в логе задач."""
+
+
+def cache_dir() -> Path:
+    return Path(settings.TICKET_PDF_CACHE_DIR)
+
+
+@lru_cache(maxsize=None)
+def stylesheet_hash() -> str:
+    css_file = finders.find(STYLESHEET)
+    if not css_file:
+        return 'nocss'
+    return hashlib.sha256(Path(css_file).read_bytes()).hexdigest()[:12]
+
+
+def _stylesheets(css_file=None):
+    """Разобранные CSS и шрифты — один раз на поток."""
+    if not hasattr(_local, 'stylesheets'):
+        import weasyprint
+        from weasyprint.text.fonts import FontConfiguration
+
+        css_file = css_file or finders.find(STYLESHEET)
+        _local.font_config = FontConfiguration()
+        _local.stylesheets = (
+            [weasyprint.CSS(filename=css_file,
+                            font_config=_local.font_config)]
+            if css_file else []
+        )
+    return _local.stylesheets, _local.font_config
+
+
+def ticket_html(ticket) -> str:
+    return render_to_string(TEMPLATE, {'ticket': ticket})
+
+
+def render_pdf(html: str) -> bytes:
+    import weasyprint
+
+    stylesheets, font_config = _stylesheets()
+    return weasyprint.HTML(string=html).write_pdf(
+        stylesheets=stylesheets, font_config=font_config
+    )
+
+
+def cache_path(ticket, html: str) -> Path:
+    version = hashlib.sha256(html.encode()).hexdigest()[:16]
+    return cache_dir() / f'ticket_{ticket.pk}-{version}-{stylesheet_hash()}.pdf'
+
+
+def _render_to_file(html: str, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_bytes(render_pdf(html))
+    os.replace(tmp, path)
+    # устаревшие версии того же билета больше не нужны
+    prefix = path.name.split('-', 1)[0] + '-'
+    for old in path.parent.glob(prefix + '*.pdf'):
+        if old != path:
+            old.unlink(missing_ok=True)
+    return path
+
+
+def _forget(path, future):
+    with _pending_lock:
+        _pending.pop(path, None)
+        if future.cancelled() or future.exception() is not None:
+            _failed[path] = time.monotonic()
+
+
+def ticket_pdf(ticket):
+    """
+    Путь к готовому PDF билета или None, если он ещё рендерится
+    (рендер при этом ставится в очередь, повторно — не дублируется).
+    RenderFailed — если рендер недавно упал.
+    """
+    html = ticket_html(ticket)
+    path = cache_path(ticket, html)
+    if path.exists():
+        return path
+    with _pending_lock:
+        failed_at = _failed.pop(path, None)
+        if failed_at is not None and \
+                time.monotonic() - failed_at < RETRY_FAILED_AFTER:
+            _failed[path] = failed_at
+            raise RenderFailed(f'Не удалось отрендерить {path.name}')
+        future = _pending.get(path)
+        queued = future is None
+        if queued:
+            future = _pending[path] = tasks.submit(_render_to_file,
+                                                   html, path)
+    if queued:
+        future.add_done_callback(partial(_forget, path))
+    if not future.done():
+        return None
+    error = None if future.cancelled() else future.exception()
+    if future.cancelled() or error is not None:
+        raise RenderFailed(f'Не удалось отрендерить {path.name}') from error
+    return path
+
+
+# ─────────── пакетная выгрузка ───────────
+def render_ticket_pdfs(tickets, progress=None):
+    """
+    Последовательный вариант iter_ticket_pdfs для веб-воркера:
+    без дочерних процессов, по одному документу в памяти.
+    """
+    for done, ticket in enumerate(tickets, 1):
+        yield f'ticket_{ticket.pk}.pdf', render_pdf(ticket_html(ticket))
+        if progress:
+            progress(done)
+
+
+def _init_export_worker(css_file):
+    # дочерний процесс не трогает Django: путь к CSS приходит готовым
+    _stylesheets(css_file)
+
+
+def iter_ticket_pdfs(tickets, workers=None, progress=None):
+    """
+    Рендерит билеты параллельно в пуле процессов и отдаёт
+    (имя файла, байты PDF) в исходном порядке. В работе держится
+    не больше 2×workers документов, поэтому память не растёт
+    с размером выборки. progress(n) вызывается после каждого файла.
+    Только для management-команды: в веб-воркере пул не форкаем.
+    """
+    workers = workers or getattr(settings, 'PDF_EXPORT_WORKERS', None) \
+        or os.cpu_count() or 1
+    window = deque()
+
+    def pop():
+        name, future = window.popleft()
+        result = name, future.result()
+        if progress:
+            progress(done + 1)
+        return result
+
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_export_worker,
+                             initargs=(finders.find(STYLESHEET),)) as pool:
+        for ticket in tickets:
+            window.append((f'ticket_{ticket.pk}.pdf',
+                           pool.submit(render_pdf, ticket_html(ticket))))
+            while window and (len(window) >= 2 * workers
+                              or window[0][1].done()):
+                yield pop()
+                done += 1
+        while window:
+            yield pop()
+            done += 1
+
+
+class _ZipSink:
+    """Поток только на запись: zipfile пишет в него без seek()."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_zip(files):
+    """Склеивает (имя, байты) в ZIP, отдавая его кусками по мере готовности."""
+    sink = _ZipSink()
+    # PDF уже сжат — ZIP_STORED экономит CPU без потери размера
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for name, data in files:
+            zf.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_queryset(queryset):
+    """Билеты для выгрузки: всё нужное шаблону одним JOIN, курсором."""
+    return (queryset
+            .select_related('user', 'seat', 'session__movie',
+                            'session__hall__cinema')
+            .order_by('pk')
+            .iterator(chunk_size=500))
@@ -11,3 +11,25 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         return request.user and request.user.is_staff
+
+
+class CanExport(permissions.BasePermission):
+    """
+    Выгрузки (cinema.exports) — персоналу и партнёрам: пользователю
+    нужно право export.permission (напрямую или через группу).
+    Билеты — только персоналу.
+    """
+
+    def has_permission(self, request, view):
+        from .exports import EXPORTS
+
+        user = request.user
+        if not (user and user.is_authenticated):
+            return False
+        if user.is_staff:
+            return True
+        export = EXPORTS.get(view.kwargs.get('kind'))
+        if export is None:                     # 404 отдаст само view
+            return True
+        return (not export.staff_only and export.permission is not None
+                and user.has_perm(export.permission))
@@ -1,8 +1,15 @@
-from django.db.models import Avg
+import os
+import re
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 
-from .models import Movie, Genre, Actor, Review, Favorite
+from .models import (
+    Movie, Genre, Actor, Review, Favorite, SalesRollup, TrailerUpload,
+)
+from .tracing import TracedSerializerMixin
 
 User = get_user_model()
 
@@ -28,8 +35,32 @@ class ReviewSerializer(serializers.ModelSerializer):
                             'author_name', 'is_approved')
 
 
+class ReviewModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(),
+                                allow_empty=False, max_length=5000)
+    action = serializers.ChoiceField(choices=('approve', 'reject'))
+
+
 # ─────────── Movie ───────────
-class MovieSerializer(serializers.ModelSerializer):
+# общие с быстрым списком (cinema.fast_api)
+def poster_variant_urls(variants, storage, absolute):
+    return {
+        label: {fmt: absolute(storage.url(name))
+                for fmt, name in names.items()}
+        for label, names in [('thumb', variants['thumb']),
+                             *variants['widths'].items()]
+    }
+
+
+def poster_srcset(variants, storage, absolute):
+    return ', '.join(
+        f"{absolute(storage.url(names['webp']))} {width}w"
+        for width, names in variants['widths'].items()
+    )
+
+
+class MovieSerializer(TracedSerializerMixin,
+                      serializers.ModelSerializer):
     genres = serializers.PrimaryKeyRelatedField(
         many=True, queryset=Genre.objects.all(), required=False
     )
@@ -45,6 +76,8 @@ class MovieSerializer(serializers.ModelSerializer):
     )
 
     trailer = serializers.FileField(required=False)          # <── FileField
+    poster_variants = serializers.SerializerMethodField()
+    poster_srcset = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
     is_favorite = serializers.SerializerMethodField()
     trailer_url = serializers.URLField(required=False)  # URLField → API
@@ -53,7 +86,8 @@ class MovieSerializer(serializers.ModelSerializer):
         model = Movie
         fields = (
             'id', 'title', 'description', 'release_date',
-            'poster', 'trailer', 'trailer_url',
+            'poster', 'poster_variants', 'poster_srcset',
+            'trailer', 'trailer_url',
             'country', 'country_name',
             'main_genre', 'main_genre_name',
             'genres', 'actors',
@@ -62,9 +96,26 @@ class MovieSerializer(serializers.ModelSerializer):
 
     # ───── вычисляемые поля ─────
     def get_average_rating(self, obj):
-        return getattr(obj, 'computed_rating', None) \
-            or obj.reviews.filter(is_approved=True) \
-                          .aggregate(avg=Avg('rating'))['avg']
+        # без запроса на каждую строку: аннотация или денорм. avg_rating
+        if hasattr(obj, 'computed_rating'):
+            return obj.computed_rating
+        return obj.avg_rating or None
+
+    def _absolute(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_poster_variants(self, obj):
+        if not obj.has_poster_variants:
+            return None
+        return poster_variant_urls(obj.poster_variants, obj.poster.storage,
+                                   self._absolute)
+
+    def get_poster_srcset(self, obj):
+        if not obj.has_poster_variants:
+            return ''
+        return poster_srcset(obj.poster_variants, obj.poster.storage,
+                             self._absolute)
 
     def get_is_favorite(self, obj):
         favs = self.context.get('favorite_ids')
@@ -90,3 +141,106 @@ class MovieSerializer(serializers.ModelSerializer):
         if actors is not None:
             movie.actors.set(actors)
         return movie
+
+
+def not_in_future(value):
+    # то же правило, что в Movie.clean
+    if value > timezone.localdate():
+        raise serializers.ValidationError(
+            'Дата выхода не может быть в будущем.')
+
+
+class MovieBulkItemSerializer(serializers.Serializer):
+    """
+    Элемент пакетной записи (cinema.bulk). Ссылки — голые id: их
+    существование и дубли названий проверяются одним запросом на пачку,
+    а не PrimaryKeyRelatedField и UniqueTogetherValidator на каждый фильм.
+    """
+    id = serializers.IntegerField(required=False)
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField()
+    release_date = serializers.DateField(validators=[not_in_future])
+    trailer_url = serializers.URLField(required=False, allow_null=True,
+                                       allow_blank=True)
+    country = serializers.IntegerField()
+    main_genre = serializers.IntegerField()
+    genres = serializers.ListField(child=serializers.IntegerField(),
+                                   required=False)
+    actors = serializers.ListField(child=serializers.IntegerField(),
+                                   required=False)
+
+
+class CatalogActorSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=120)
+    role = serializers.CharField(max_length=120, required=False,
+                                 allow_blank=True, default='')
+
+
+class CatalogImportRowSerializer(serializers.Serializer):
+    """Строка фида (cinema.catalog_import): ссылки — по названиям."""
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField()
+    release_date = serializers.DateField(validators=[not_in_future])
+    trailer_url = serializers.URLField(required=False, allow_null=True,
+                                       allow_blank=True)
+    country = serializers.CharField(max_length=100)
+    main_genre = serializers.CharField(max_length=100)
+    genres = serializers.ListField(
+        child=serializers.CharField(max_length=100), required=False)
+    actors = CatalogActorSerializer(many=True, required=False)
+
+
+# ─────────── загрузка трейлера ───────────
+class TrailerUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TrailerUpload
+        fields = ('id', 'movie', 'filename', 'size', 'sha256',
+                  'offset', 'status', 'created_at')
+        read_only_fields = ('id', 'offset', 'status', 'created_at')
+
+    def validate_filename(self, value):
+        name = os.path.basename(value.replace('\\', '/'))
+        if not name:
+            raise serializers.ValidationError('Пустое имя файла.')
+        return name
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.TRAILER_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Размер должен быть от 1 до {settings.TRAILER_MAX_SIZE} байт.'
+            )
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError('Ожидается hex SHA-256.')
+        return value
+
+
+# ─────────── аналитика продаж ───────────
+class SalesReportQuerySerializer(serializers.Serializer):
+    scope = serializers.ChoiceField(choices=SalesRollup.Scope.choices,
+                                    default=SalesRollup.Scope.MOVIE)
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    object_ids = serializers.ListField(child=serializers.IntegerField(),
+                                       required=False)
+    by_day = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError(
+                'date_from не может быть позже date_to.'
+            )
+        return attrs
+
+
+class SalesReportRowSerializer(serializers.Serializer):
+    object_id = serializers.IntegerField()
+    day = serializers.DateField(required=False)
+    tickets_sold = serializers.IntegerField()
+    tickets_cancelled = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    capacity = serializers.IntegerField()
+    occupancy = serializers.FloatField()
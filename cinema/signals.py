@@ -0,0 +1,143 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import analytics, api_cache, auth_cache, images, storage
+from .models import Movie, Review, Session, Ticket, User
+
+
+# ─────────── свёртки продаж ───────────
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def ticket_changed(sender, instance, **kwargs):
+    analytics.schedule_sessions([instance.session_id])
+
+
+@receiver(pre_save, sender=Session)
+def session_remember_day(sender, instance, **kwargs):
+    # при переносе сеанса нужно пересчитать и старый день
+    instance._old_starts_at = (
+        Session.objects.filter(pk=instance.pk)
+        .values_list('starts_at', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+def session_changed(sender, instance, **kwargs):
+    days = {timezone.localdate(instance.starts_at)}
+    old = getattr(instance, '_old_starts_at', None)
+    if old:
+        days.add(timezone.localdate(old))
+    analytics.schedule_days(days)
+
+
+# ─────────── средняя оценка фильма ───────────
+def _schedule_rating(movie_ids):
+    """
+    Копит id фильмов на соединении до коммита: первый колбэк после
+    коммита пересчитывает avg_rating одним UPDATE на все, остальные
+    видят пустой набор. Вне транзакции on_commit срабатывает сразу.
+    Id из откатившейся транзакции просто пересчитаются лишний раз.
+    """
+    conn = transaction.get_connection()
+    pending = conn.__dict__.setdefault('_pending_ratings', set())
+    pending.update(movie_ids)
+
+    def flush():
+        ids = set(pending)
+        pending.clear()
+        if ids:
+            Movie.objects.refresh_avg_rating(ids)
+    transaction.on_commit(flush, robust=True)
+
+
+@receiver(pre_save, sender=Review)
+def review_remember_movie(sender, instance, **kwargs):
+    # отзыв перенесли на другой фильм — пересчитать нужно оба
+    instance._old_movie_id = (
+        Review.objects.filter(pk=instance.pk)
+        .values_list('movie_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    old = getattr(instance, '_old_movie_id', None)
+    _schedule_rating({instance.movie_id, old} - {None})
+
+
+# ─────────── кэш ответов API ───────────
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(m2m_changed)
+def api_data_changed(sender, **kwargs):
+    # m2m_changed: sender — промежуточная модель (MovieGenre, MovieActor);
+    # билеты, свёртки, пользователи и прочее в кэшируемые ответы не входят
+    if kwargs.get('action', 'post_').startswith('post_') and \
+            api_cache.watched(sender):
+        api_cache.bump(sender)
+
+
+# ─────────── кэш аутентификации ───────────
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    auth_cache.forget_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    auth_cache.forget_token(instance.key)
+
+
+# ─────────── варианты постера ───────────
+@receiver(post_save, sender=Movie)
+def movie_poster_changed(sender, instance, **kwargs):
+    if instance.poster and not instance.has_poster_variants:
+        transaction.on_commit(
+            partial(images.schedule_poster_variants,
+                    instance.pk, instance.poster.name)
+        )
+    elif not instance.poster and instance.poster_variants:
+        Movie.objects.filter(pk=instance.pk).update(poster_variants={})
+        transaction.on_commit(
+            partial(images.delete_variants, instance.poster.storage,
+                    instance.poster_variants)
+        )
+
+
+# ─────────── ссылки на файлы в CAS-хранилище ───────────
+def _file_names(movie):
+    return {movie.poster.name, movie.trailer.name} - {None, ''}
+
+
+@receiver(pre_save, sender=Movie)
+def movie_remember_files(sender, instance, **kwargs):
+    old = (Movie.objects.filter(pk=instance.pk)
+           .values_list('poster', 'trailer').first()
+           if instance.pk else None)
+    instance._old_file_names = set(old or ()) - {None, ''}
+
+
+@receiver(post_save, sender=Movie)
+def movie_files_changed(sender, instance, **kwargs):
+    storage.replace_references(
+        instance.poster.storage,
+        getattr(instance, '_old_file_names', set()),
+        _file_names(instance),
+    )
+
+
+@receiver(post_delete, sender=Movie)
+def movie_files_released(sender, instance, **kwargs):
+    storage.release(storage.movie_references(instance))
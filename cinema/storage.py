@@ -0,0 +1,214 @@
+"""
+Хранилище медиа с адресацией по содержимому.
+
+Файл при сохранении хэшируется на лету и кладётся по пути
+<каталог>/<2 символа хэша>/<остаток хэша><расширение>. Одинаковые
+постеры и трейлеры занимают место один раз. Ссылки фильмов на файлы
+считаются в MediaBlob.ref_count; файлы без ссылок удаляет команда
+gc_media_blobs.
+"""
+import datetime
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+BLOB_RE = re.compile(r'^[^/]+/[0-9a-f]{2}/[0-9a-f]{62}(\.[a-z0-9]+)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, выбирающий имя файла по SHA-256 содержимого."""
+
+    def get_available_name(self, name, max_length=None):
+        # суффиксы не нужны: итоговое имя определяет _save
+        return name
+
+    def blob_name(self, name, digest):
+        top = name.split('/', 1)[0] if '/' in name else 'blobs'
+        ext = posixpath.splitext(name)[1].lower()
+        return f'{top}/{digest[:2]}/{digest[2:]}{ext}'
+
+    def _save(self, name, content):
+        incoming = os.path.join(self.location, '.incoming')
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    fh.write(chunk)
+                    size += len(chunk)
+            final = self.blob_name(name, digest.hexdigest())
+            path = self.path(final)
+            # сначала свежий touched_at: сборщик мусора удаляет только
+            # давно не тронутые записи и файл — под блокировкой записи,
+            # так что после этой строки файл либо останется, либо его
+            # уже нет и мы запишем его заново
+            register_blob(final, size)
+            if os.path.exists(path):
+                os.remove(tmp)                      # такой файл уже есть
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp, self.file_permissions_mode)
+                os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return final
+
+
+def media_storage():
+    """Хранилище для Movie.poster / Movie.trailer (callable для миграций)."""
+    # без явного location: MEDIA_ROOT/MEDIA_URL читаются из настроек лениво
+    return ContentAddressedStorage()
+
+
+def is_blob(name):
+    return bool(name) and bool(BLOB_RE.match(name))
+
+
+# ─────────── учёт ссылок ───────────
+def register_blob(name, size):
+    from .models import MediaBlob
+
+    now = timezone.now()
+    touched = MediaBlob.objects.filter(name=name).update(touched_at=now)
+    if not touched:
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=size,
+                                         touched_at=now)
+        except IntegrityError:                     # успел соседний процесс
+            MediaBlob.objects.filter(name=name).update(touched_at=now)
+
+
+def _adjust(names, delta):
+    from .models import MediaBlob
+
+    names = [n for n in names if is_blob(n)]
+    if names:
+        MediaBlob.objects.filter(name__in=names) \
+                         .update(ref_count=F('ref_count') + delta)
+
+
+def retain(names):
+    _adjust(names, +1)
+
+
+def release(names):
+    _adjust(names, -1)
+
+
+def replace_references(storage, old_names, new_names):
+    """
+    Фильм перестал ссылаться на old_names и ссылается на new_names.
+    В CAS-хранилище это только счётчики (файл может быть общим),
+    в обычном — старые файлы удаляются сразу.
+    """
+    old_names, new_names = set(old_names), set(new_names)
+    if isinstance(storage, ContentAddressedStorage):
+        retain(new_names - old_names)
+        release(old_names - new_names)
+    else:
+        for name in old_names - new_names:
+            storage.delete(name)
+
+
+def movie_references(movie):
+    """Все файлы хранилища, на которые ссылается фильм."""
+    from .images import variant_names
+
+    names = {movie.poster.name, movie.trailer.name}
+    names |= variant_names(movie.poster_variants or {})
+    return {n for n in names if n}
+
+
+def recount():
+    """Пересчитывает ref_count по фактическим ссылкам из фильмов."""
+    from collections import Counter
+
+    from .models import MediaBlob, Movie
+
+    counts = Counter()
+    movies = Movie.objects.only('poster', 'trailer', 'poster_variants')
+    for movie in movies.iterator(chunk_size=2000):
+        counts.update(n for n in movie_references(movie) if is_blob(n))
+    fixed = 0
+    for blob in MediaBlob.objects.iterator(chunk_size=2000):
+        actual = counts.get(blob.name, 0)
+        if blob.ref_count != actual:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=actual)
+            fixed += 1
+    return fixed
+
+
+def _adopt_orphans(storage, cutoff, dry_run):
+    """
+    Файлы на диске без записи MediaBlob, старше cutoff, получают запись
+    с ref_count=0 и touched_at=mtime — дальше их удаляют как обычные
+    мёртвые блобы. Если _save успел завести свою запись, ignore_conflicts
+    её не тронет, и файл останется.
+    """
+    from .models import MediaBlob
+
+    orphans = []
+    for top in ('posters', 'trailers'):
+        root = storage.path(top)
+        for dirpath, _dirs, files in os.walk(root):
+            for filename in files:
+                full = os.path.join(dirpath, filename)
+                name = os.path.relpath(full, storage.location) \
+                         .replace(os.sep, '/')
+                stat = os.stat(full)
+                if is_blob(name) and stat.st_mtime < cutoff.timestamp():
+                    orphans.append(MediaBlob(
+                        name=name, size=stat.st_size,
+                        touched_at=timezone.make_aware(
+                            datetime.datetime.fromtimestamp(stat.st_mtime))))
+    if dry_run:
+        known = set(MediaBlob.objects.filter(
+            name__in=[blob.name for blob in orphans])
+            .values_list('name', flat=True))
+        return [blob.name for blob in orphans if blob.name not in known]
+    MediaBlob.objects.bulk_create(orphans, ignore_conflicts=True,
+                                  batch_size=500)
+    return []
+
+
+def collect_garbage(grace, dry_run=False):
+    """
+    Удаляет файлы без ссылок, не трогавшиеся дольше grace (timedelta),
+    и «сироты» на диске без записи MediaBlob. Возвращает список имён.
+    """
+    from .models import MediaBlob
+
+    storage = media_storage()
+    cutoff = timezone.now() - grace
+    removed = _adopt_orphans(storage, cutoff, dry_run)
+
+    dead = MediaBlob.objects.filter(ref_count__lte=0, touched_at__lt=cutoff)
+    for name in list(dead.values_list('name', flat=True)):
+        if dry_run:
+            removed.append(name)
+            continue
+        # запись перепроверяем под блокировкой: её могли переиспользовать;
+        # register_blob в _save ждёт, пока файл и запись не удалены
+        with transaction.atomic():
+            if list(dead.select_for_update().filter(name=name)
+                    .values_list('name', flat=True)):
+                storage.delete(name)
+                dead.filter(name=name).delete()
+                removed.append(name)
+    return removed
@@ -0,0 +1,83 @@
+"""
+Отдача больших файлов (трейлеров) с поддержкой HTTP Range.
+
+Ответ строится на FileResponse: если WSGI-сервер умеет sendfile
+(gunicorn и т. п.), файл уходит без копирования через Python,
+начиная с позиции, куда указывает дескриптор.
+"""
+import re
+
+from django.http import FileResponse, HttpResponse
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _RangeReader:
+    """Окно [start, start+length) поверх открытого файла."""
+
+    def __init__(self, fh, start, length):
+        self.fh, self.remaining = fh, length
+        self.name = getattr(fh, 'name', '')
+        fh.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def close(self):
+        self.fh.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) включительно для одного диапазона из заголовка Range,
+    None — если заголовка нет или он нам не подходит (несколько
+    диапазонов, чужие единицы), ValueError — если диапазон невыполним.
+    """
+    match = _RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:                          # bytes=-N — последние N байт
+        length = int(last)
+        if not length:
+            raise ValueError('empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('unsatisfiable range')
+    return start, end
+
+
+def ranged_file_response(request, field_file, content_type=None):
+    """FileResponse для FieldFile с ответом 206 на запросы Range."""
+    size = field_file.size
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    fh = field_file.storage.open(field_file.name, 'rb')
+    if byte_range is None:
+        response = FileResponse(fh, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(_RangeReader(fh, start, end - start + 1),
+                                status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
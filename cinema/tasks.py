@@ -0,0 +1,51 @@
+"""
+Фоновые задачи в пуле потоков текущего процесса.
+
+Без внешней очереди: подходит для коротких задач вне цикла запроса
+(рендер PDF, обработка медиа). BACKGROUND_TASKS_EAGER=True выполняет
+задачи сразу — удобно в тестах.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+                thread_name_prefix='cinema-task',
+            )
+        return _executor
+
+
+def _run(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        logger.exception('Фоновая задача %s упала', fn.__qualname__)
+        raise
+    finally:
+        # соединения с БД у потока свои — не оставляем их висеть
+        connections.close_all()
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+    return get_executor().submit(_run, fn, args, kwargs)
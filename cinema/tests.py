@@ -1,6 +1,74 @@
-from django.test import TestCase
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.contrib.auth.models import Permission
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.http import HttpResponse
+from django.db import connection, transaction
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Country, Genre, Movie
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from mafisha.databases import database_from_env, replicas_from_env
+
+from .models import (
+    Country, Genre, Movie, Cinema, Hall, Session, Ticket, User, SalesRollup,
+    MediaBlob, Review, Actor, Favorite,
+)
+from .db_routers import PrimaryReplicaRouter, ReadYourWritesMiddleware
+from .filters import MovieFilter
+from .forms import ReviewForm
+from . import (api_cache, benchmarks, catalog_import, checks, datagen,
+               exports, index_advisor, throttling, tracing)
+from .api_views import MovieViewSet
+from .instrumentation import QueryBudget, fingerprint, registry
+from .moderation import find_banned_words
+from .storage import collect_garbage
+from .management.commands.load_purchase import run_load
+from .management.commands.stress_sqlite import run_stress
+
+
+def seed_catalog(movies=5, users=2):
+    """Фильмы, зрители и отзывы (каждый третий не одобрен) для тестов API."""
+    country = Country.objects.create(name='Страна каталога')
+    genre = Genre.objects.create(name='Жанр каталога')
+    film_list = Movie.objects.bulk_create(
+        Movie(title=f'Фильм {i}', description='…', country=country,
+              main_genre=genre,
+              release_date=datetime.date(2000 + i % 25, 1 + i % 12, 1))
+        for i in range(movies)
+    )
+    people = User.objects.bulk_create(
+        User(username=f'viewer-{i}', password='!') for i in range(users)
+    )
+    now = timezone.now()
+    Review.objects.bulk_create(
+        Review(movie=movie, user=user, rating=1 + i % 10,
+               is_approved=i % 3 != 0,
+               created_at=now - datetime.timedelta(hours=i))
+        for i, (movie, user) in enumerate(
+            (movie, user) for movie in film_list for user in people)
+    )
+    Movie.objects.refresh_avg_rating(m.pk for m in film_list)
+    return {'movie': film_list[0], 'user': people[0]}
 
 class MovieViewsTests(TestCase):
     def setUp(self):
@@ -17,3 +85,1425 @@ class MovieViewsTests(TestCase):
     def test_movie_list_view(self):
         resp = self.client.get(reverse('cinema:movie-list'))
         self.assertEqual(resp.status_code, 200)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        country = Country.objects.create(name='США')
+        genre = Genre.objects.create(name='Драма')
+        self.movie = Movie.objects.create(
+            title='Test', description='lorem', release_date='2024-01-01',
+            country=country, main_genre=genre,
+        )
+        cinema = Cinema.objects.create(name='Кино', address='ул.',
+                                       lat=0, lng=0)
+        self.hall = Hall.objects.create(cinema=cinema, name='1',
+                                        rows=2, seats_per_row=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session = Session.objects.create(
+                movie=self.movie, hall=self.hall,
+                starts_at=timezone.now(), price=Decimal('300.00'),
+            )
+        self.user = User.objects.create_user('buyer', password='x')
+        self.day = timezone.localdate(self.session.starts_at)
+
+    def buy(self, seat, status='paid'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ticket.objects.create(user=self.user, session=self.session,
+                                         seat=seat, status=status)
+
+    def test_rollups_follow_ticket_writes(self):
+        seats = list(self.hall.seats.all()[:3])
+        self.buy(seats[0])
+        self.buy(seats[1])
+        ticket = self.buy(seats[2], status='reserved')
+
+        row = SalesRollup.objects.get(scope='movie', object_id=self.movie.pk,
+                                      day=self.day)
+        self.assertEqual((row.tickets_sold, row.revenue, row.capacity),
+                         (3, 600, 10))
+        self.assertAlmostEqual(row.occupancy, 0.3)
+
+        ticket.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.save()
+        row = SalesRollup.objects.get(scope='hall', object_id=self.hall.pk,
+                                      day=self.day)
+        self.assertEqual((row.tickets_sold, row.tickets_cancelled), (2, 1))
+
+    def test_ticket_refreshes_only_its_rows(self):
+        other_hall = Hall.objects.create(cinema=self.hall.cinema, name='2',
+                                         rows=1, seats_per_row=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Session.objects.create(
+                movie=self.movie, hall=other_hall,
+                starts_at=self.session.starts_at, price=Decimal('100.00'))
+        SalesRollup.objects.filter(scope='session',
+                                   object_id=other.pk).update(capacity=99)
+        self.buy(self.hall.seats.first())
+        self.assertEqual(SalesRollup.objects.get(
+            scope='session', object_id=other.pk).capacity, 99)
+        row = SalesRollup.objects.get(scope='cinema',
+                                      object_id=self.hall.cinema_id)
+        self.assertEqual((row.tickets_sold, row.capacity), (1, 15))
+
+        # сбой пересчёта после коммита не ломает покупку
+        with mock.patch('cinema.analytics._write',
+                        side_effect=RuntimeError), \
+                self.assertLogs(level='ERROR'):
+            self.buy(list(self.hall.seats.all())[1])
+        self.assertEqual(Ticket.objects.count(), 2)
+
+    def test_report_api_is_staff_only(self):
+        self.buy(self.hall.seats.first())
+        url = reverse('cinema:api-sales-report')
+        params = {'scope': 'cinema', 'date_from': self.day,
+                  'date_to': self.day}
+        self.assertEqual(self.client.get(url, params).status_code, 401)
+
+        staff = User.objects.create_user('boss', password='x', is_staff=True)
+        self.client.force_login(staff)
+        data = self.client.get(url, params).json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['tickets_sold'], 1)
+        self.assertEqual(data[0]['revenue'], '300.00')
+
+
+class TicketPdfTests(TestCase):
+    def setUp(self):
+        country = Country.objects.create(name='США')
+        genre = Genre.objects.create(name='Драма')
+        movie = Movie.objects.create(
+            title='Test', description='lorem', release_date='2024-01-01',
+            country=country, main_genre=genre,
+        )
+        cinema = Cinema.objects.create(name='Кино', address='ул.',
+                                       lat=0, lng=0)
+        hall = Hall.objects.create(cinema=cinema, name='1',
+                                   rows=1, seats_per_row=1)
+        session = Session.objects.create(movie=movie, hall=hall,
+                                         starts_at=timezone.now(),
+                                         price=Decimal('300.00'))
+        self.ticket = Ticket.objects.create(
+            user=User.objects.create_user('buyer', password='x'),
+            session=session, seat=hall.seats.get(),
+        )
+        self.client.force_login(
+            User.objects.create_user('boss', password='x', is_staff=True)
+        )
+        self.url = reverse('cinema:admin_ticket_pdf', args=[self.ticket.id])
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_pdf_is_rendered_once_and_served_from_cache(self):
+        with override_settings(TICKET_PDF_CACHE_DIR=self.tmp.name,
+                               BACKGROUND_TASKS_EAGER=True), \
+                mock.patch('cinema.pdf.render_pdf',
+                           return_value=b'%PDF-fake') as render:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(b''.join(second.streaming_content), b'%PDF-fake')
+        self.assertEqual(render.call_count, 1)
+
+        # смена статуса меняет HTML → новая версия файла
+        self.ticket.status = Ticket.Status.CANCELLED
+        self.ticket.save()
+        with override_settings(TICKET_PDF_CACHE_DIR=self.tmp.name,
+                               BACKGROUND_TASKS_EAGER=True), \
+                mock.patch('cinema.pdf.render_pdf',
+                           return_value=b'%PDF-new') as render:
+            self.client.get(self.url)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 1)
+
+    def test_pending_render_answers_202(self):
+        with override_settings(TICKET_PDF_CACHE_DIR=self.tmp.name), \
+                mock.patch('cinema.tasks.submit',
+                           return_value=Future()) as submit:
+            resp = self.client.get(self.url)
+            self.client.get(self.url)
+        self.assertEqual(submit.call_count, 1)      # без дублей рендера
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp['Retry-After'], '2')
+
+    def test_failed_render_is_an_error_not_endless_polling(self):
+        failed = Future()
+        failed.set_exception(OSError('нет Pango'))
+        with override_settings(TICKET_PDF_CACHE_DIR=self.tmp.name), \
+                mock.patch('cinema.tasks.submit',
+                           return_value=failed) as submit:
+            self.assertEqual(self.client.get(self.url).status_code, 500)
+            self.assertEqual(self.client.get(self.url).status_code, 500)
+            self.assertEqual(submit.call_count, 1)
+            # после паузы — новая попытка
+            with mock.patch('cinema.pdf.RETRY_FAILED_AFTER', 0):
+                self.client.get(self.url)
+            self.assertEqual(submit.call_count, 2)
+
+    def test_admin_exports_selected_tickets_as_zip(self):
+        self.client.force_login(
+            User.objects.create_superuser('root', password='x')
+        )
+        with mock.patch('cinema.pdf.ProcessPoolExecutor') as pool, \
+                mock.patch('cinema.pdf.render_pdf',
+                           side_effect=lambda html: b'%PDF-' + html[:5].encode()):
+            resp = self.client.post(
+                reverse('admin:cinema_ticket_changelist'),
+                {'action': 'export_pdf_zip',
+                 '_selected_action': [self.ticket.pk]},
+            )
+            body = b''.join(resp.streaming_content)
+        self.assertEqual(resp['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(body)) as zf:
+            self.assertEqual(zf.namelist(), [f'ticket_{self.ticket.pk}.pdf'])
+            self.assertTrue(zf.read(zf.namelist()[0]).startswith(b'%PDF-'))
+        pool.assert_not_called()     # в веб-воркере процессы не форкаем
+
+    def test_command_exports_through_process_pool(self):
+        out = Path(self.tmp.name) / 'tickets.zip'
+        with mock.patch('cinema.pdf.ProcessPoolExecutor',
+                        ThreadPoolExecutor), \
+                mock.patch('cinema.pdf._init_export_worker'), \
+                mock.patch('cinema.pdf.render_pdf', return_value=b'%PDF-'):
+            call_command('export_ticket_pdfs', str(out), stdout=io.StringIO())
+        with zipfile.ZipFile(out) as zf:
+            self.assertEqual(zf.namelist(), [f'ticket_{self.ticket.pk}.pdf'])
+
+    @override_settings(PDF_ADMIN_EXPORT_LIMIT=0)
+    def test_admin_export_refuses_large_selection(self):
+        self.client.force_login(
+            User.objects.create_superuser('root', password='x')
+        )
+        with mock.patch('cinema.pdf.render_pdf') as render:
+            resp = self.client.post(
+                reverse('admin:cinema_ticket_changelist'),
+                {'action': 'export_pdf_zip',
+                 '_selected_action': [self.ticket.pk]},
+                follow=True,
+            )
+        render.assert_not_called()
+        self.assertContains(resp, 'export_ticket_pdfs')
+
+
+class StartupTests(TestCase):
+    def test_heavy_modules_are_not_imported_on_startup(self):
+        from .management.commands.profile_startup import measure_startup
+
+        result = measure_startup()
+        self.assertEqual(result['heavy'], [])
+        self.assertTrue(any(name == 'cinema.views'
+                            for name, *_ in result['imports']))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class PosterVariantsTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_variants_are_built_on_upload_and_exposed_in_api(self):
+        from PIL import Image
+
+        buf = io.BytesIO()
+        Image.new('RGB', (800, 1200), 'red').save(buf, 'JPEG')
+        movie = Movie(
+            title='Test', description='lorem', release_date='2024-01-01',
+            country=Country.objects.create(name='США'),
+            main_genre=Genre.objects.create(name='Драма'),
+        )
+        movie.poster.save('p.jpg', ContentFile(buf.getvalue()), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.save()
+
+        movie.refresh_from_db()
+        self.assertTrue(movie.has_poster_variants)
+        self.assertEqual(sorted(movie.poster_variants['widths']),
+                         ['320', '640'])
+        thumb = movie.poster_variants['thumb']['webp']
+        with Image.open(os.path.join(self.media.name, thumb)) as img:
+            self.assertEqual(img.size, (120, 180))
+
+        data = self.client.get(
+            reverse('cinema:movie-api-detail', args=[movie.pk])
+        ).json()
+        self.assertIn('320w', data['poster_srcset'])
+        self.assertTrue(data['poster_variants']['thumb']['jpg']
+                        .startswith('http://testserver/media/posters/'))
+        self.assertEqual(MediaBlob.objects.get(name=thumb).ref_count, 1)
+
+    def test_narrow_poster_is_advertised_with_its_real_width(self):
+        from PIL import Image
+
+        from .images import build_variants
+        from .storage import media_storage
+
+        storage = media_storage()
+        buf = io.BytesIO()
+        Image.new('RGB', (200, 300), 'red').save(buf, 'JPEG')
+        source = storage.save('posters/narrow.jpg', ContentFile(buf.getvalue()))
+        variants = build_variants(storage, source)
+        self.assertEqual(list(variants['widths']), ['200'])
+        with Image.open(storage.path(variants['widths']['200']['jpg'])) as img:
+            self.assertEqual(img.width, 200)
+        # повторная сборка — те же блобы, без копий
+        self.assertEqual(build_variants(storage, source), variants)
+
+
+class TrailerUploadTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp.name, 'media'),
+            TRAILER_UPLOAD_DIR=os.path.join(self.tmp.name, 'uploads'),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.movie = Movie.objects.create(
+            title='Test', description='lorem', release_date='2024-01-01',
+            country=Country.objects.create(name='США'),
+            main_genre=Genre.objects.create(name='Драма'),
+        )
+        self.client.force_login(
+            User.objects.create_user('boss', password='x', is_staff=True)
+        )
+        self.data = bytes(range(256)) * 40            # 10 КБ «видео»
+        self.test_atomic = len(connection.atomic_blocks)
+
+    def send(self, url, offset, chunk):
+        return self.client.patch(url, chunk,
+                                 content_type='application/offset+octet-stream',
+                                 headers={'Upload-Offset': str(offset)})
+
+    def outside_transaction(self, path):
+        # глубже обёрток самого TestCase — значит, внутри транзакции
+        self.assertEqual(len(connection.atomic_blocks), self.test_atomic)
+        with open(path, 'rb') as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+
+    def test_chunked_resumable_upload_then_range_playback(self):
+        resp = self.client.post(reverse('cinema:trailer-upload-api-list'), {
+            'movie': self.movie.pk, 'filename': '../clip.mp4',
+            'size': len(self.data),
+            'sha256': hashlib.sha256(self.data).hexdigest(),
+        })
+        self.assertEqual(resp.status_code, 201)
+        url = reverse('cinema:trailer-upload-api-detail',
+                      args=[resp.json()['id']])
+
+        self.assertEqual(self.send(url, 0, self.data[:4000]).status_code, 204)
+        # повтор уже принятого куска отклоняется, клиент узнаёт смещение
+        resp = self.send(url, 0, self.data[:4000])
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp['Upload-Offset'], '4000')
+        self.assertEqual(self.client.get(url).json()['offset'], 4000)
+        self.assertEqual(self.send(url, 4000, self.data[4000:]).status_code,
+                         204)
+
+        # ни чтение тела, ни sha256 не идут внутри транзакции
+        with mock.patch('cinema.uploads.file_sha256',
+                        side_effect=self.outside_transaction):
+            resp = self.client.post(url + 'complete/')
+        self.assertEqual(resp.status_code, 200)
+        self.movie.refresh_from_db()
+        self.assertTrue(self.movie.trailer.name.endswith('.mp4'))
+
+        trailer = reverse('cinema:movie-trailer', args=[self.movie.pk])
+        resp = self.client.get(trailer, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(b''.join(resp.streaming_content), self.data[100:200])
+        resp = self.client.get(trailer, headers={'Range': 'bytes=-10'})
+        self.assertEqual(b''.join(resp.streaming_content), self.data[-10:])
+        resp = self.client.get(trailer, headers={'Range': 'bytes=99999-'})
+        self.assertEqual(resp.status_code, 416)
+
+    def test_checksum_mismatch_resets_upload(self):
+        resp = self.client.post(reverse('cinema:trailer-upload-api-list'), {
+            'movie': self.movie.pk, 'filename': 'clip.mp4',
+            'size': len(self.data), 'sha256': '0' * 64,
+        })
+        url = reverse('cinema:trailer-upload-api-detail',
+                      args=[resp.json()['id']])
+        self.send(url, 0, self.data)
+        self.assertEqual(self.client.post(url + 'complete/').status_code, 422)
+        self.assertEqual(self.client.get(url).json()['offset'], 0)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.country = Country.objects.create(name='США')
+        self.genre = Genre.objects.create(name='Драма')
+
+    def make_movie(self, title, trailer=b'same trailer bytes'):
+        movie = Movie(title=title, description='lorem',
+                      release_date='2024-01-01', country=self.country,
+                      main_genre=self.genre)
+        movie.trailer.save('clip.MP4', ContentFile(trailer), save=False)
+        movie.save()
+        return movie
+
+    def test_identical_uploads_share_one_blob_until_unreferenced(self):
+        first = self.make_movie('Первый')
+        second = self.make_movie('Второй')
+        self.assertEqual(first.trailer.name, second.trailer.name)
+        self.assertRegex(first.trailer.name, r'^trailers/[0-9a-f]{2}/.+\.mp4$')
+        blob = MediaBlob.objects.get(name=first.trailer.name)
+        self.assertEqual(blob.ref_count, 2)
+
+        second.trailer.save('new.mp4', ContentFile(b'other'), save=True)
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 0)
+
+        # в пределах grace файл не трогаем, после — удаляем
+        self.assertEqual(collect_garbage(datetime.timedelta(hours=1)), [])
+        removed = collect_garbage(datetime.timedelta(0))
+        self.assertEqual(removed, [blob.name])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.media.name, blob.name)))
+        self.assertTrue(second.trailer.storage.exists(second.trailer.name))
+
+    def test_reupload_rescues_dead_blob_and_orphans_are_adopted(self):
+        movie = self.make_movie('Первый')
+        name, storage = movie.trailer.name, movie.trailer.storage
+        movie.delete()
+        old = timezone.now() - datetime.timedelta(hours=2)
+        MediaBlob.objects.filter(name=name).update(touched_at=old)
+        # тот же файл загружают снова, фильм ещё не сохранён
+        self.assertEqual(storage.save('trailers/clip.mp4',
+                                      ContentFile(b'same trailer bytes')),
+                         name)
+        self.assertEqual(collect_garbage(datetime.timedelta(hours=1)), [])
+        self.assertTrue(storage.exists(name))
+
+        # файл без записи MediaBlob старше grace — удаляется
+        MediaBlob.objects.filter(name=name).delete()
+        os.utime(storage.path(name), (old.timestamp(), old.timestamp()))
+        grace = datetime.timedelta(hours=1)
+        self.assertEqual(collect_garbage(grace, dry_run=True), [name])
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(collect_garbage(grace), [name])
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+
+class BannedWordsTests(TestCase):
+    def test_evasions_are_caught(self):
+        for text in ('Там СПОЙЛЕР!', 'cпoйлep в конце',        # латиница
+                     'bad\u200bword', 'ｂａｄｗｏｒｄ', 'badw0rd'):
+            with self.subTest(text=text):
+                self.assertTrue(find_banned_words(text))
+        self.assertFalse(find_banned_words('Отличный фильм'))
+
+    @override_settings(BANNED_WORDS={'bot', 'hot', 'ai'})
+    def test_only_true_confusables_are_folded(self):
+        for text in ('вот', 'нот', 'код 41'):
+            with self.subTest(text=text):
+                self.assertFalse(find_banned_words(text))
+        self.assertEqual(find_banned_words('һоt'), {'hot'})
+
+    def test_matcher_reloads_with_setting(self):
+        self.assertFalse(find_banned_words('скучно'))
+        with override_settings(BANNED_WORDS={'скучн', 'скучно'}):
+            self.assertEqual(find_banned_words('очень скучно'),
+                             {'скучн', 'скучно'})
+        self.assertFalse(find_banned_words('скучно'))
+
+    def test_matcher_reloads_when_set_is_mutated(self):
+        with override_settings(BANNED_WORDS={'скучн'}):
+            self.assertTrue(find_banned_words('скучно'))
+            settings.BANNED_WORDS.clear()       # тот же объект и длина
+            settings.BANNED_WORDS.add('затянут')
+            self.assertFalse(find_banned_words('скучно'))
+            self.assertTrue(find_banned_words('затянуто'))
+
+    def test_review_form_rejects_banned_words(self):
+        form = ReviewForm({'rating': 5, 'review_text': 'Сплошной Спойлер'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('review_text', form.errors)
+
+
+class BulkModerationTests(TestCase):
+    def setUp(self):
+        country = Country.objects.create(name='США')
+        genre = Genre.objects.create(name='Драма')
+        self.movies = [Movie.objects.create(
+            title=f'M{i}', description='lorem', release_date='2024-01-01',
+            country=country, main_genre=genre,
+        ) for i in range(2)]
+        self.staff = User.objects.create_user('mod', password='x',
+                                              is_staff=True)
+        author = User.objects.create_user('author', password='x')
+        start = timezone.now()
+        self.reviews = [Review.objects.create(
+            movie=self.movies[i % 2], user=author, rating=(i % 10) + 1,
+            created_at=start - datetime.timedelta(minutes=i),
+        ) for i in range(60)]
+
+    def test_bulk_approve_is_one_update_and_one_recompute(self):
+        ids = [r.pk for r in self.reviews[:10]]
+        with CaptureQueriesContext(connection) as ctx:
+            count = Review.objects.filter(id__in=ids).approve()
+        self.assertEqual(count, 10)
+        updates = [q['sql'] for q in ctx.captured_queries
+                   if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)   # отзывы + avg_rating фильмов
+        for movie in self.movies:
+            movie.refresh_from_db()
+        # чётные отзывы — первому фильму: оценки 1,3,5,7,9
+        self.assertEqual(self.movies[0].avg_rating, Decimal('5.00'))
+        self.assertEqual(self.movies[1].avg_rating, Decimal('6.00'))
+
+        # удаление — через сигналы, но пересчёт всё равно один на коммит
+        with CaptureQueriesContext(connection) as ctx, \
+                self.captureOnCommitCallbacks(execute=True):
+            Review.objects.filter(id__in=ids).reject()
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql']
+                              .startswith('UPDATE "cinema_movie"')]), 1)
+        self.movies[0].refresh_from_db()
+        self.assertEqual(self.movies[0].avg_rating, Decimal('0.00'))
+
+    def test_plain_writes_keep_avg_rating_fresh(self):
+        review = self.reviews[0]
+        review.is_approved = True
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()
+        self.movies[0].refresh_from_db()
+        self.assertEqual(self.movies[0].avg_rating, Decimal('1.00'))
+
+        review.movie = self.movies[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()
+        for movie in self.movies:
+            movie.refresh_from_db()
+        self.assertEqual((self.movies[0].avg_rating,
+                          self.movies[1].avg_rating),
+                         (Decimal('0.00'), Decimal('1.00')))
+
+        # удаление автора каскадом удаляет отзывы
+        with self.captureOnCommitCallbacks(execute=True):
+            review.user.delete()
+        self.movies[1].refresh_from_db()
+        self.assertEqual(self.movies[1].avg_rating, Decimal('0.00'))
+
+    def test_queue_pages_by_cursor_and_bulk_form(self):
+        self.client.force_login(self.staff)
+        url = reverse('cinema:review-moderation')
+        first = self.client.get(url)
+        self.assertEqual(len(first.context['reviews']), 50)
+        second = self.client.get(url, {'after': first.context['next_cursor']})
+        self.assertEqual([r.pk for r in second.context['reviews']],
+                         [r.pk for r in self.reviews[50:]])
+        self.assertNotIn('next_cursor', second.context)
+
+        resp = self.client.post(reverse('cinema:review-bulk'), {
+            'ids': [r.pk for r in self.reviews[:3]], 'action': 'approve',
+        })
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Review.objects.filter(is_approved=True).count(), 3)
+
+    def test_staff_api_moderate(self):
+        url = reverse('cinema:review-api-moderate')
+        self.client.force_login(User.objects.create_user('u', password='x'))
+        self.assertEqual(self.client.post(url, {}).status_code, 403)
+        self.client.force_login(self.staff)
+        resp = self.client.post(url, {'ids': [self.reviews[0].pk],
+                                      'action': 'reject'},
+                                content_type='application/json')
+        self.assertEqual(resp.json(), {'action': 'reject', 'count': 1})
+        resp = self.client.get(reverse('cinema:review-api-pending'))
+        self.assertEqual(len(resp.json()['results']), 50)
+        self.assertTrue(resp.json()['next'])
+
+
+class BulkCatalogWriteTests(TestCase):
+    def setUp(self):
+        self.country = Country.objects.create(name='США')
+        self.genres = [Genre.objects.create(name=n)
+                       for n in ('Драма', 'Хоррор')]
+        self.actor = Actor.objects.create(name='Актёр')
+        Movie.objects.create(title='Existing', description='-',
+                             release_date='2020-01-01', country=self.country,
+                             main_genre=self.genres[0])
+        self.client.force_login(User.objects.create_user(
+            'sync', password='x', is_staff=True))
+        self.url = reverse('cinema:movie-api-bulk')
+
+    def item(self, title, **extra):
+        return {'title': title, 'description': '-',
+                'release_date': '2021-05-01', 'country': self.country.pk,
+                'main_genre': self.genres[0].pk,
+                'genres': [g.pk for g in self.genres],
+                'actors': [self.actor.pk], **extra}
+
+    def post(self, items, method='post'):
+        return getattr(self.client, method)(self.url, items,
+                                            content_type='application/json')
+
+    def test_create_reports_per_item_and_writes_links_in_bulk(self):
+        items = [self.item('A'), self.item('EXISTING',
+                                           release_date='2020-01-01'),
+                 self.item('B', country=999), self.item('a'),
+                 self.item('C', release_date='2999-01-01')]
+        resp = self.post(items)
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual((body['created'], body['errors']), (1, 4))
+        statuses = [r['status'] for r in body['results']]
+        self.assertEqual(statuses, ['created'] + ['error'] * 4)
+        self.assertIn('non_field_errors', body['results'][1]['errors'])
+        self.assertIn('country', body['results'][2]['errors'])
+        self.assertIn('non_field_errors', body['results'][3]['errors'])
+        self.assertIn('release_date', body['results'][4]['errors'])
+        movie = Movie.objects.get(pk=body['results'][0]['id'])
+        self.assertEqual(movie.genres.count(), 2)
+        self.assertEqual(movie.movieactor_set.get().actor, self.actor)
+
+    def test_query_count_does_not_grow_with_items(self):
+        def queries(n, prefix):
+            with CaptureQueriesContext(connection) as ctx:
+                self.post([self.item(f'{prefix}{i}') for i in range(n)])
+            return len(ctx.captured_queries)
+        queries(1, 'w')         # пользователь сессии попадает в кэш
+        self.assertEqual(queries(3, 'x'), queries(40, 'y'))
+
+    def test_update_replaces_links_and_keeps_missing_fields(self):
+        ids = [r['id'] for r in self.post(
+            [self.item('P'), self.item('Q')]).json()['results']]
+        resp = self.post([{'id': ids[0], 'title': 'P2',
+                           'genres': [self.genres[1].pk]},
+                          {'id': ids[1], 'title': 'Existing',
+                           'release_date': '2020-01-01'},
+                          {'title': 'no id'}], method='patch')
+        body = resp.json()
+        self.assertEqual((body['updated'], body['errors']), (1, 2))
+        movie = Movie.objects.get(pk=ids[0])
+        self.assertEqual((movie.title, movie.description), ('P2', '-'))
+        self.assertEqual(list(movie.genres.all()), [self.genres[1]])
+        self.assertEqual(movie.actors.count(), 1)
+        self.assertEqual(Movie.objects.get(pk=ids[1]).title, 'Q')
+
+    def test_lower_is_split_below_sqlite_limits(self):
+        from .bulk import _db_lower
+
+        titles = [f'T{i}' for i in range(2500)]    # > 2000 колонок SQLite
+        self.assertEqual(_db_lower(titles), [t.lower() for t in titles])
+        # дубли «без учёта регистра» ловятся и между группами LOWER
+        with mock.patch('cinema.bulk.LOWER_CHUNK', 2):
+            body = self.post([self.item(t) for t in
+                              ('Dup', 'X', 'Y', 'DUP', 'Z')]).json()
+        self.assertEqual((body['created'], body['errors']), (4, 1))
+
+    def test_requires_staff_and_a_list(self):
+        self.assertEqual(self.post({'title': 'x'}).status_code, 400)
+        self.client.logout()
+        self.assertIn(self.post([self.item('Z')]).status_code, (401, 403))
+
+
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()            # вёдра THROTTLE_RATES
+        throttling.reset_local()
+        self.addCleanup(throttling.reset_local)
+        seed_catalog(movies=7, users=3)
+        self.user = User.objects.create_user('partner', password='x')
+        self.user.user_permissions.add(*Permission.objects.filter(
+            content_type__app_label='cinema',
+            codename__in=('view_movie', 'view_review')))
+        self.client.force_login(self.user)
+
+    def get_lines(self, url, **params):
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        return b''.join(resp.streaming_content).decode().splitlines()
+
+    def test_ndjson_with_links_and_keyset_resume(self):
+        url = reverse('cinema:api-export', args=['movies', 'ndjson'])
+        with override_settings(EXPORT_CHUNK_SIZE=3):
+            rows = [json.loads(line) for line in self.get_lines(url)]
+            tail = [json.loads(line) for line in
+                    self.get_lines(url, after=rows[3]['id'])]
+        self.assertEqual([r['id'] for r in rows],
+                         list(Movie.objects.order_by('id')
+                              .values_list('id', flat=True)))
+        self.assertEqual(tail, rows[4:])
+        movie = Movie.objects.get(pk=rows[0]['id'])
+        self.assertEqual(rows[0]['genres'],
+                         sorted(movie.genres.values_list('name', flat=True)))
+
+    def test_queries_per_chunk_do_not_depend_on_rows(self):
+        def queries(chunk):
+            with CaptureQueriesContext(connection) as ctx:
+                list(exports.stream(exports.EXPORTS['movies'], 'csv',
+                                    chunk_size=chunk))
+            return len(ctx.captured_queries)
+        # одна выборка + жанры и актёры на каждую пачку
+        self.assertEqual(queries(100), 3)
+
+    def test_csv_and_ticket_access(self):
+        lines = self.get_lines(reverse('cinema:api-export',
+                                       args=['reviews', 'csv']))
+        self.assertEqual(lines[0].split(',')[:3],
+                         ['id', 'movie_id', 'movie_title'])
+        self.assertEqual(len(lines) - 1,
+                         Review.objects.filter(is_approved=True).count())
+        tickets = reverse('cinema:api-export', args=['tickets', 'csv'])
+        self.assertEqual(self.client.get(tickets).status_code, 403)
+
+    def test_plain_accounts_cannot_export(self):
+        self.client.force_login(User.objects.create_user('viewer'))
+        for kind in ('movies', 'reviews', 'tickets'):
+            with self.subTest(kind=kind):
+                url = reverse('cinema:api-export', args=[kind, 'csv'])
+                self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(
+            User.objects.create_user('ops', is_staff=True))
+        url = reverse('cinema:api-export', args=['tickets', 'csv'])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(THROTTLE_RATES={'export': '2/hour'})
+    def test_exports_are_throttled(self):
+        url = reverse('cinema:api-export', args=['movies', 'csv'])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 429)
+
+    def test_resume_point_skips_torn_record(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'reviews.csv'
+            path.write_text('id,text\r\n1,"a\nb"\r\n2,"c\nd', 'utf-8')
+            self.assertEqual(exports.resume_point(path, 'csv'),
+                             (1, len('id,text\r\n1,"a\nb"\r\n')))
+            path.write_text('{"id": 5}\n{"id": 6', 'utf-8')
+            self.assertEqual(exports.resume_point(path, 'ndjson'),
+                             (5, len('{"id": 5}\n')))
+
+
+class CatalogImportTests(TestCase):
+    ROWS = [
+        {'title': 'Сталкер', 'description': 'Зона',
+         'release_date': '1979-05-25', 'country': 'СССР',
+         'main_genre': 'Драма', 'genres': ['Драма', 'Фантастика'],
+         'actors': [{'name': 'Кайдановский', 'role': 'Сталкер'}]},
+        {'title': 'Солярис', 'description': 'Станция',
+         'release_date': '1972-02-05', 'country_name': 'СССР',
+         'main_genre_name': 'Фантастика', 'actors': 'Банионис|Солоницын'},
+        {'title': 'Без даты', 'description': 'x', 'country': 'СССР',
+         'main_genre': 'Драма'},
+        {'title': 'Зеркало', 'description': 'Дом',
+         'release_date': '1975-03-07', 'country': 'СССР',
+         'main_genre': 'Драма'},
+    ]
+
+    def write_feed(self, tmp):
+        path = Path(tmp) / 'feed.jsonl'
+        lines = [json.dumps(row, ensure_ascii=False) for row in self.ROWS]
+        lines.insert(2, '{оборвано')
+        path.write_text('\n'.join(lines) + '\n', 'utf-8')
+        return path
+
+    def test_resume_after_crash_and_idempotent_rerun(self):
+        class Crash(Exception):
+            pass
+
+        def crash(stats, elapsed):
+            raise Crash
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_feed(tmp)
+            rejects = Path(tmp) / 'rejects.jsonl'
+            with self.assertRaises(Crash):
+                catalog_import.run(path, batch_size=2, rejects=rejects,
+                                   progress=crash)
+            self.assertEqual(Movie.objects.count(), 2)
+            self.assertTrue(Path(f'{path}.checkpoint').exists())
+
+            stats = catalog_import.run(path, batch_size=2, rejects=rejects,
+                                       resume=True)
+            self.assertEqual(stats, {'read': 5, 'created': 3, 'updated': 0,
+                                     'rejected': 2})
+            self.assertFalse(Path(f'{path}.checkpoint').exists())
+            self.assertEqual(
+                [json.loads(line)['line']
+                 for line in rejects.read_text('utf-8').splitlines()],
+                [3, 4])
+
+            stats = catalog_import.run(path)
+            self.assertEqual((stats['created'], stats['updated']), (0, 3))
+
+        self.assertEqual(Movie.objects.count(), 3)
+        stalker = Movie.objects.get(title='Сталкер')
+        self.assertEqual(sorted(stalker.genres.values_list('name', flat=True)),
+                         ['Драма', 'Фантастика'])
+        self.assertEqual(stalker.movieactor_set.get().role_name, 'Сталкер')
+        self.assertEqual(Movie.objects.get(title='Солярис').actors.count(), 2)
+
+    def test_title_case_and_rolled_back_dictionaries(self):
+        row = {'title': 'Matrix', 'description': 'x',
+               'release_date': datetime.date(1999, 3, 31),
+               'country': 'США', 'main_genre': 'Боевик'}
+        importer = catalog_import.Importer()
+        self.assertEqual(importer.write([row]), (1, 0))
+        self.assertEqual(importer.write([{**row, 'title': 'MATRIX',
+                                          'description': 'y'}]), (0, 1))
+        self.assertEqual(Movie.objects.get().description, 'y')
+
+        # пачка откатилась — жанр, созданный в ней, словарь забывает
+        cyber = {**row, 'title': 'Hackers', 'main_genre': 'Киберпанк'}
+        with mock.patch.object(Movie.objects, 'bulk_create',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                importer.write([cyber])
+        self.assertFalse(Genre.objects.filter(name='Киберпанк').exists())
+        self.assertEqual(importer.write([cyber]), (1, 0))
+        self.assertEqual(Movie.objects.get(title='Hackers').main_genre.name,
+                         'Киберпанк')
+
+    def test_bad_encoding_rejects_only_its_row(self):
+        good = json.dumps(self.ROWS[0], ensure_ascii=False).encode()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'feed.jsonl'
+            path.write_bytes(b'{"title": "\xff\xfe"}\n' + good + b'\n')
+            rejects = Path(tmp) / 'rejects.jsonl'
+            stats = catalog_import.run(path, rejects=rejects)
+            self.assertEqual((stats['created'], stats['rejected']), (1, 1))
+            self.assertEqual(
+                json.loads(rejects.read_text('utf-8'))['line'], 1)
+
+            # CSV с BOM (так сохраняет Excel) и битой строкой в середине
+            path = Path(tmp) / 'feed.csv'
+            path.write_bytes(
+                '\ufefftitle,description,release_date,country,main_genre\n'
+                .encode() + b'\xff,x,1980-01-01,A,B\n'
+                + 'Зеркало,Дом,1975-03-07,СССР,Драма\n'.encode())
+            stats = catalog_import.run(path, rejects=rejects)
+            self.assertEqual((stats['created'], stats['rejected']), (1, 1))
+        self.assertTrue(Movie.objects.filter(title='Зеркало').exists())
+
+
+class FastMovieListTests(TestCase):
+    def setUp(self):
+        seed_catalog(movies=6, users=3)
+        movie = Movie.objects.first()
+        movie.description = 'строка\u2028дальше "в кавычках"\n'
+        movie.poster = 'posters/a.jpg'
+        movie.trailer = 'trailers/a.mp4'
+        movie.poster_variants = {
+            'source': 'posters/a.jpg',
+            'thumb': {'webp': 'v/t.webp', 'jpg': 'v/t.jpg'},
+            'widths': {'320': {'webp': 'v/320.webp', 'jpg': 'v/320.jpg'}},
+        }
+        movie.save()
+        self.user = User.objects.first()
+        Favorite.objects.create(user=self.user, movie=movie)
+
+    def assert_same_bytes(self, **params):
+        url = reverse('cinema:movie-api-list')
+        with override_settings(API_CACHE_TIMEOUT=0):
+            fast = self.client.get(url, params)
+            with override_settings(API_FAST_LIST=False):
+                slow = self.client.get(url, params)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_matches_serializer_byte_for_byte(self):
+        self.assert_same_bytes()
+        self.assert_same_bytes(ordering='-computed_rating')
+        self.client.force_login(self.user)
+        data = self.assert_same_bytes(search='а').json()
+        self.assertTrue(any(row['is_favorite'] for row in data))
+        with mock.patch('cinema.fast_api.orjson', None):
+            self.assert_same_bytes()
+
+    def test_queries_do_not_depend_on_rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('cinema:movie-api-list'))
+        # фильмы + жанры + актёры
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+
+class ApiResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            data = seed_catalog(movies=40, users=3)
+        self.movie, self.user = data['movie'], data['user']
+        Favorite.objects.get_or_create(user=self.user, movie=self.movie)
+        self.url = reverse('cinema:movie-api-list')
+
+    def test_anonymous_hits_gzip_and_invalidation(self):
+        miss = self.client.get(self.url, {'ordering': 'release_date',
+                                          'search': ''})
+        with self.assertNumQueries(0):
+            hit = self.client.get(self.url, {'ordering': 'release_date'},
+                                  HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual((miss['X-Cache'], hit['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(hit['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(hit.content), miss.content)
+        self.assertIn('Authorization', hit['Vary'])
+        plain = self.client.get(self.url, {'ordering': 'release_date'})
+        self.assertEqual(plain.content, miss.content)
+
+        # save() — через сигнал, модерация — через update() и bump();
+        # каждая запись — своя закоммиченная транзакция
+        self.movie.title = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.save()
+        resp = self.client.get(self.url, {'ordering': 'release_date'})
+        self.assertEqual(resp['X-Cache'], 'MISS')
+        self.assertContains(resp, 'Новое название')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.filter(movie=self.movie).approve()
+        resp = self.client.get(self.url, {'ordering': 'release_date'})
+        self.assertEqual(resp['X-Cache'], 'MISS')
+
+    def test_favorites_never_leak(self):
+        self.client.force_login(self.user)
+        own = self.client.get(self.url).json()
+        self.assertTrue(any(row['is_favorite'] for row in own))
+        self.assertFalse(self.client.get(self.url).has_header('X-Cache'))
+        self.client.logout()
+        anonymous = self.client.get(self.url)
+        self.assertEqual(anonymous['X-Cache'], 'MISS')
+        self.assertFalse(any(row['is_favorite']
+                             for row in anonymous.json()))
+
+    def test_bumps_only_watched_models_after_the_write(self):
+        with mock.patch('cinema.api_cache.bump') as bump:
+            User.objects.create_user('buyer', password='x')
+        bump.assert_not_called()
+
+        Movie.objects.filter(pk=self.movie.pk).update(avg_rating=9)
+        seen = []
+        with mock.patch('cinema.api_cache.bump', side_effect=lambda *m:
+                        seen.append(Movie.objects.get(pk=self.movie.pk)
+                                    .avg_rating)):
+            Movie.objects.refresh_avg_rating([self.movie.pk])
+        self.assertEqual(len(seen), 1)
+        self.assertNotEqual(seen[0], 9)
+
+    def test_bulk_reject_bumps_versions_once_per_transaction(self):
+        def cache_writes(reviews):
+            with mock.patch('cinema.api_cache._set_versions') as writes:
+                with self.captureOnCommitCallbacks(execute=True):
+                    with transaction.atomic():
+                        self.assertGreater(reviews.reject(), 0)
+            return writes.call_count
+
+        movies = list(Movie.objects.order_by('pk')[:6])
+        one = cache_writes(Review.objects.filter(movie=movies[0]))
+        many = cache_writes(Review.objects.filter(movie__in=movies[1:]))
+        # не по паре на каждую строку: сразу, после коммита и рейтинг
+        self.assertEqual(one, many)
+        self.assertLessEqual(many, 3)
+
+    def test_only_lock_holder_rebuilds_expired_entry(self):
+        self.client.get(self.url)
+        key = api_cache.request_key(RequestFactory().get(self.url),
+                                    MovieViewSet.cache_models)
+        cache = caches['default']
+        entry = cache.get(key)
+        cache.set(key, {**entry, 'fresh_until': 0})
+        cache.add(f'{key}:lock', 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'STALE')
+        cache.delete(f'{key}:lock')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+
+@override_settings(AUTH_CACHE_TIMEOUT=60)
+class AuthCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        seed_catalog(movies=3, users=2)
+        self.user = User.objects.create_user('reader', password='x')
+
+    def auth_queries(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            status = client.get(url).status_code
+        return status, [q['sql'] for q in ctx.captured_queries
+                        if '"authtoken_token"' in q['sql']
+                        or '"django_session"' in q['sql']
+                        or 'FROM "cinema_user"' in q['sql']]
+
+    def test_token_is_cached_until_deactivation_or_deletion(self):
+        token = Token.objects.create(user=self.user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        url = reverse('cinema:review-api-list')
+        self.assertEqual(self.auth_queries(client, url)[0], 200)
+        self.assertEqual(self.auth_queries(client, url), (200, []))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get(url).status_code, 401)
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(client.get(url).status_code, 200)
+        token.delete()
+        self.assertEqual(client.get(url).status_code, 401)
+
+    def test_session_user_without_queries(self):
+        url = reverse('cinema:review-api-list')
+        for engine in ('cached_db', 'signed_cookies'):
+            engine = f'django.contrib.sessions.backends.{engine}'
+            with override_settings(SESSION_ENGINE=engine):
+                client = Client()
+                client.force_login(self.user)
+                self.assertEqual(self.auth_queries(client, url)[0], 200)
+                self.assertEqual(self.auth_queries(client, url), (200, []))
+                self.user.set_password('y')
+                self.user.save()
+                # смена пароля разлогинивает, несмотря на кэш
+                self.assertEqual(client.get(url).status_code, 401)
+
+    def test_old_sessions_survive_and_password_is_checked_once(self):
+        client = Client()
+        client.force_login(
+            self.user, backend='django.contrib.auth.backends.ModelBackend')
+        url = reverse('cinema:review-api-list')
+        self.assertEqual(client.get(url).status_code, 200)
+        with mock.patch.object(User, 'check_password',
+                               return_value=False) as check:
+            self.assertFalse(client.login(username='reader', password='?'))
+        self.assertEqual(check.call_count, 1)
+
+    def test_deploy_check_rejects_process_local_cache(self):
+        self.assertEqual([e.id for e in checks.auth_cache_is_shared(None)],
+                         ['cinema.E001'])
+        with override_settings(AUTH_CACHE_TIMEOUT=0):
+            self.assertEqual(checks.auth_cache_is_shared(None), [])
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        throttling.reset_local()
+        self.addCleanup(throttling.reset_local)
+        data = seed_catalog(movies=3, users=2)
+        self.movie, self.user = data['movie'], data['user']
+        self.url = reverse('cinema:movie-api-list')
+
+    @override_settings(API_CACHE_TIMEOUT=0,
+                       THROTTLE_RATES={'catalog': '20/min'})
+    def test_search_costs_more_than_list(self):
+        for _ in range(2):
+            self.assertEqual(
+                self.client.get(self.url, {'search': 'x'}).status_code, 200)
+        resp = self.client.get(self.url, {'search': 'x'})
+        self.assertEqual(resp.status_code, 429)
+        self.assertGreaterEqual(int(resp['Retry-After']), 1)
+        # повторный отказ — из памяти процесса, без кэша и БД
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 429)
+        # у другого пользователя своё ведро
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_bucket_refills_and_denial_is_free(self):
+        rate = throttling.parse_rate('2/s')
+        key = 'throttle:test:bucket'
+        with mock.patch('cinema.throttling.time.time', return_value=1000.0):
+            self.assertEqual(throttling.consume(key, rate, 2), 0.0)
+            self.assertAlmostEqual(throttling.consume(key, rate), 0.5)
+        throttling.reset_local()
+        with mock.patch('cinema.throttling.time.time', return_value=1000.5):
+            self.assertEqual(throttling.consume(key, rate), 0.0)
+            self.assertGreater(throttling.consume(key, rate), 0)
+
+    def test_idle_catch_up_is_applied_once(self):
+        rate = throttling.parse_rate('60/min')
+        key = 'throttle:test:idle'
+        cache = caches['default']
+        cache.set(key, 1_000_000 - 30_000)          # простой 30 с
+        incr = cache.incr
+        nested = []
+
+        def interleaved(*args):
+            value = incr(*args)
+            if not nested:                          # второй запрос — между
+                nested.append(None)
+                nested[0] = throttling.consume(key, rate)
+            return value
+        with mock.patch('cinema.throttling.time.time', return_value=1000.0), \
+                mock.patch.object(cache, 'incr', side_effect=interleaved):
+            self.assertEqual(throttling.consume(key, rate), 0.0)
+            # TAT — не дальше двух запросов вперёд, а не на 30 с
+            self.assertLessEqual(cache.get(key) - 1_000_000, 2000)
+        self.assertEqual(nested, [0.0])
+
+    @override_settings(THROTTLE_RATES={'purchase': '1/min'})
+    def test_html_purchase_is_limited(self):
+        self.client.force_login(self.user)
+        url = reverse('cinema:ticket-buy', args=[self.movie.pk])
+        self.assertNotEqual(self.client.post(url, {}).status_code, 429)
+        resp = self.client.post(url, {})
+        self.assertEqual(resp.status_code, 429)
+        self.assertIn('Retry-After', resp)
+        # GET формы не ограничивается
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class IndexAdvisorTests(TestCase):
+    def test_hot_queries_are_covered_by_indexes(self):
+        findings, statuses = index_advisor.run()
+        self.assertTrue(statuses)
+        self.assertFalse({k: v for k, v in statuses.items() if v >= 400})
+        flagged = {(f.table, view) for f in findings for view in f.views}
+        for table, view in [('cinema_ticket', 'ticket-list'),
+                            ('cinema_favorite', 'favorite-list'),
+                            ('cinema_session', 'ticket-buy'),
+                            ('cinema_review', 'review-moderation'),
+                            ('cinema_review', 'api-movie-reviews')]:
+            self.assertNotIn((table, view), flagged)
+
+    def test_suggestion_for_boolean_filter_is_partial_index(self):
+        sql = ('SELECT "cinema_review"."id" FROM "cinema_review" '
+               'WHERE ("cinema_review"."movie_id" = %s AND '
+               '"cinema_review"."is_approved") '
+               'ORDER BY "cinema_review"."created_at" DESC')
+        self.assertEqual(index_advisor.suggest_index(sql, 'cinema_review'),
+                         (['movie', '-created_at'], {'is_approved': True}))
+
+
+class SargableFilterTests(TestCase):
+    def setUp(self):
+        country = Country.objects.create(name='США')
+        genre = Genre.objects.create(name='Драма')
+        Movie.objects.bulk_create(
+            Movie(title=f'Film {i}', description='lorem',
+                  release_date=datetime.date(1990 + i % 30, 1 + i % 12, 1),
+                  country=country, main_genre=genre,
+                  avg_rating=Decimal(i % 100) / 10)
+            for i in range(200)
+        )
+        with connection.cursor() as cursor:     # статистика для планировщика
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, qs, index):
+        plan = qs.explain()
+        self.assertIn(index, plan)
+        self.assertNotIn('SCAN cinema_movie\n', plan + '\n')
+
+    def test_filters_use_indexes(self):
+        base = Movie.objects.all()
+        by_year = MovieFilter({'release_year': 2001}, queryset=base).qs
+        self.assertTrue(by_year)
+        self.assertTrue(all(m.release_date.year == 2001 for m in by_year))
+        self.assertUsesIndex(by_year, 'movie_release_title_idx')
+
+        by_rating = MovieFilter({'min_rating': 9.5}, queryset=base).qs
+        self.assertEqual(by_rating.count(), 10)
+        # без сортировки каталога: иначе SQLite вправе идти по индексу
+        # сортировки, а проверить нужно, что сам предикат индексируем
+        self.assertUsesIndex(by_rating.order_by(), 'cinema_movie_avg_rating')
+
+    def test_api_shows_the_rating_it_filters_by(self):
+        user = User.objects.create_user('critic', password='x')
+        movie = Movie.objects.get(title='Film 1')
+        Review.objects.create(movie=movie, user=user, rating=2)
+        Review.objects.filter(movie=movie).approve()
+        Review.objects.create(movie=movie, user=user, rating=10)
+        url = reverse('cinema:movie-api-list')
+
+        def ratings(**params):
+            return {row['title']: row['average_rating'] for row in
+                    self.client.get(url, {'page_size': 500,
+                                          **params}).json()}
+        self.assertEqual(ratings(title='Film 1')['Film 1'], 2.0)
+        self.assertNotIn('Film 1', ratings(min_rating=5))
+        # Film 1 теперь 2.0; без оценок (avg_rating = 0) — не попадают
+        low = ratings(max_rating=0.2)
+        self.assertEqual(sorted(low.values()), [0.1, 0.2, 0.2])
+
+    def test_duplicate_title_check_uses_lower_index(self):
+        movie = Movie(title='FILM 3', release_date=datetime.date(1993, 4, 1))
+        with CaptureQueriesContext(connection) as ctx:
+            with self.assertRaisesMessage(Exception, 'уже есть'):
+                movie.clean()
+        sql = ctx.captured_queries[0]['sql']
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('movie_title_lower_idx', plan)
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def test_sqlite_is_default(self):
+        db = database_from_env(Path('/srv'), environ={})
+        self.assertEqual(db['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(db['NAME'], Path('/srv/db.sqlite3'))
+        self.assertEqual(db['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('journal_mode=WAL', db['OPTIONS']['init_command'])
+        plain = database_from_env(Path('/srv'),
+                                  environ={'DB_SQLITE_TUNED': '0'})
+        self.assertNotIn('OPTIONS', plain)
+
+    def test_postgres_profile(self):
+        env = {'DB_ENGINE': 'postgres', 'DB_NAME': 'cinema',
+               'DB_STATEMENT_TIMEOUT': '5000'}
+        db = database_from_env('base', environ=env)
+        self.assertEqual(db['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(db['CONN_MAX_AGE'], 60)
+        self.assertTrue(db['CONN_HEALTH_CHECKS'])
+        self.assertFalse(db['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertEqual(db['OPTIONS'],
+                         {'options': '-c statement_timeout=5000'})
+
+        pooled = database_from_env('base', environ={**env, 'DB_POOL': '1'})
+        self.assertEqual(pooled['CONN_MAX_AGE'], 0)
+        self.assertEqual(pooled['OPTIONS']['pool']['max_size'], 10)
+
+
+@override_settings(REPLICA_DATABASES=['replica'], READ_YOUR_WRITES_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    def route(self, method='get', cookies=None, write=None):
+        router, seen = PrimaryReplicaRouter(), {}
+
+        def view(request):
+            seen['before'] = router.db_for_read(Movie)
+            seen['ticket'] = router.db_for_read(Ticket)
+            if write is not None:
+                self.assertEqual(router.db_for_write(write), 'default')
+            seen['after'] = router.db_for_read(Movie)
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        response = ReadYourWritesMiddleware(view)(request)
+        return seen, response
+
+    def test_catalog_reads_go_to_replica(self):
+        seen, response = self.route()
+        self.assertEqual((seen['before'], seen['ticket']),
+                         ('replica', 'default'))
+        self.assertNotIn('db_pin', response.cookies)
+
+    def test_one_replica_per_request(self):
+        with override_settings(REPLICA_DATABASES=['r1', 'r2', 'r3']):
+            for _ in range(10):
+                router, reads = PrimaryReplicaRouter(), []
+
+                def view(request):
+                    reads.extend(router.db_for_read(model) for model in
+                                 (Movie, Genre, Review, Movie) * 3)
+                    return HttpResponse()
+                ReadYourWritesMiddleware(view)(RequestFactory().get('/'))
+                self.assertEqual(len(set(reads)), 1)
+
+    def test_write_pins_reader_to_primary(self):
+        seen, response = self.route(write=Review)
+        self.assertEqual((seen['before'], seen['after']),
+                         ('replica', 'default'))
+        pin = response.cookies['db_pin']
+        seen, _ = self.route(cookies={'db_pin': pin.value})
+        self.assertEqual(seen['before'], 'default')
+        seen, _ = self.route(cookies={'db_pin': '0'})
+        self.assertEqual(seen['before'], 'replica')
+
+    def test_unsafe_methods_and_background_work_use_primary(self):
+        seen, _ = self.route(method='post')
+        self.assertEqual(seen['before'], 'default')
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Movie), 'default')
+
+    def test_replicas_from_env(self):
+        dbs = replicas_from_env(Path('/srv'), environ={
+            'DB_REPLICAS': 'replica', 'DB_REPLICA_NAME': '/srv/r.sqlite3'})
+        self.assertEqual(dbs['replica']['NAME'], '/srv/r.sqlite3')
+        self.assertEqual(dbs['replica']['TEST'], {'MIRROR': 'default'})
+
+
+class SqliteConcurrencyTests(SimpleTestCase):
+    def test_parallel_writers_do_not_hit_lock_errors(self):
+        stats = run_stress(processes=3, duration=2, mode='tuned', movies=5)
+        self.assertEqual(stats['errors'], 0)
+        self.assertTrue(all(stats['per_second']))
+
+    def test_concurrent_purchases_sell_each_seat_once(self):
+        stats = run_load(processes=2, threads=2, rows=2, seats=5)
+        self.assertEqual(stats['double_sells'], 0)
+        self.assertEqual(stats['unsold'], 0)
+        self.assertEqual(stats['outcomes']['sold'], stats['capacity'])
+        self.assertEqual(stats['outcomes']['error'], 0)
+
+    def test_more_seats_than_purchase_rate_limit(self):
+        # 30/min на покупателя — а мест больше
+        limit = int(settings.THROTTLE_RATES['purchase'].split('/')[0])
+        stats = run_load(processes=1, threads=1, rows=1, seats=limit + 10)
+        self.assertEqual(stats['outcomes']['throttled'], 0)
+        self.assertEqual(stats['outcomes']['error'], 0)
+        self.assertEqual(stats['outcomes']['sold'], stats['capacity'])
+        self.assertEqual(stats['unsold'], 0)
+
+
+class BenchmarkConnectionsTests(TransactionTestCase):
+    def test_pool_is_dropped_for_the_run_and_restored(self):
+        options = connection.settings_dict['OPTIONS']
+        out = io.StringIO()
+        # у SQLite нет пула: оставленный 'pool' сломал бы connect()
+        options['pool'] = True
+        self.addCleanup(options.pop, 'pool', None)
+        with mock.patch.object(connection, 'close_pool',
+                               create=True) as close_pool:
+            call_command('benchmark_connections', requests=2, stdout=out)
+        close_pool.assert_called_once()
+        self.assertIs(options['pool'], True)
+        self.assertIn('выключен', out.getvalue())
+        self.assertIn('повторное', out.getvalue())
+
+
+class InstrumentationTests(TestCase):
+    def test_main_views_fit_budgets_without_n_plus_one(self):
+        data = index_advisor.seed()
+        with override_settings(QUERY_BUDGET_RAISE=True):
+            for label, url, user in index_advisor.scenarios(data):
+                with self.subTest(view=label):
+                    if user is None:
+                        self.client.logout()
+                    else:
+                        self.client.force_login(user)
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_query_budget_catches_n_plus_one(self):
+        data = seed_catalog(users=20)
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (1, 2) AND x = \'a\''),
+            'SELECT * FROM t WHERE id IN (...) AND x = #',
+        )
+        with self.assertRaisesMessage(AssertionError, 'повторы: 1'):
+            with QueryBudget(100):
+                for review in Review.objects.filter(movie=data['movie']):
+                    review.user.username
+        with QueryBudget(1):
+            list(Review.objects.filter(movie=data['movie'])
+                 .select_related('user'))
+
+    def test_metrics_endpoint(self):
+        registry.reset()
+        self.client.get(reverse('cinema:home'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        staff = User.objects.create_user('ops', password='x', is_staff=True)
+        self.client.force_login(staff)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('mafisha_view_requests_total{view="cinema:home"} 1',
+                      body)
+        self.assertIn('mafisha_view_duration_seconds_bucket'
+                      '{view="cinema:home",le="+Inf"} 1', body)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.client.logout()
+            resp = self.client.get('/metrics',
+                                   HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(resp.status_code, 200)
+
+    def test_metrics_are_summed_across_processes(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        staff = User.objects.create_user('ops', password='x', is_staff=True)
+        self.client.force_login(staff)
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(METRICS_DIR=tmp):
+            self.client.get(reverse('cinema:home'))
+            # файл соседнего воркера
+            other = registry.snapshot()
+            Path(tmp, '1.json').write_text(json.dumps(other))
+            body = self.client.get('/metrics').content.decode()
+            self.assertEqual(len(list(Path(tmp).glob('*.json'))), 2)
+        self.assertIn('mafisha_view_requests_total{view="cinema:home"} 2',
+                      body)
+        self.assertIn('mafisha_view_duration_seconds_bucket'
+                      '{view="cinema:home",le="+Inf"} 2', body)
+
+
+class TracingTests(TestCase):
+    def test_api_request_is_traced_into_nested_spans(self):
+        seed_catalog(movies=3, users=2)
+        staff = User.objects.create_user('ops', password='x', is_staff=True)
+        self.client.force_login(staff)
+        tracing.recent.reset()
+        # через MovieSerializer — с его временем по полям
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(TRACE_SAMPLE_RATE=1.0, API_FAST_LIST=False,
+                                  TRACE_FILE=Path(tmp) / 'traces.jsonl'):
+            url = reverse('cinema:movie-api-list')
+            self.assertEqual(self.client.get(url).status_code, 200)
+            lines = (Path(tmp) / 'traces.jsonl').read_text().splitlines()
+            page = self.client.get('/traces')
+
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record['view'], 'cinema:movie-api-list')
+        spans = {child['name']: child for child in record['span']['children']}
+        self.assertLessEqual({'filter_queryset', 'queryset', 'serializer',
+                              'render'}, set(spans))
+        self.assertEqual(spans['render']['kind'], 'renderer')
+        # выборка с prefetch — несколько SQL внутри одного интервала
+        self.assertGreaterEqual(
+            sum(c['kind'] == 'sql' for c in spans['queryset']['children']), 3)
+        self.assertIn('average_rating', spans['serializer']['fields'])
+
+        self.assertEqual(page.status_code, 200)
+        self.assertContains(page, record['path'])
+        # сама страница трасс в буфер не попадает
+        with override_settings(TRACE_FILE=None):
+            self.assertEqual(len(tracing.recent.slowest()), 1)
+
+    def test_page_reads_other_workers_from_bounded_file(self):
+        tracing.recent.reset()
+        staff = User.objects.create_user('ops', password='x', is_staff=True)
+        self.client.force_login(staff)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'traces.jsonl'
+            span = {'name': '/', 'kind': 'request', 'ms': 1.0}
+            with override_settings(TRACE_FILE=path, TRACE_BUFFER_SIZE=3,
+                                   TRACE_FILE_MAX_BYTES=2000):
+                # записи «соседних воркеров»: в памяти этого процесса их нет
+                for i in range(30):
+                    tracing._append(path, {
+                        'id': str(i), 'at': '', 'method': 'GET', 'view': 'x',
+                        'path': f'/worker/{i}/', 'status': 200, 'ms': i,
+                        'span': span})
+                self.assertLessEqual(path.stat().st_size, 2000)
+                self.assertTrue(path.with_name('traces.jsonl.1').exists())
+                self.assertEqual(
+                    [r['path'] for r in tracing.recent.slowest()],
+                    ['/worker/29/', '/worker/28/', '/worker/27/'])
+                page = self.client.get('/traces')
+            self.assertContains(page, '/worker/29/')
+            self.assertContains(page, 'хвоста TRACE_FILE')
+            with override_settings(TRACE_FILE=None):
+                page = self.client.get('/traces')
+            self.assertContains(page, 'только процесса')
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_tiny_dataset_and_benchmarks(self):
+        sizes = datagen.sizes_for(0, users=5, actors=5, movies=8,
+                                  reviews=30, favorites=10, cinemas=1,
+                                  halls=2, sessions=6, tickets=20)
+        datagen.generate(sizes, batch_size=7)
+        rows = datagen.counts()
+        self.assertEqual(rows['фильмы'], 8)
+        self.assertEqual(rows['отзывы'], 30)
+        self.assertEqual(rows['билеты'], 20)
+
+        report = benchmarks.run(warmup=0, repeat=2)
+        self.assertEqual(set(report['results']),
+                         set(benchmarks.Suite.SCENARIOS))
+        for name, result in report['results'].items():
+            if name != 'ticket_pdf':
+                self.assertIn('median_ms', result, name)
+        # покупка откатывается
+        self.assertEqual(Ticket.objects.count(), 20)
+        self.assertEqual(benchmarks.compare(report, report)[0][3], 0.0)
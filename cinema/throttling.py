@@ -0,0 +1,153 @@
+"""
+Ограничение частоты запросов: «ведро токенов» со взвешенной ценой.
+
+У каждой области (scope) — скорость из THROTTLE_RATES, «N/период»:
+ведро на N токенов, которое наполняется со скоростью N за период.
+Запрос стоит throttle_cost токенов (поиск дороже списка и т. п.).
+Ведро своё у каждого пользователя, у анонимов — у IP (как get_ident
+в DRF, с учётом NUM_PROXIES).
+
+Ведро хранится по алгоритму GCRA одним числом в кэше — «теоретическое
+время прихода» (TAT, мс): запрос прибавляет к нему цену × интервал
+атомарным cache.incr(), и если TAT ушёл дальше чем на период вперёд,
+запрос отклоняется (прибавка откатывается), Retry-After — через
+сколько уложится. Отказ дополнительно запоминается в памяти процесса
+до Retry-After — повторные запросы отбрасываются без обращения к кэшу.
+
+После простоя TAT отстал от текущего времени. Догон — не incr (его
+повторил бы каждый из параллельных запросов, и TAT улетел бы на
+несколько простоев вперёд), а cache.set(сейчас + цена) от того, кто
+взял замок cache.add; остальные в этот момент проходят, не списывая.
+Так же безвредно истечение ключа (через два периода без отказов и
+догонов): гонки могут лишь пропустить лишние запросы. Ложный отказ
+возможен только в миг между чужим incr сверх лимита и его откатом.
+
+Состояние общее для воркеров, если общий бэкенд кэша (THROTTLE_CACHE_ALIAS,
+см. CACHES).
+
+DRF: CostThrottle (в DEFAULT_THROTTLE_CLASSES) берёт throttle_scope и
+get_throttle_cost()/throttle_cost у представления; без области или без
+скорости для неё — не ограничивает. HTML: ThrottleMixin.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.throttling import BaseThrottle
+
+PREFIX = 'throttle'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LOCAL_LIMIT = 10_000
+
+_denied = {}                # ключ ведра → отказывать до (time.time())
+
+
+def parse_rate(rate):
+    """'60/min' → (60, 60.0); None → None."""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    return int(count), float(PERIODS[period[0]])
+
+
+def _cache():
+    return caches[settings.THROTTLE_CACHE_ALIAS]
+
+
+def consume(key, rate, cost=1):
+    """Списать cost токенов; 0.0 — можно, иначе через сколько секунд."""
+    now = time.time()
+    until = _denied.get(key)
+    if until is not None:
+        if until > now:
+            return until - now
+        del _denied[key]
+
+    count, period = rate
+    interval = period * 1000 / count            # мс на токен
+    increment = max(1, round(cost * interval))
+    tolerance = period * 1000                   # ёмкость ведра
+    now_ms = int(now * 1000)
+    cache = _cache()
+    try:
+        tat = cache.incr(key, increment)
+    except ValueError:
+        if cache.add(key, now_ms + increment, int(period * 2)):
+            return 0.0
+        tat = cache.incr(key, increment)
+    if tat - increment < now_ms:
+        # ведро простаивало: сбрасывает TAT один, остальные проходят
+        if cache.add(f'{key}:reset', 1, 1):
+            cache.set(key, now_ms + increment, int(period * 2))
+            cache.delete(f'{key}:reset')
+        return 0.0
+    if tat - now_ms <= tolerance:
+        return 0.0
+
+    cache.incr(key, -increment)                 # отказ токенов не тратит
+    cache.touch(key, int(period * 2))
+    wait = (tat - now_ms - tolerance) / 1000
+    if len(_denied) >= LOCAL_LIMIT:
+        _denied.clear()
+    _denied[key] = now + wait
+    return wait
+
+
+def reset_local():
+    _denied.clear()
+
+
+def bucket_key(scope, request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        ident = f'u{user.pk}'
+    else:
+        ident = f'ip{BaseThrottle().get_ident(request)}'
+    return f'{PREFIX}:{scope}:{ident}'
+
+
+def check(scope, request, cost=1):
+    """Секунды до повтора (0.0 — пропустить) для области scope."""
+    rate = parse_rate(settings.THROTTLE_RATES.get(scope))
+    if rate is None or cost <= 0:
+        return 0.0
+    return consume(bucket_key(scope, request), rate, cost)
+
+
+# ─────────── DRF ───────────
+class CostThrottle(BaseThrottle):
+    """Область — self.scope или view.throttle_scope; цена — у представления."""
+    scope = None
+
+    def allow_request(self, request, view):
+        scope = self.scope or getattr(view, 'throttle_scope', None)
+        if scope is None:
+            return True
+        cost = view.get_throttle_cost(request) \
+            if hasattr(view, 'get_throttle_cost') \
+            else getattr(view, 'throttle_cost', 1)
+        self._wait = check(scope, request, cost)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+# ─────────── HTML ───────────
+class ThrottleMixin:
+    """Для CBV: throttle_scope, throttle_cost, throttle_methods."""
+    throttle_scope = None
+    throttle_cost = 1
+    throttle_methods = ('POST',)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.throttle_methods:
+            wait = check(self.throttle_scope, request, self.throttle_cost)
+            if wait:
+                return HttpResponse(
+                    'Слишком много запросов, попробуйте позже.',
+                    status=429, content_type='text/plain; charset=utf-8',
+                    headers={'Retry-After': str(math.ceil(wait))})
+        return super().dispatch(request, *args, **kwargs)
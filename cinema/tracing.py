@@ -0,0 +1,318 @@
+"""
+Трассировка запросов: вложенные интервалы (spans) с таймингами.
+
+TracingMiddleware с вероятностью TRACE_SAMPLE_RATE открывает трассу
+запроса. Внутри неё каждый SQL-запрос — отдельный интервал, а
+DRF-представления с TracedViewMixin дробят обработку на фильтрацию,
+выборку (вместе с prefetch), сериализацию и рендер; TracedSerializerMixin
+добавляет к интервалу сериализации время по каждому полю. Рендер
+шаблона или рендерера DRF засекает QueryInstrumentationMiddleware.
+
+При TRACE_TRACEMALLOC=True у интервалов есть alloc_kb — прирост памяти
+по tracemalloc (на весь процесс, при нескольких потоках — примерно).
+Готовые трассы пишутся строкой JSON в TRACE_FILE (больше
+TRACE_FILE_MAX_BYTES — файл уходит в «.1», прежний «.1» удаляется)
+и держатся в памяти (последние TRACE_BUFFER_SIZE). Страница /traces
+при заданном TRACE_FILE читает последние TRACE_BUFFER_SIZE записей
+из его хвоста (не больше TRACE_TAIL_BYTES) — трассы всех воркеров;
+без файла — только буфер процесса, ответившего на запрос.
+"""
+import collections
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.shortcuts import render
+from django.utils import timezone
+from rest_framework.response import Response
+
+SQL_PREVIEW = 500
+
+
+class Span:
+    __slots__ = ('name', 'kind', 'attrs', 'children', 'started', 'duration',
+                 'alloc_start', 'alloc', 'fields')
+
+    def __init__(self, name, kind, attrs):
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.children = []
+        self.fields = None
+        self.alloc = None
+        self.duration = 0.0
+        self.started = time.perf_counter()
+        self.alloc_start = (tracemalloc.get_traced_memory()[0]
+                            if tracemalloc.is_tracing() else None)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+        if self.alloc_start is not None and tracemalloc.is_tracing():
+            self.alloc = tracemalloc.get_traced_memory()[0] - \
+                self.alloc_start
+
+    def as_dict(self):
+        data = {'name': self.name, 'kind': self.kind,
+                'ms': round(self.duration * 1000, 3)}
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.alloc is not None:
+            data['alloc_kb'] = round(self.alloc / 1024, 1)
+        if self.fields:
+            data['fields'] = {name: round(seconds * 1000, 3)
+                              for name, seconds in self.fields.items()}
+        if self.children:
+            data['children'] = [child.as_dict() for child in self.children]
+        return data
+
+
+class Trace:
+    def __init__(self, name):
+        self.root = Span(name, 'request', {})
+        self.stack = [self.root]
+
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+class span:
+    """with span('имя', kind='code', **атрибуты): … — no-op вне трассы."""
+
+    def __init__(self, name, kind='code', **attrs):
+        self.name, self.kind, self.attrs = name, kind, attrs
+        self.span = None
+
+    def __enter__(self):
+        trace = _current.get()
+        if trace is not None:
+            self.span = Span(self.name, self.kind, self.attrs)
+            trace.stack[-1].children.append(self.span)
+            trace.stack.append(self.span)
+        return self.span
+
+    def __exit__(self, *exc):
+        if self.span is not None:
+            self.span.finish()
+            _current.get().stack.pop()
+        return False
+
+
+def active():
+    return _current.get() is not None
+
+
+def _trace_sql(execute, sql, params, many, context):
+    with span('sql', kind='sql', sql=sql[:SQL_PREVIEW], many=many,
+              db=context['connection'].alias):
+        return execute(sql, params, many, context)
+
+
+# ─────────── хранение ───────────
+class _Recent:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, size=None):
+        self.traces = collections.deque(
+            maxlen=size or settings.TRACE_BUFFER_SIZE)
+
+    def add(self, record):
+        with self._lock:
+            self.traces.append(record)
+            if settings.TRACE_FILE:
+                _append(Path(settings.TRACE_FILE), record)
+
+    def slowest(self, limit=20):
+        if settings.TRACE_FILE:
+            records = _tail(Path(settings.TRACE_FILE))
+        else:
+            with self._lock:
+                records = list(self.traces)
+        return sorted(records, key=lambda r: -r['ms'])[:limit]
+
+
+def _append(path, record):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # одна запись — один write() в режиме O_APPEND: строки воркеров
+    # не перемешиваются
+    with path.open('a', encoding='utf-8') as fh:
+        fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+        size = fh.tell()
+    if size > settings.TRACE_FILE_MAX_BYTES:
+        try:
+            os.replace(path, path.with_name(path.name + '.1'))
+        except FileNotFoundError:      # соседний воркер успел первым
+            pass
+
+
+def _tail(path):
+    """Последние TRACE_BUFFER_SIZE записей из хвоста файла (и «.1»)."""
+    budget = settings.TRACE_TAIL_BYTES
+    lines = []
+    for part in (path, path.with_name(path.name + '.1')):
+        if budget <= 0 or len(lines) >= settings.TRACE_BUFFER_SIZE:
+            break
+        try:
+            with part.open('rb') as fh:
+                size = fh.seek(0, os.SEEK_END)
+                fh.seek(max(0, size - budget))
+                chunk = fh.read()
+        except FileNotFoundError:
+            continue
+        budget -= len(chunk)
+        # первая строка, скорее всего, обрезана — её пропускаем
+        chunk_lines = chunk.splitlines()
+        if len(chunk) < size:
+            chunk_lines = chunk_lines[1:]
+        lines = chunk_lines + lines
+    records = []
+    for line in lines[-settings.TRACE_BUFFER_SIZE:]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:             # строку дописывают прямо сейчас
+            continue
+    return records
+
+
+recent = _Recent()
+
+
+# ─────────── middleware ───────────
+class TracingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if settings.TRACE_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        rate = settings.TRACE_SAMPLE_RATE
+        if not rate or random.random() >= rate or active():
+            return self.get_response(request)
+
+        trace = Trace(request.path)
+        token = _current.set(trace)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(_trace_sql))
+                response = self.get_response(request)
+        finally:
+            trace.root.finish()
+            _current.reset(token)
+
+        from .instrumentation import view_name
+        view = view_name(request)
+        if view not in ('traces', 'metrics'):
+            recent.add({
+                'id': uuid.uuid4().hex,
+                'at': timezone.now().isoformat(timespec='seconds'),
+                'method': request.method,
+                'path': request.get_full_path(),
+                'view': view,
+                'status': response.status_code,
+                'ms': round(trace.root.duration * 1000, 3),
+                'span': trace.root.as_dict(),
+            })
+        return response
+
+
+# ─────────── DRF ───────────
+class TracedViewMixin:
+    """list/retrieve с интервалами: фильтр → выборка → сериализация."""
+
+    def list(self, request, *args, **kwargs):
+        if not active():
+            return super().list(request, *args, **kwargs)
+        with span('filter_queryset', kind='orm'):
+            queryset = self.filter_queryset(self.get_queryset())
+        with span('queryset', kind='orm'):
+            page = self.paginate_queryset(queryset)
+            objects = list(queryset if page is None else page)
+        with span('serializer', kind='serializer',
+                  serializer=self.get_serializer_class().__name__,
+                  objects=len(objects)):
+            data = self.get_serializer(objects, many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not active():
+            return super().retrieve(request, *args, **kwargs)
+        with span('queryset', kind='orm'):
+            instance = self.get_object()
+        with span('serializer', kind='serializer',
+                  serializer=self.get_serializer_class().__name__):
+            data = self.get_serializer(instance).data
+        return Response(data)
+
+
+def _timed(field, method):
+    """Обернуть метод поля: его время — в fields текущего интервала."""
+    original = getattr(field, method)
+
+    def timed(*args):
+        trace = _current.get()
+        if trace is None:
+            return original(*args)
+        started = time.perf_counter()
+        try:
+            return original(*args)
+        finally:
+            owner = trace.stack[-1]
+            if owner.fields is None:
+                owner.fields = collections.Counter()
+            owner.fields[field.field_name] += time.perf_counter() - started
+
+    setattr(field, method, timed)
+
+
+class TracedSerializerMixin:
+    """
+    Суммирует время по полям в текущем интервале (fields, мс).
+    Цикл по полям остаётся у DRF: засекаются get_attribute()
+    и to_representation() самих полей, обёрнутые один раз
+    на экземпляр сериализатора (при many=True — на весь список).
+    """
+
+    def to_representation(self, instance):
+        if _current.get() is not None and \
+                not getattr(self, '_fields_timed', False):
+            for field in self._readable_fields:
+                _timed(field, 'get_attribute')
+                _timed(field, 'to_representation')
+            self._fields_timed = True
+        return super().to_representation(instance)
+
+
+# ─────────── страница для персонала ───────────
+def _rows(span_dict, depth=0):
+    yield depth, span_dict
+    for child in span_dict.get('children', ()):
+        yield from _rows(child, depth + 1)
+
+
+@staff_member_required
+def traces_view(request):
+    """Самые медленные из недавних трасс с деревом интервалов."""
+    traces = [{**record, 'rows': [
+        {'depth': depth, 'indent': depth * 1.5, **node}
+        for depth, node in _rows(record['span'])]}
+        for record in recent.slowest(50)]
+    return render(request, 'cinema/traces.html', {
+        'traces': traces,
+        'sample_rate': settings.TRACE_SAMPLE_RATE,
+        'shared': bool(settings.TRACE_FILE),
+    })
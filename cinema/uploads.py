@@ -0,0 +1,129 @@
+"""
+Докачиваемая загрузка трейлеров по частям.
+
+Клиент создаёт загрузку (имя, размер, sha256), затем шлёт куски
+PATCH-запросами с заголовком Upload-Offset. Тело каждого куска
+пишется на диск блоками, не попадая в память целиком; при обрыве
+клиент узнаёт текущее смещение и продолжает с него. В конце сумма
+сверяется, и файл уходит в хранилище поля Movie.trailer.
+
+Чтение тела, хеширование и копирование в хранилище идут вне
+транзакций: в SQLite с BEGIN IMMEDIATE открытая транзакция держит
+блокировку записи всей базы. Новое смещение или статус фиксируются
+коротким условным UPDATE ... WHERE offset = ожидаемое; проиграл гонку
+— 409, как при неверном смещении. Два параллельных куска с одним
+смещением могут перемешать байты в .part, но принят будет только один,
+а итоговая sha256 такую порчу поймает.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import TrailerUpload
+
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Кусок или загрузка не приняты; status — предлагаемый HTTP-код."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def partial_path(upload) -> Path:
+    return Path(settings.TRAILER_UPLOAD_DIR) / f'{upload.pk}.part'
+
+
+def _claim(upload_id, expected, **changes):
+    """Условный UPDATE: применяет changes, если смещение всё ещё expected."""
+    updated = (TrailerUpload.objects
+               .filter(pk=upload_id, offset=expected,
+                       status=TrailerUpload.Status.UPLOADING)
+               .update(updated_at=timezone.now(), **changes))
+    if not updated:
+        raise UploadError('Загрузку изменил параллельный запрос.',
+                          status=409)
+
+
+def _check(upload, offset):
+    if upload.status != TrailerUpload.Status.UPLOADING:
+        raise UploadError('Загрузка уже завершена.', status=409)
+    if offset != upload.offset:
+        raise UploadError(
+            f'Ожидалось смещение {upload.offset}.', status=409
+        )
+
+
+def append_chunk(upload_id, offset, stream, length):
+    """
+    Дописывает length байт из stream начиная с offset.
+    Возвращает новое смещение.
+    """
+    upload = TrailerUpload.objects.get(pk=upload_id)
+    _check(upload, offset)
+    if upload.offset + length > upload.size:
+        raise UploadError('Кусок выходит за объявленный размер.',
+                          status=413)
+
+    path = partial_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(path, 'r+b' if path.exists() else 'wb') as fh:
+        fh.seek(offset)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            fh.write(block)
+            written += len(block)
+        # оборванный кусок не засчитываем — клиент повторит его целиком
+        if written != length:
+            fh.truncate(offset)
+            raise UploadError('Тело запроса короче Content-Length.')
+        fh.truncate(offset + written)
+
+    _claim(upload_id, offset, offset=offset + written)
+    return offset + written
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete(upload_id):
+    """Сверяет сумму и сохраняет файл в Movie.trailer."""
+    upload = (TrailerUpload.objects.select_related('movie')
+              .get(pk=upload_id))
+    _check(upload, upload.size)
+
+    path = partial_path(upload)
+    if file_sha256(path) != upload.sha256:
+        # испорченные данные не докачать — начинаем заново
+        _claim(upload_id, upload.size, offset=0)
+        os.truncate(path, 0)
+        raise UploadError('Контрольная сумма не совпала, загрузка сброшена.',
+                          status=422)
+
+    movie = upload.movie
+    with open(path, 'rb') as fh:
+        movie.trailer.save(upload.filename, File(fh), save=False)
+    # проигравший гонку ничего не испортит: содержимое то же, значит и
+    # блоб тот же, а ссылки считает только сохранение фильма
+    with transaction.atomic():
+        _claim(upload_id, upload.size,
+               status=TrailerUpload.Status.COMPLETE)
+        movie.save(update_fields=['trailer'])
+    path.unlink(missing_ok=True)
+    upload.refresh_from_db()
+    return upload
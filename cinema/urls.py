@@ -3,11 +3,14 @@ from django.contrib.auth import views as auth_views
 from rest_framework.routers import DefaultRouter
 
 from . import views
-from .api_views import MovieViewSet, ReviewViewSet, register
+from .api_views import (ExportView, MovieViewSet, ReviewViewSet,
+                        SalesReportView, TrailerUploadViewSet, register)
 
 router = DefaultRouter()
 router.register('movies',  MovieViewSet,   basename='movie-api')
 router.register('reviews', ReviewViewSet, basename='review-api')
+router.register('trailer-uploads', TrailerUploadViewSet,
+                basename='trailer-upload-api')
 
 app_name = 'cinema'
 
@@ -27,6 +30,8 @@ urlpatterns = [
          name='movie-update'),
     path('movies/<int:pk>/delete/', views.MovieDeleteView.as_view(),
          name='movie-delete'),
+    path('movies/<int:pk>/trailer/', views.movie_trailer,
+         name='movie-trailer'),
 
     # ── билеты ──
     path('movies/<int:pk>/buy/', views.TicketPurchaseView.as_view(),
@@ -46,6 +51,8 @@ urlpatterns = [
          name='review-moderation'),
     path('moderation/reviews/<int:pk>/approve/',
          views.ReviewApproveView.as_view(), name='review-approve'),
+    path('moderation/reviews/bulk/',
+         views.ReviewBulkModerateView.as_view(), name='review-bulk'),
     path('reviews/<int:pk>/delete/', views.ReviewDeleteView.as_view(),
          name='review-delete'),
 
@@ -68,4 +75,8 @@ urlpatterns = [
     # ── REST-API ──
     path('api/', include(router.urls)),
     path('api/auth/register/', register, name='api-register'),
+    path('api/analytics/sales/', SalesReportView.as_view(),
+         name='api-sales-report'),
+    path('api/export/<slug:kind>.<slug:fmt>', ExportView.as_view(),
+         name='api-export'),
 ]
@@ -1,19 +1,19 @@
+import datetime
+from urllib.parse import urlencode
+
 from django.contrib.auth import login, logout, views as auth_views
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.admin.views.decorators import staff_member_required
-from django.contrib.staticfiles import finders
 from django.shortcuts import redirect, get_object_or_404
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django.views import View
 from django.views.generic import (
     ListView, DetailView, CreateView, UpdateView, DeleteView,
     FormView, TemplateView                  # ← TemplateView для Home
 )
-from django.http import HttpResponse
-from django.template.loader import render_to_string
-from django.db.models import Count
-import weasyprint
+from django.http import FileResponse, HttpResponse, Http404
+from django.db.models import Count, Q
 
 from .models import (
     Movie, Favorite, Review, Ticket, Seat,
@@ -24,10 +24,13 @@ from .forms import (
     ReviewForm, ProfileUpdateForm, TicketPurchaseForm
 )
 from .filters import MovieFilter
+from . import pdf, streaming
+from .throttling import ThrottleMixin
 
 
 # ─────────── ГЛАВНАЯ СТРАНИЦА ───────────
 class HomeView(TemplateView):
+    query_budget = 5        # SQL-запросов, см. cinema.instrumentation
     template_name = 'cinema/home.html'
 
     def get_context_data(self, **kwargs):
@@ -56,7 +59,8 @@ class HomeView(TemplateView):
 
 
 # ─────────── учётные записи ───────────
-class SignUpView(CreateView):
+class SignUpView(ThrottleMixin, CreateView):
+    throttle_scope = 'register'
     template_name = 'registration/register.html'
     form_class = SignUpForm
     success_url = reverse_lazy('cinema:movie-list')
@@ -89,6 +93,7 @@ class ProfileView(LoginRequiredMixin, UpdateView):
 
 # ─────────── рекомендации ───────────
 class RecommendationListView(LoginRequiredMixin, ListView):
+    query_budget = 5
     template_name = 'cinema/recommendations.html'
     context_object_name = 'movies'
 
@@ -104,6 +109,7 @@ class RecommendationListView(LoginRequiredMixin, ListView):
 
 # ─────────── каталог ───────────
 class MovieListView(ListView):
+    query_budget = 10
     model = Movie
     paginate_by = 10
     template_name = 'cinema/movie_list.html'
@@ -123,13 +129,14 @@ class MovieListView(ListView):
 
 # ─────────── страница фильма ───────────
 class MovieDetailView(DetailView):
+    query_budget = 8
     model = Movie
     template_name = 'cinema/movie_detail.html'
 
     def get_queryset(self):
         return (Movie.objects.with_computed_rating()
                 .select_related('country')
-                .prefetch_related('genres', 'actors', 'reviews__user'))
+                .prefetch_related('genres'))
 
     def post(self, request, *args, **kwargs):
         self.object = self.get_object()
@@ -147,7 +154,8 @@ class MovieDetailView(DetailView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx['form'] = ReviewForm()
-        ctx['reviews'] = self.object.reviews.filter(is_approved=True)
+        ctx['reviews'] = (self.object.reviews.filter(is_approved=True)
+                          .select_related('user'))
         if self.request.user.is_authenticated:
             ctx['is_favorite'] = Favorite.objects.filter(
                 user=self.request.user, movie=self.object
@@ -155,8 +163,21 @@ class MovieDetailView(DetailView):
         return ctx
 
 
+def movie_trailer(request, pk):
+    """Файл трейлера с поддержкой Range — перемотка без полной загрузки."""
+    movie = get_object_or_404(Movie.objects.only('id', 'trailer'), pk=pk)
+    if not movie.trailer:
+        raise Http404('У фильма нет файла трейлера.')
+    return streaming.ranged_file_response(request, movie.trailer)
+
+
 # ─────────── покупка билета ───────────
-class TicketPurchaseView(LoginRequiredMixin, FormView):
+class TicketPurchaseView(ThrottleMixin, LoginRequiredMixin, FormView):
+    # 7 на саму покупку (фильм, сессия, пользователь, сеанс, два запроса
+    # мест в форме, INSERT) и 6 на пересчёт витрины продаж по on_commit
+    # (BEGIN/COMMIT, блокировка сеансов дня, агрегат, сеанс, upsert)
+    query_budget = 13
+    throttle_scope = 'purchase'
     template_name = 'cinema/ticket_buy.html'
     form_class = TicketPurchaseForm
 
@@ -170,11 +191,8 @@ class TicketPurchaseView(LoginRequiredMixin, FormView):
         return kwargs
 
     def form_valid(self, form):
-        session = form.cleaned_data['session']
-        if session.hall.seats.exists():
-            taken = session.tickets.values_list('seat_id', flat=True)
-            seat = session.hall.seats.exclude(id__in=taken).first()
-        else:
+        session, seat = form.cleaned_data['session'], form.cleaned_data['seat']
+        if seat is None:                        # зал без схемы мест
             seat, _ = Seat.objects.get_or_create(
                 hall=session.hall, row_num=1, seat_num=1
             )
@@ -190,13 +208,15 @@ class TicketPurchaseView(LoginRequiredMixin, FormView):
 
 # ─────────── список билетов ───────────
 class TicketListView(LoginRequiredMixin, ListView):
+    query_budget = 5
     template_name = 'cinema/ticket_list.html'
     context_object_name = 'tickets'
 
     def get_queryset(self):
         return (Ticket.objects
                 .filter(user=self.request.user)
-                .select_related('session__movie', 'session__hall__cinema')
+                .select_related('session__movie', 'session__hall__cinema',
+                                'seat')
                 .order_by('-purchased_at'))
 
 
@@ -211,6 +231,7 @@ class FavoriteToggleView(LoginRequiredMixin, View):
 
 
 class FavoriteListView(LoginRequiredMixin, ListView):
+    query_budget = 5
     template_name = 'cinema/favorite_list.html'
     context_object_name = 'favorites'
 
@@ -227,26 +248,66 @@ class StaffRequiredMixin(UserPassesTestMixin):
 
 
 class ReviewModerationListView(StaffRequiredMixin, ListView):
+    """
+    Очередь на модерацию с keyset-пагинацией по (created_at, id):
+    ?after=<курсор> продолжает с последнего показанного отзыва, без OFFSET.
+    """
     template_name = 'cinema/review_moderation.html'
     context_object_name = 'reviews'
-    queryset = (Review.objects.filter(is_approved=False)
-                .select_related('movie', 'user')
-                .order_by('-created_at'))
+    page_size = 50
+    query_budget = 5
+
+    def get_queryset(self):
+        qs = (Review.objects.filter(is_approved=False)
+              .select_related('movie', 'user')
+              .order_by('-created_at', '-id'))
+        cursor = self.request.GET.get('after')
+        if cursor:
+            try:
+                stamp, pk = cursor.rsplit('_', 1)
+                created_at = datetime.datetime.fromisoformat(stamp)
+                pk = int(pk)
+            except ValueError:
+                raise Http404('Некорректный курсор.')
+            qs = qs.filter(Q(created_at__lt=created_at) |
+                           Q(created_at=created_at, id__lt=pk))
+        return qs[:self.page_size + 1]
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        reviews = list(ctx['reviews'])
+        ctx['reviews'] = reviews[:self.page_size]
+        if len(reviews) > self.page_size:
+            last = reviews[self.page_size - 1]
+            ctx['next_cursor'] = f'{last.created_at.isoformat()}_{last.pk}'
+        return ctx
 
 
 class ReviewApproveView(StaffRequiredMixin, View):
     def post(self, request, pk):
-        review = get_object_or_404(Review, pk=pk, is_approved=False)
-        review.is_approved = True
-        review.save()
+        get_object_or_404(Review, pk=pk, is_approved=False)
+        Review.objects.filter(pk=pk).approve()
         return redirect('cinema:review-moderation')
 
 
+class ReviewBulkModerateView(StaffRequiredMixin, View):
+    """POST ids=…&ids=…&action=approve|reject — одним запросом к БД."""
+    def post(self, request):
+        ids = [int(i) for i in request.POST.getlist('ids') if i.isdigit()]
+        action = request.POST.get('action')
+        if ids and action in ('approve', 'reject'):
+            getattr(Review.objects.filter(id__in=ids), action)()
+        url = reverse('cinema:review-moderation')
+        if request.POST.get('after'):
+            url += '?' + urlencode({'after': request.POST['after']})
+        return redirect(url)
+
+
 class ReviewDeleteView(StaffRequiredMixin, View):
     def post(self, request, pk):
         review = get_object_or_404(Review, pk=pk)
         movie_url = review.movie.get_absolute_url()
-        review.delete()
+        Review.objects.filter(pk=pk).reject()
         return redirect(movie_url)
 
 
@@ -288,14 +349,24 @@ class MovieDeleteView(StaffRequiredMixin, DeleteView):
 # ─────────── PDF-квитанция ───────────
 @staff_member_required
 def admin_ticket_pdf(request, ticket_id):
-    ticket = get_object_or_404(Ticket, id=ticket_id)
-    html = render_to_string('cinema/ticket/pdf.html', {'ticket': ticket})
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'filename=ticket_{ticket.id}.pdf'
-
-    css_file = finders.find('css/pdf.css')
-    stylesheets = [weasyprint.CSS(css_file)] if css_file else []
-
-    weasyprint.HTML(string=html).write_pdf(response, stylesheets=stylesheets)
-    return response
+    ticket = get_object_or_404(
+        Ticket.objects.select_related('user', 'seat', 'session__movie',
+                                      'session__hall__cinema'),
+        id=ticket_id,
+    )
+    try:
+        path = pdf.ticket_pdf(ticket)
+    except pdf.RenderFailed:
+        # без meta-refresh: бесконечно ждать упавший рендер незачем
+        return HttpResponse('Не удалось подготовить PDF билета, '
+                            'попробуйте позже.', status=500)
+    if path is None:                    # рендер ещё идёт в фоне
+        response = HttpResponse(
+            '<meta http-equiv="refresh" content="2">'
+            'PDF готовится, страница обновится автоматически…',
+            status=202,
+        )
+        response['Retry-After'] = '2'
+        return response
+    return FileResponse(open(path, 'rb'), content_type='application/pdf',
+                        filename=f'ticket_{ticket.id}.pdf')
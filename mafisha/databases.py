@@ -0,0 +1,131 @@
+"""
+Настройки БД из переменных окружения.
+
+DB_ENGINE=sqlite (по умолчанию) — файл db.sqlite3 рядом с проектом
+(или DB_NAME). Для конкурентной записи включены WAL, synchronous=NORMAL,
+mmap и BEGIN IMMEDIATE; DB_SQLITE_TUNED=0 возвращает настройки SQLite
+по умолчанию (например, если файл лежит на сетевом диске, где WAL
+не работает):
+
+    DB_SQLITE_TIMEOUT             ожидание блокировки, сек (20)
+    DB_SQLITE_MMAP_SIZE           байт (128 МиБ)
+    DB_SQLITE_CACHE_SIZE          КиБ страничного кэша на соединение (20000)
+
+DB_ENGINE=postgres — профиль для продакшена:
+
+    DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+    DB_CONN_MAX_AGE               постоянные соединения, сек (60)
+    DB_POOL=1                     пул psycopg 3 вместо постоянных соединений
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT
+    DB_STATEMENT_TIMEOUT          мс, 0 — без ограничения (30000)
+    DB_DISABLE_SERVER_SIDE_CURSORS=1   для pgbouncer в transaction-режиме
+
+Реплики для чтения каталога (см. cinema/db_routers.py):
+
+    DB_REPLICAS=replica1,replica2
+    DB_REPLICA1_NAME, DB_REPLICA1_HOST, …   те же ключи с префиксом
+                                            DB_<ИМЯ>; движок — как у DB_ENGINE
+"""
+import os
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+
+
+def env_bool(environ, name, default=False):
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in TRUE_VALUES
+
+
+def env_int(environ, name, default):
+    value = environ.get(name)
+    return default if value in (None, '') else int(value)
+
+
+def sqlite_database(environ, base_dir, prefix='DB'):
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': environ.get(f'{prefix}_NAME') or base_dir / 'db.sqlite3',
+    }
+    if env_bool(environ, f'{prefix}_SQLITE_TUNED', default=True):
+        mmap_size = env_int(environ, f'{prefix}_SQLITE_MMAP_SIZE', 128 << 20)
+        cache_kib = env_int(environ, f'{prefix}_SQLITE_CACHE_SIZE', 20000)
+        database['OPTIONS'] = {
+            # читатели не ждут писателя; fsync только на контрольных точках
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA mmap_size={mmap_size};'
+                f'PRAGMA cache_size=-{cache_kib};'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            # блокировка записи берётся в начале транзакции: без попытки
+            # «повысить» чтение до записи, которая сразу даёт SQLITE_BUSY
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': env_int(environ, f'{prefix}_SQLITE_TIMEOUT', 20),
+        }
+    return database
+
+
+def postgres_database(environ, prefix='DB'):
+    def get(name, default=''):
+        return environ.get(f'{prefix}_{name}', default)
+
+    timeout = env_int(environ, f'{prefix}_STATEMENT_TIMEOUT', 30000)
+    options = {}
+    if timeout:
+        options['options'] = f'-c statement_timeout={timeout}'
+    if env_bool(environ, f'{prefix}_POOL'):
+        # пул Django 5.1 (psycopg 3); с CONN_MAX_AGE несовместим
+        options['pool'] = {
+            'min_size': env_int(environ, f'{prefix}_POOL_MIN_SIZE', 2),
+            'max_size': env_int(environ, f'{prefix}_POOL_MAX_SIZE', 10),
+            'timeout': env_int(environ, f'{prefix}_POOL_TIMEOUT', 10),
+        }
+        conn_max_age = 0
+    else:
+        conn_max_age = env_int(environ, f'{prefix}_CONN_MAX_AGE', 60)
+
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': get('NAME', 'mafisha'),
+        'USER': get('USER', 'mafisha'),
+        'PASSWORD': get('PASSWORD'),
+        'HOST': get('HOST', 'localhost'),
+        'PORT': get('PORT', '5432'),
+        'CONN_MAX_AGE': conn_max_age,
+        # соединение проверяется перед первым запросом каждого HTTP-запроса
+        'CONN_HEALTH_CHECKS': conn_max_age != 0,
+        # .iterator() в выгрузках идёт серверным курсором, если не выключено
+        'DISABLE_SERVER_SIDE_CURSORS': env_bool(
+            environ, f'{prefix}_DISABLE_SERVER_SIDE_CURSORS'),
+        'OPTIONS': options,
+    }
+
+
+def database_from_env(base_dir, environ=None, prefix='DB'):
+    environ = os.environ if environ is None else environ
+    engine = environ.get(f'{prefix}_ENGINE', 'sqlite').lower()
+    if engine in ('postgres', 'postgresql'):
+        return postgres_database(environ, prefix)
+    if engine == 'sqlite':
+        return sqlite_database(environ, base_dir, prefix)
+    raise ValueError(f'{prefix}_ENGINE: неизвестный движок {engine!r}')
+
+
+def replicas_from_env(base_dir, environ=None):
+    """{алиас: настройки} для перечисленных в DB_REPLICAS реплик."""
+    environ = os.environ if environ is None else environ
+    aliases = [a.strip() for a in environ.get('DB_REPLICAS', '').split(',')
+               if a.strip()]
+    result = {}
+    for alias in aliases:
+        prefix = f'DB_{alias.upper()}'
+        env = dict(environ)
+        env.setdefault(f'{prefix}_ENGINE', environ.get('DB_ENGINE', 'sqlite'))
+        database = database_from_env(base_dir, env, prefix)
+        # в тестах реплика — та же БД, что и основная
+        database['TEST'] = {'MIRROR': 'default'}
+        result[alias] = database
+    return result
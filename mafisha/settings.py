@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .databases import database_from_env, replicas_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -50,12 +53,17 @@ AUTH_USER_MODEL = 'cinema.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        # токен → пользователь из кэша (cinema.auth_cache)
+        'cinema.auth_cache.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # области и цены — cinema.throttling, скорости — THROTTLE_RATES
+    'DEFAULT_THROTTLE_CLASSES': [
+        'cinema.throttling.CostThrottle',
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.OrderingFilter',
@@ -64,7 +72,12 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    # снаружи всего: трасса покрывает и счётчики ниже
+    'cinema.tracing.TracingMiddleware',
+    # его process_template_response срабатывает последним
+    'cinema.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'cinema.db_routers.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,15 +109,76 @@ WSGI_APPLICATION = 'mafisha.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DB_ENGINE=postgres включает продакшен-профиль, см. mafisha/databases.py
 DATABASES = {
+    'default': database_from_env(BASE_DIR),
+    **replicas_from_env(BASE_DIR),
+}
+
+# чтение каталога с реплик (cinema.db_routers), если они заданы
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+READ_YOUR_WRITES_SECONDS = 5
+DATABASE_ROUTERS = (['cinema.db_routers.PrimaryReplicaRouter']
+                    if REPLICA_DATABASES else [])
+
+# по умолчанию — в памяти процесса; для нескольких воркеров нужен общий
+# (CACHE_BACKEND=django.core.cache.backends.redis.RedisCache и т. п.)
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'mafisha'),
+    },
 }
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache')
+
+# счётчики SQL по представлениям и /metrics (cinema.instrumentation)
+N_PLUS_ONE_THRESHOLD = 5            # столько одинаковых запросов — уже N+1
+QUERY_BUDGET_RAISE = False          # True — исключение вместо записи в лог
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# общий для воркеров каталог сумм; без него /metrics — один процесс
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 1.0        # с, как часто процесс пишет свой файл
+
+# трассировка запросов (cinema.tracing), страница /traces
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0))
+TRACE_TRACEMALLOC = os.environ.get('TRACE_TRACEMALLOC') == '1'
+TRACE_FILE = BASE_DIR / 'cache' / 'traces.jsonl'  # None — только память
+TRACE_FILE_MAX_BYTES = 50 * 1024 * 1024  # дальше — ротация в traces.jsonl.1
+TRACE_TAIL_BYTES = 4 * 1024 * 1024       # столько хвоста читает /traces
+TRACE_BUFFER_SIZE = 200
 
 BANNED_WORDS = {'спойлер', 'ругательство', 'badword'}
 
+# фоновые задачи (cinema.tasks) и кэш PDF-квитанций
+BACKGROUND_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+TICKET_PDF_CACHE_DIR = BASE_DIR / 'cache' / 'ticket_pdf'
+PDF_EXPORT_WORKERS = None           # None — по числу ядер
+PDF_ADMIN_EXPORT_LIMIT = 200        # больше — через export_ticket_pdfs
+
+# докачиваемая загрузка трейлеров (cinema.uploads)
+TRAILER_UPLOAD_DIR = BASE_DIR / 'cache' / 'uploads'
+TRAILER_MAX_SIZE = 4 * 1024 ** 3
+
+# пакетная запись каталога (cinema.bulk, POST/PATCH /api/movies/bulk/)
+MOVIE_BULK_CHUNK_SIZE = 500          # фильмов на транзакцию
+MOVIE_BULK_MAX_ITEMS = 5000          # фильмов на запрос
+
+# потоковые выгрузки (cinema.exports, /api/export/…, export_data)
+EXPORT_CHUNK_SIZE = 2000
+
+# список /api/movies/ без MovieSerializer (cinema.fast_api)
+API_FAST_LIST = True
+
+# кэш анонимных ответов API (cinema.api_cache)
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 60               # с; 0 — выключен
+API_CACHE_GZIP_MIN = 1024            # байт; тело меньше хранится как есть
+API_CACHE_LOCK_TIMEOUT = 30          # с; замок пересборки
+API_CACHE_LOCK_WAIT = 2.0            # с; ждать чужую пересборку без копии
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -143,12 +217,41 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
-# Default primary key field type
-# https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
+
+# пользователь сессии — из кэша (cinema.auth_cache); ModelBackend — для
+# сессий, открытых до его появления (в сессии записан путь бэкенда)
+AUTHENTICATION_BACKENDS = [
+    'cinema.auth_cache.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# cached_db или signed_cookies — без чтения django_session на запрос;
+# cached_db с несколькими воркерами — только с общим CACHE_BACKEND
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE',
+                                'django.contrib.sessions.backends.db')
+AUTH_CACHE_ALIAS = 'default'
+# с; 0 — выключен. С кэшем в памяти процесса удалённый токен или
+# отключённый пользователь жили бы в чужих воркерах до истечения,
+# поэтому по умолчанию кэш включается только с общим CACHE_BACKEND
+AUTH_CACHE_TIMEOUT = int(os.environ.get(
+    'AUTH_CACHE_TIMEOUT',
+    0 if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES else 60))
+
+# ограничение частоты (cinema.throttling): «токенов/период» на
+# пользователя или IP; цена запроса — у представления (поиск — 10)
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_RATES = {
+    'catalog': '600/min',            # /api/movies/ и его действия
+    'register': '10/hour',           # регистрация, HTML и API
+    'purchase': '30/min',            # POST покупки билета
+    'export': '60/hour',             # /api/export/, с учётом докачек
+}
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'cinema:movie-list'
 LOGOUT_REDIRECT_URL = 'cinema:movie-list'
 
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
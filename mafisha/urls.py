@@ -3,8 +3,13 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from cinema.instrumentation import metrics_view
+from cinema.tracing import traces_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('traces', traces_view, name='traces'),
     path('', include('cinema.urls')),
 ]
 